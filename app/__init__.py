@@ -1,18 +1,25 @@
 # app/__init__.py
 import os
 import logging
-from logging.handlers import RotatingFileHandler
 from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-from .routes import auth, facefeature, project, unique_faces, health, gridfs
 from .extension import jwt, limiter, init_db
+from .cli import register_commands
+from .utils.storage_gc import start_periodic_gc
+from .utils.db_audit import start_startup_audit
+from .utils.logging_config import configure_logging
+from .utils.warmup import start_warmup
+from .utils.similarity import start_calibration
 
 # Load environment variables from .env file
 load_dotenv()
 
 def create_app():
+    # Imported here so that importing app.utils (e.g. from benchmarks) does not load the model
+    from .routes import auth, facefeature, project, unique_faces, health, gridfs, jobs, uploads
+
     app = Flask(__name__)
     env = os.getenv('FLASK_ENV', 'development')
     
@@ -24,24 +31,10 @@ def create_app():
     else:
         app.config.from_object('config.DevelopmentConfig')
     
-    # Configure Logging
+    # Configure Logging (queued; a background thread writes the file or console)
+    configure_logging(app)
     if not app.debug and not app.testing:
-        # Create logs directory if it doesn't exist
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        
-        # Setup Rotating File Handler
-        file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240, backupCount=10)
-        formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-        file_handler.setFormatter(formatter)
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        
-        app.logger.setLevel(logging.INFO)
         app.logger.info('Application startup')
-    else:
-        # In development, log DEBUG messages to console
-        logging.basicConfig(level=logging.DEBUG)
 
     # **Suppress Pymongo Debug Logs**
     pymongo_logger = logging.getLogger('pymongo')
@@ -72,6 +65,16 @@ def create_app():
     app.register_blueprint(unique_faces.bp)
     app.register_blueprint(health.bp)
     app.register_blueprint(gridfs.bp)  # Register GridFS blueprint
+    app.register_blueprint(jobs.bp)
+    app.register_blueprint(uploads.bp)
+
+    # CLI commands and background maintenance
+    register_commands(app)
+    start_calibration(app)
+    if 'mongo_db' in app.extensions:
+        start_periodic_gc(app)
+        start_startup_audit(app)
+        start_warmup(app)
     
     # Enable CORS
     CORS(app,
@@ -0,0 +1,69 @@
+# app/cli.py
+
+import json
+import click
+from flask import current_app
+
+from app.utils.storage_gc import collect_garbage
+from app.utils.db_audit import audit_queries, ensure_indexes
+from app.utils.similarity import benchmark
+from app.utils.blob_store import storage_report
+
+def register_commands(app):
+    """
+    Registers the application's Flask CLI commands.
+    """
+    app.cli.add_command(gc_command)
+    app.cli.add_command(db_audit_command)
+    app.cli.add_command(similarity_bench_command)
+    app.cli.add_command(storage_report_command)
+
+@click.command('gc')
+@click.option('--dry-run/--delete', default=True,
+              help='Only report reclaimable storage (default) or actually delete it.')
+@click.option('--batch-size', default=500, show_default=True, help='GridFS files examined per batch.')
+@click.option('--pause', default=0.1, show_default=True, help='Seconds to sleep between delete batches.')
+def gc_command(dry_run, batch_size, pause):
+    """
+    Finds (and optionally removes) GridFS files and faces no project references.
+    """
+    summary = collect_garbage(
+        mongo_db=current_app.extensions['mongo_db'],
+        dry_run=dry_run,
+        batch_size=batch_size,
+        pause_seconds=pause
+    )
+    click.echo(json.dumps(summary, indent=2))
+
+@click.command('db-audit')
+@click.option('--ensure-indexes/--no-ensure-indexes', 'create_indexes', default=False,
+              help='Create missing declared indexes before auditing.')
+@click.option('--drop-unmanaged', is_flag=True, help='Drop indexes that no model declares.')
+@click.option('--report', 'report_path', default=None, help='Write the JSON report to this path.')
+@click.option('--strict', is_flag=True, help='Exit with status 1 if any query scans or sorts in memory.')
+def db_audit_command(create_indexes, drop_unmanaged, report_path, strict):
+    """
+    Explains the application's query shapes and reports COLLSCAN and in-memory SORT stages.
+    """
+    if create_indexes or drop_unmanaged:
+        ensure_indexes(drop_unmanaged=drop_unmanaged)
+    report = audit_queries(report_path or current_app.config.get('DB_AUDIT_REPORT_PATH'))
+    click.echo(json.dumps({'indexes': report['indexes'], 'problems': report['problems']}, indent=2))
+    if strict and report['problems']:
+        raise SystemExit(1)
+
+@click.command('similarity-bench')
+@click.option('--rows', default=20000, show_default=True, help='Rows in the benchmark matrix.')
+@click.option('--dims', default=512, show_default=True, help='Embedding dimensions.')
+def similarity_bench_command(rows, dims):
+    """
+    Benchmarks every available similarity kernel on this host.
+    """
+    click.echo(json.dumps(benchmark(rows=rows, dims=dims), indent=2))
+
+@click.command('storage-report')
+def storage_report_command():
+    """
+    Reports the storage and face extractions saved by sharing identical images.
+    """
+    click.echo(json.dumps(storage_report(), indent=2))
@@ -20,8 +20,22 @@ def init_db(app):
     Initialize MongoDB connection and GridFS.
     """
     try:
-        # Connect to MongoDB using MongoEngine
-        connection.connect(host=app.config.get('MONGODB_URI'))
+        # Connect to MongoDB using MongoEngine; request threads and the background
+        # pools share one client, so its pool is sized from config
+        pool_options = {
+            'maxPoolSize': app.config.get('MONGODB_MAX_POOL_SIZE'),
+            'minPoolSize': app.config.get('MONGODB_MIN_POOL_SIZE'),
+            'maxIdleTimeMS': app.config.get('MONGODB_MAX_IDLE_TIME_MS'),
+            'waitQueueTimeoutMS': app.config.get('MONGODB_WAIT_QUEUE_TIMEOUT_MS')
+        }
+        options = {key: value for key, value in pool_options.items() if value is not None}
+        if app.config.get('MONGODB_MOCK'):
+            # In-memory stand-in for load tests and local runs; optional dependency
+            import mongomock
+            from mongomock.gridfs import enable_gridfs_integration
+            enable_gridfs_integration()
+            options = {'mongo_client_class': mongomock.MongoClient}
+        connection.connect(host=app.config.get('MONGODB_URI'), **options)
         app.logger.info("Connected to MongoDB successfully.")
     except Exception as e:
         app.logger.error(f"Failed to connect to MongoDB: {e}")
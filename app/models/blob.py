@@ -0,0 +1,26 @@
+# app/models/blob.py
+
+from mongoengine import Document, StringField, IntField, DateTimeField
+from datetime import datetime, timezone
+
+class Blob(Document):
+    """
+    A GridFS image stored once per distinct content and shared by every
+    project that uploads the same bytes.
+    """
+    sha256 = StringField(primary_key=True)
+    gridfs_id = StringField(required=True)
+    size = IntField(default=0)
+    refcount = IntField(default=0)  # Project images currently using the blob
+    uploads = IntField(default=0)  # Times the content was uploaded, including the first
+    records = StringField()  # Serialized face records of the last extraction
+    extractor = StringField()  # Signature of the settings the records were extracted with
+    reuses = IntField(default=0)  # Extractions skipped thanks to the cached records
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+
+    meta = {
+        'collection': 'blobs',
+        'indexes': [
+            'gridfs_id'  # Garbage collection of deleted GridFS files
+        ]
+    }
@@ -1,6 +1,6 @@
 # app/models/face.py
 
-from mongoengine import Document, StringField, ReferenceField
+from mongoengine import Document, StringField, ReferenceField, BooleanField, FloatField, ListField
 from bson import ObjectId
 import json
 import numpy as np
@@ -14,12 +14,24 @@ class Face(Document):
     gridfs_id = StringField(required=True)
     cluster_label = StringField()  # Changed from IntField to StringField
     encoding = StringField()  # Store serialized facial embeddings
-    
+    label_locked = BooleanField(default=False)  # Set when the label was assigned manually
+    bbox = ListField(FloatField())  # [x1, y1, x2, y2] of the face within the image
+    det_score = FloatField()
+    quality = FloatField()  # Combined quality score in [0, 1], used to pick cluster representatives
+    searchable = BooleanField(default=True)  # False for faces kept below the quality threshold
+    source_hash = StringField()  # Hash of the video a frame was sampled from
+    frame_ts = FloatField()  # Position of the frame in that video, in seconds
+    delete_claim = StringField()  # ID of the cascade delete run that claimed the face
+
     meta = {
         'collection': 'faces',
         'indexes': [
-            'hash',
-            'project'
+            'gridfs_id',  # Image ownership checks and blob garbage collection
+            ('project', 'hash'),  # Duplicate detection on upload
+            ('project', 'gridfs_id'),  # Filling an image's placeholder face
+            ('project', 'cluster_label', '-quality'),  # Unique faces, best representative first
+            ('project', 'id'),  # Keyset pagination of a project's faces
+            {'fields': ['project', 'source_hash'], 'sparse': True}
         ]
     }
     
@@ -33,6 +45,13 @@ class Face(Document):
             'project_id': str(self.project.id),
             'gridfs_id': self.gridfs_id,
             'cluster_label': self.cluster_label,
+            'label_locked': self.label_locked,
+            'bbox': self.bbox,
+            'det_score': self.det_score,
+            'quality': self.quality,
+            'searchable': self.searchable,
+            'source_hash': self.source_hash,
+            'frame_ts': self.frame_ts,
             'encoding': self.encoding
         }
     
@@ -52,4 +71,4 @@ class Face(Document):
         Returns:
             np.ndarray: Facial embedding array.
         """
-        return np.array(json.loads(self.encoding))
+        return np.asarray(json.loads(self.encoding), dtype=np.float32)
@@ -0,0 +1,112 @@
+# app/models/job.py
+
+from mongoengine import Document, StringField, DictField, DateTimeField
+from datetime import datetime, timedelta, timezone
+import json
+import threading
+import uuid
+
+# Jobs are kept this long after they were created, so clients can still poll their final state
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Guards the in-memory copy of progress counters updated from several threads
+_local_lock = threading.Lock()
+
+def _plain(value):
+    # Progress and results may hold NumPy scalars, which BSON cannot encode
+    return json.loads(json.dumps(value, default=lambda item: item.item() if hasattr(item, 'item') else str(item)))
+
+class Job(Document):
+    """
+    Status and progress counters of a long-running background task.
+
+    State lives in MongoDB so every worker process sees every job: progress
+    is written with atomic updates, and the instance that started the job
+    keeps an in-memory copy for its own responses.
+    """
+    id = StringField(primary_key=True, default=lambda: uuid.uuid4().hex)
+    kind = StringField(required=True)
+    user_id = StringField()
+    project_id = StringField()
+    status = StringField(default='queued')  # 'queued', 'running', 'completed' or 'failed'
+    progress = DictField()
+    result = DictField()
+    error = StringField()
+    lock = StringField()  # Set while an exclusive job is active, e.g. 'recluster:<project_id>'
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    updated_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    expires_at = DateTimeField(
+        default=lambda: datetime.now(timezone.utc) + timedelta(seconds=JOB_RETENTION_SECONDS))
+
+    meta = {
+        'collection': 'jobs',
+        'indexes': [
+            {'fields': ['lock'], 'unique': True, 'sparse': True},  # One active exclusive job per key
+            ('project_id', 'kind', 'status'),  # Active jobs of a project
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0}
+        ]
+    }
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed')
+
+    def _write(self, update):
+        now = datetime.now(timezone.utc)
+        update.setdefault('$set', {})['updated_at'] = now
+        self._get_collection().update_one({'_id': self.id}, update)
+        self.updated_at = now
+
+    def set_status(self, status, error=None, result=None):
+        """
+        Records a status change; finishing releases the job's exclusive lock.
+        """
+        update = {'$set': {'status': status}}
+        if error is not None:
+            update['$set']['error'] = str(error)
+        if result is not None:
+            result = _plain(result)
+            update['$set']['result'] = result
+        if status in ('completed', 'failed'):
+            update['$unset'] = {'lock': ''}
+        self._write(update)
+        with _local_lock:
+            self.status = status
+            if error is not None:
+                self.error = str(error)
+            if result is not None:
+                self.result = result
+
+    def update(self, **progress):
+        """
+        Overwrites progress counters.
+        """
+        progress = _plain(progress)
+        self._write({'$set': {f'progress.{key}': value for key, value in progress.items()}})
+        with _local_lock:
+            self.progress.update(progress)
+
+    def increment(self, key, amount=1):
+        """
+        Atomically increments a progress counter.
+        """
+        self._write({'$inc': {f'progress.{key}': amount}})
+        with _local_lock:
+            self.progress[key] = self.progress.get(key, 0) + amount
+
+    def to_dict(self):
+        """
+        Serializes the job to a dictionary.
+        """
+        with _local_lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'project_id': self.project_id,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'result': self.result or None,
+                'error': self.error,
+                'created_at': self.created_at.isoformat() if self.created_at else None,
+                'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            }
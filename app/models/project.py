@@ -1,8 +1,10 @@
 # app/models/project.py
 
-from mongoengine import Document, StringField, ReferenceField, ListField
+from mongoengine import Document, StringField, ReferenceField, ListField, IntField
 from bson import ObjectId
 
+from app.models.project_change import ProjectChange
+
 class Project(Document):
     """
     Represents a project created by a user.
@@ -11,12 +13,13 @@ class Project(Document):
     description = StringField()
     user = ReferenceField('User', required=True)
     faces = ListField(ReferenceField('Face'))
+    version = IntField(default=0)  # Bumped on every change to the project; validates caches and ETags
     
     meta = {
         'collection': 'projects',
         'indexes': [
-            'p_name',
-            'user'
+            ('user', 'p_name'),  # Name uniqueness per user
+            ('user', 'id')  # Keyset pagination of a user's projects
         ]
     }
     
@@ -29,7 +32,8 @@ class Project(Document):
             'p_name': self.p_name,
             'description': self.description,
             'user_id': str(self.user.id),
-            'faces': [str(face.id) for face in self.faces]
+            'faces': [str(face.id) for face in self.faces],
+            'version': self.version
         }
     
     def add_face(self, face):
@@ -39,3 +43,25 @@ class Project(Document):
         if face not in self.faces:
             self.faces.append(face)
             self.save()
+
+    @classmethod
+    def bump_version(cls, project_id, kind='faces_changed', face_ids=None, **update):
+        """
+        Marks the project as changed, invalidating caches keyed by version, and
+        records the change in the project's change log.
+
+        Args:
+            project_id (str): ID of the project.
+            kind (str, optional): What changed.
+            face_ids (List, optional): Faces affected by the change.
+            **update: Further MongoEngine update operators (e.g. push__faces)
+                applied atomically with the increment.
+
+        Returns:
+            int: The new version, or None if the project does not exist.
+        """
+        project = cls.objects(id=project_id).only('version').modify(new=True, inc__version=1, **update)
+        if project is None:
+            return None
+        ProjectChange.record(project.id, project.version, kind, face_ids)
+        return project.version
@@ -0,0 +1,49 @@
+# app/models/project_change.py
+
+from mongoengine import Document, StringField, ReferenceField, IntField, ListField, DateTimeField
+from datetime import datetime, timezone
+
+# Changes are kept this long; clients further behind resynchronize from scratch
+CHANGE_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Larger changes are recorded without their face IDs
+MAX_CHANGE_FACE_IDS = 1000
+
+class ProjectChange(Document):
+    """
+    One entry of a project's change log, written for every version bump.
+    """
+    project = ReferenceField('Project', required=True)
+    version = IntField(required=True)  # Project version after the change
+    kind = StringField(required=True)  # e.g. 'faces_added', 'labels_changed', 'faces_deleted'
+    face_ids = ListField(StringField())  # Affected faces; empty when many or unknown
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+
+    meta = {
+        'collection': 'project_changes',
+        'indexes': [
+            {'fields': ['project', 'version'], 'unique': True},  # Changes since a version
+            {'fields': ['created_at'], 'expireAfterSeconds': CHANGE_RETENTION_SECONDS}
+        ]
+    }
+
+    def to_dict(self):
+        """
+        Serializes the change to a dictionary.
+        """
+        return {
+            'version': self.version,
+            'kind': self.kind,
+            'face_ids': self.face_ids,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    @classmethod
+    def record(cls, project_id, version, kind, face_ids=None):
+        """
+        Appends a change. Face IDs are dropped when there are more than MAX_CHANGE_FACE_IDS.
+        """
+        face_ids = [str(face_id) for face_id in face_ids or []]
+        if len(face_ids) > MAX_CHANGE_FACE_IDS:
+            face_ids = []
+        return cls(project=project_id, version=version, kind=kind, face_ids=face_ids).save()
@@ -0,0 +1,54 @@
+# app/models/upload_session.py
+
+from mongoengine import Document, StringField, IntField, ObjectIdField, DateTimeField
+from datetime import datetime, timezone
+
+class UploadSession(Document):
+    """
+    A resumable upload of one image, written straight into GridFS chunks.
+
+    The GridFS file document is only created when the upload is finalized, so
+    the file is invisible to the rest of the application until then.
+    """
+    # Plain IDs, so reading a session never dereferences the project's faces list
+    user = ObjectIdField(required=True)
+    project = ObjectIdField(required=True)
+    filename = StringField(required=True)
+    size = IntField(required=True)  # Total bytes announced by the client
+    sha256 = StringField()  # Expected hash, if announced up front
+    chunk_size = IntField(required=True)
+    file_id = ObjectIdField(required=True)  # files_id of the GridFS chunks
+    offset = IntField(default=0)  # Bytes committed so far
+    status = StringField(default='open')  # 'open', 'finalizing' or 'finalized'
+    writer = StringField()  # Token of the request currently writing chunks
+    lease_expires_at = DateTimeField()  # When an abandoned writer's lease lapses
+    face_id = StringField()  # Set when finalized
+    job_id = StringField()
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'upload_sessions',
+        'indexes': [
+            'expires_at',  # Expired session sweep
+            ('project', 'id')
+        ]
+    }
+
+    def to_dict(self):
+        """
+        Serializes the session to a dictionary.
+        """
+        return {
+            'upload_id': str(self.id),
+            'project_id': str(self.project),
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'offset': self.offset,
+            'status': self.status,
+            'face_id': self.face_id,
+            'gridfs_id': str(self.file_id) if self.status == 'finalized' else None,
+            'job_id': self.job_id,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -1,6 +1,6 @@
 # app/models/user.py
 
-from mongoengine import Document, StringField, ListField, ReferenceField
+from mongoengine import Document, StringField, ListField, ReferenceField, IntField
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
 
@@ -12,6 +12,7 @@ class User(Document):
     password_hash = StringField(required=True)
     projects = ListField(ReferenceField('Project'))
     is_admin = StringField(default='false')  # 'true' or 'false'
+    projects_version = IntField(default=0)  # Bumped when the user's project listing changes
     
     meta = {
         'collection': 'users',
@@ -37,6 +38,13 @@ class User(Document):
             bool: True if the password matches, False otherwise.
         """
         return check_password_hash(self.password_hash, password)
+
+    @classmethod
+    def bump_projects_version(cls, user_id):
+        """
+        Marks the user's project listing as changed, invalidating its ETags.
+        """
+        cls.objects(id=user_id).update_one(inc__projects_version=1)
     
     def to_dict(self):
         """
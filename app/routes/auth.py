@@ -6,6 +6,8 @@ from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identi
 from werkzeug.security import generate_password_hash, check_password_hash
 import logging
 
+from app.utils.auth import invalidate_user
+
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 logger = logging.getLogger(__name__)
@@ -83,6 +85,7 @@ def profile():
 
         try:
             user.save()
+            invalidate_user(user_id)
             logger.info(f"User profile updated: {email if email else user.email}")
         except Exception as e:
             logger.error(f"Error updating user profile: {e}")
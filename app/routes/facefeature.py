@@ -2,133 +2,218 @@
 
 import io
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import get_jwt_identity
+from werkzeug.exceptions import ClientDisconnected, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import get_input_stream
+from bson import ObjectId
 import hashlib
 import logging
+import os
+import tempfile
 
 from app.models.project import Project
 from app.models.face import Face
-from app.models.user import User
 from app.utils.image_processing import allowed_file, is_image_file
-from app.utils.ml_model import extract_features, process_new_images, find_matching_faces
+from app.utils.auth import project_access_required
+from app.utils.admission import admission_controlled
+from app.utils.ml_model import (extract_features, find_matching_faces, extract_faces_for_image,
+                                cluster_and_store_faces)
+from app.utils.streaming_upload import iter_multipart_images
+from app.utils.video import allowed_video_file, ingest_video
+from app.utils.archive_import import open_archive_stream, import_archive, finish_archive_import
+from app.utils.jobs import create_job, run_job
+from app.utils.search_cache import search_key, get_cached_search, cache_search
+from app.utils.blob_store import acquire_blob
+from app.utils.storage_gc import release_images
+from app.utils import background
 
 bp = Blueprint('facefeature', __name__, url_prefix='/facefeature')
 
 logger = logging.getLogger(__name__)
 
+# Cosine similarity threshold of /find_faces matches
+SEARCH_TOLERANCE = 0.6
+
+def _create_face_document(project, gridfs_id, image_hash, original_filename):
+    """
+    Creates the placeholder Face document for a stored image and links it to the project.
+
+    Raises:
+        Exception: If the document could not be saved.
+    """
+    new_face = Face(
+        gridfs_id=str(gridfs_id),
+        project=project,
+        hash=image_hash,
+        cluster_label=None,  # To be set after processing
+        encoding=None         # To be set after processing
+    )
+    new_face.save()
+    # Verify that the document was saved
+    if not Face.objects(id=new_face.id).first():
+        logger.error(f"Face document for image {original_filename} was not saved.")
+        raise Exception("Failed to save Face document.")
+    logger.info("Created new Face document for image %s with ID %s.", original_filename, new_face.id)
+
+    # Link the face to the project and publish the change in one atomic update
+    Project.bump_version(project.id, 'faces_added', [new_face.id], push__faces=new_face.id)
+    return new_face
+
+def _delete_from_gridfs(grid_fs, gridfs_id, original_filename):
+    """
+    Removes a stored image from GridFS, logging rather than raising on failure.
+    """
+    try:
+        grid_fs.delete(ObjectId(str(gridfs_id)))
+        logger.info(f"Deleted image {original_filename} from GridFS.")
+    except Exception as del_e:
+        logger.error(f"Error deleting image {original_filename} from GridFS: {del_e}")
+
+def _release_image(image_hash, gridfs_id, original_filename):
+    """
+    Drops the reference an upload took on a stored image, logging rather than raising on failure.
+    """
+    try:
+        release_images(current_app.extensions['mongo_db'], [(image_hash, str(gridfs_id))])
+    except Exception as e:
+        logger.error(f"Error releasing image {original_filename}: {e}")
+
+def _discard_uploads(project_id, image_data_list):
+    """
+    Undoes the images an aborted upload request already stored: cancels their
+    pending extractions, deletes their placeholder faces and releases their blobs.
+    """
+    for image_data, future in image_data_list:
+        future.cancel()
+    if not image_data_list:
+        return
+    try:
+        # Clustering may have added faces beside the placeholders; the images were new to the project
+        faces = Face.objects(project=project_id,
+                             gridfs_id__in=[image_data['gridfs_id'] for image_data, _ in image_data_list])
+        face_ids = list(faces.distinct('id'))
+        faces.delete()
+        if face_ids:
+            Project.bump_version(project_id, 'faces_deleted', face_ids, pull_all__faces=face_ids)
+    except Exception as e:
+        logger.error(f"Error deleting faces of aborted upload to project {project_id}: {e}")
+        return
+    for image_data, _ in image_data_list:
+        _release_image(image_data['hash'], image_data['gridfs_id'], image_data['original_filename'])
+
 @bp.route('/imagesupload/<string:project_id>', methods=['POST'])
-@jwt_required()
+@project_access_required()
+@admission_controlled('inference')
 def upload_images_to_project(project_id):
     """
     Uploads multiple images to a specific project and processes them to detect faces.
     """
-    user_id = get_jwt_identity()
-    user = User.objects(id=user_id).first()
-    
-    if not user:
-        return jsonify({'message': 'User not found.'}), 404
-
-    # Fetch the project and validate ownership
-    project = Project.objects(id=project_id, user=user).first()
+    # Ownership was checked by the decorator; load the document for writing
+    project = Project.objects(id=project_id).first()
     if not project:
-        return jsonify({'message': 'Project not found or not owned by user.'}), 404
+        return jsonify({'message': 'Project not found.'}), 404
 
     # Check if any files were uploaded
     if 'images' not in request.files:
         return jsonify({'message': 'No images part in the request.'}), 400
 
     files = request.files.getlist('images')
+    validated = []
     image_data_list = []
     saved_faces = []
 
     grid_fs = current_app.extensions['grid_fs']  # Access GridFS via Flask app extensions
 
+    # Validate every file before any work starts, so a bad file later in the
+    # request never leaves earlier ones half processed
     for file in files:
         # Validate the file type by extension
-        if file and allowed_file(file.filename):
-            original_filename = secure_filename(file.filename)
-            
-            # Read image bytes without saving to disk
-            image_bytes = file.read()
-
-            # Validate MIME type by checking the file content
-            if not is_image_file(io.BytesIO(image_bytes)):
-                return jsonify({'message': f'Uploaded file {original_filename} is not a valid image.'}), 400
-
-            # Generate a hash for the image to prevent duplicates
-            hash_object = hashlib.sha256(image_bytes)
-            image_hash = hash_object.hexdigest()
-
-            # Check for existing Face with the same hash and project to prevent duplicates
-            existing_face = Face.objects(hash=image_hash, project=project).first()
-            if existing_face:
-                saved_faces.append({
-                    'face_id': str(existing_face.id),
-                    'gridfs_id':str(existing_face.gridfs_id),
-                    'message': 'Duplicate image detected.'
-                })
-                continue  # Skip processing this duplicate image
+        if not (file and allowed_file(file.filename)):
+            return jsonify({'message': f'File type not allowed for file {file.filename}.'}), 400
+        original_filename = secure_filename(file.filename)
 
-            # Store image in GridFS
-            try:
-                gridfs_id = grid_fs.put(image_bytes, filename=original_filename)
-                logger.info(f"Stored image {original_filename} in GridFS with ID {gridfs_id}.")
-            except Exception as e:
-                logger.error(f"Error storing image {original_filename} in GridFS: {e}")
-                return jsonify({'message': f'Error storing image {original_filename}.'}), 500
+        # Read image bytes without saving to disk
+        image_bytes = file.read()
 
-            # Create Face document
-            try:
-                new_face = Face(
-                    gridfs_id=str(gridfs_id),
-                    project=project,
-                    hash=image_hash,
-                    cluster_label=None,  # To be set after processing
-                    encoding=None         # To be set after processing
-                )
-                new_face.save()
-                # Verify that the document was saved
-                if not Face.objects(id=new_face.id).first():
-                    logger.error(f"Face document for image {original_filename} was not saved.")
-                    raise Exception("Failed to save Face document.")
-                logger.info(f"Created new Face document for image {original_filename} with ID {new_face.id}.")
-
-                # **Link Face to Project**
-                project.add_face(new_face)
+        # Validate MIME type by checking the file content
+        if not is_image_file(io.BytesIO(image_bytes)):
+            return jsonify({'message': f'Uploaded file {original_filename} is not a valid image.'}), 400
 
-            except Exception as e:
-                logger.error(f"Error creating Face document for image {original_filename}: {e}")
-                # Optionally, delete the image from GridFS if DB entry fails
-                try:
-                    grid_fs.delete(gridfs_id)
-                    logger.info(f"Deleted image {original_filename} from GridFS due to DB error.")
-                except Exception as del_e:
-                    logger.error(f"Error deleting image {original_filename} from GridFS: {del_e}")
-                return jsonify({'message': f'Error processing image {original_filename}.'}), 500
-
-            # Collect image data for processing
-            image_data = {
-                'gridfs_id': str(gridfs_id),
-                'original_filename': original_filename,
-                'hash': image_hash  # Include hash to avoid recomputing
-            }
-            image_data_list.append(image_data)
-        else:
-            return jsonify({'message': f'File type not allowed for file {file.filename}.'}), 400
+        # Generate a hash for the image to prevent duplicates
+        validated.append((original_filename, image_bytes, hashlib.sha256(image_bytes).hexdigest()))
+
+    for original_filename, image_bytes, image_hash in validated:
+        # Check for existing Face with the same hash and project to prevent duplicates
+        existing_face = Face.objects(hash=image_hash, project=project).first()
+        if existing_face:
+            saved_faces.append({
+                'face_id': str(existing_face.id),
+                'gridfs_id':str(existing_face.gridfs_id),
+                'message': 'Duplicate image detected.'
+            })
+            continue  # Skip processing this duplicate image
+
+        # Start feature extraction on the bytes in hand, so storing the image
+        # overlaps with inference and nothing is read back from GridFS
+        image_data = {
+            'original_filename': original_filename,
+            'hash': image_hash,  # Include hash to avoid recomputing
+            'image_bytes': image_bytes
+        }
+        future = background.submit('interactive', extract_faces_for_image, image_data)
+
+        # Store image in GridFS, or reference the copy another upload stored
+        try:
+            gridfs_id, deduplicated = acquire_blob(image_hash, grid_fs, data=image_bytes,
+                                                   filename=original_filename)
+            logger.info("Stored image %s in GridFS with ID %s%s.", original_filename, gridfs_id,
+                        ' (deduplicated)' if deduplicated else '')
+        except Exception as e:
+            logger.error(f"Error storing image {original_filename} in GridFS: {e}")
+            future.cancel()
+            _discard_uploads(project_id, image_data_list)
+            return jsonify({'message': f'Error storing image {original_filename}.'}), 500
+
+        # Create Face document
+        try:
+            _create_face_document(project, gridfs_id, image_hash, original_filename)
+        except Exception as e:
+            logger.error(f"Error creating Face document for image {original_filename}: {e}")
+            future.cancel()
+            _release_image(image_hash, gridfs_id, original_filename)
+            _discard_uploads(project_id, image_data_list)
+            return jsonify({'message': f'Error processing image {original_filename}.'}), 500
+
+        image_data['gridfs_id'] = str(gridfs_id)
+        image_data_list.append((image_data, future))
 
     if not image_data_list:
         return jsonify({'message': 'No new images to process.'}), 200
 
-    # Process all uploaded images (feature extraction and clustering)
+    records = []
+    for image_data, future in image_data_list:
+        try:
+            image_records = future.result()
+        except Exception as e:
+            logger.error(f"Error extracting features from image {image_data['gridfs_id']}: {e}")
+            continue
+        # Extraction may have finished before the image was stored
+        for record in image_records:
+            record['gridfs_id'] = image_data['gridfs_id']
+        records.extend(image_records)
+
+    # Cluster all uploaded images at once
     try:
-        process_new_images(image_data_list, project_id=project_id)
+        cluster_and_store_faces(records, project_id)
     except Exception as e:
         logger.error(f"Error processing images for project {project_id}: {e}")
+        _discard_uploads(project_id, image_data_list)
         return jsonify({'message': 'Error processing images.', 'error': str(e)}), 500
 
     # After processing, retrieve the newly added faces to report
-    for image_data in image_data_list:
+    for image_data, _ in image_data_list:
         gridfs_id = image_data['gridfs_id']
         image_hash = image_data['hash']  # Use precomputed hash
 
@@ -144,22 +229,241 @@ def upload_images_to_project(project_id):
 
     return jsonify({'saved_faces': saved_faces}), 201
 
-@bp.route('/find_faces/<string:project_id>', methods=['POST'])
-@jwt_required()
-def find_matching_faces_route(project_id):
+@bp.route('/imagesupload/<string:project_id>/stream', methods=['POST'])
+@project_access_required()
+def stream_images_to_project(project_id):
     """
-    Uploads a query image to find matching faces within a specific project.
+    Streams multiple images into a specific project without buffering the request body.
+
+    Each multipart part is hashed and written to GridFS chunk by chunk as it
+    arrives, and face extraction starts as soon as a part is complete.
+    Extraction is bounded by the model slots rather than route admission, so
+    slow clients never hold an inference slot during the transfer.
     """
-    user_id = get_jwt_identity()
-    user = User.objects(id=user_id).first()
-    
-    if not user:
-        return jsonify({'message': 'User not found.'}), 404
+    # Ownership was checked by the decorator; load the document for writing
+    project = Project.objects(id=project_id).first()
+    if not project:
+        return jsonify({'message': 'Project not found.'}), 404
+
+    mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        return jsonify({'message': 'Request must be multipart/form-data.'}), 400
 
-    project = Project.objects(id=project_id, user=user).first()
+    # Read the raw body so Werkzeug does not parse (and buffer) the form itself
+    stream = get_input_stream(
+        request.environ,
+        max_content_length=current_app.config.get('STREAM_UPLOAD_MAX_CONTENT_LENGTH')
+    )
+    grid_fs = current_app.extensions['grid_fs']
+
+    saved_faces = []
+    pending = []  # (image_data, future) pairs awaiting feature extraction
+    stream_error = None
+
+    try:
+        for image_data in iter_multipart_images(
+                stream, boundary, grid_fs,
+                chunk_size=current_app.config.get('STREAM_UPLOAD_CHUNK_SIZE', 255 * 1024),
+                max_part_size=current_app.config.get('STREAM_UPLOAD_MAX_FILE_SIZE')):
+            original_filename = image_data['original_filename']
+            if 'error' in image_data:
+                saved_faces.append({'filename': original_filename, 'message': image_data['error']})
+                continue
+
+            # The hash is only known once the part is complete, so duplicates are dropped afterwards
+            existing_face = Face.objects(hash=image_data['hash'], project=project).first()
+            if existing_face:
+                _delete_from_gridfs(grid_fs, image_data['gridfs_id'], original_filename)
+                saved_faces.append({
+                    'face_id': str(existing_face.id),
+                    'gridfs_id': str(existing_face.gridfs_id),
+                    'message': 'Duplicate image detected.'
+                })
+                continue
+
+            try:
+                image_data['gridfs_id'], _ = acquire_blob(image_data['hash'], grid_fs,
+                                                          gridfs_id=image_data['gridfs_id'],
+                                                          size=image_data['size'])
+            except Exception as e:
+                logger.error(f"Error storing image {original_filename} in GridFS: {e}")
+                _delete_from_gridfs(grid_fs, image_data['gridfs_id'], original_filename)
+                saved_faces.append({'filename': original_filename,
+                                    'message': f'Error storing image {original_filename}.'})
+                continue
+
+            try:
+                new_face = _create_face_document(project, image_data['gridfs_id'], image_data['hash'],
+                                                 original_filename)
+            except Exception as e:
+                logger.error(f"Error creating Face document for image {original_filename}: {e}")
+                _release_image(image_data['hash'], image_data['gridfs_id'], original_filename)
+                saved_faces.append({'filename': original_filename,
+                                    'message': f'Error processing image {original_filename}.'})
+                continue
+
+            image_data['face_id'] = str(new_face.id)
+
+            # Hand the finished part to feature extraction while the rest of the body streams in
+            future = background.submit('interactive', extract_faces_for_image, image_data)
+            pending.append((image_data, future))
+    except (RequestEntityTooLarge, ClientDisconnected) as e:
+        logger.error(f"Streaming upload for project {project_id} stopped early: {e}")
+        stream_error = e
+
+    if pending:
+        records = []
+        for image_data, future in pending:
+            try:
+                records.extend(future.result())
+            except Exception as e:
+                logger.error(f"Error extracting features from image {image_data['gridfs_id']}: {e}")
+
+        # Cluster the whole batch once every part has been embedded
+        try:
+            cluster_and_store_faces(records, project_id)
+        except Exception as e:
+            logger.error(f"Error processing images for project {project_id}: {e}")
+            return jsonify({'message': 'Error processing images.', 'error': str(e)}), 500
+
+        for image_data, _ in pending:
+            saved_faces.append({
+                'face_id': image_data['face_id'],
+                'gridfs_id': image_data['gridfs_id'],
+                'message': 'Image uploaded and processed successfully.'
+            })
+
+    if stream_error is not None:
+        return jsonify({'message': 'Upload was interrupted.', 'saved_faces': saved_faces}), stream_error.code
+
+    if not pending and not saved_faces:
+        return jsonify({'message': 'No new images to process.'}), 200
+
+    return jsonify({'saved_faces': saved_faces}), 201
+
+@bp.route('/archiveupload/<string:project_id>', methods=['POST'])
+@project_access_required()
+def import_archive_to_project(project_id):
+    """
+    Imports every image in a ZIP or TAR archive sent as the raw request body.
+
+    The archive is read as a stream; extraction and clustering continue in the
+    background and can be followed through the returned job.
+    """
+    # Ownership was checked by the decorator; load the document for writing
+    project = Project.objects(id=project_id).first()
     if not project:
-        return jsonify({'message': 'Project not found or not owned by user.'}), 404
+        return jsonify({'message': 'Project not found.'}), 404
+
+    stream = get_input_stream(
+        request.environ,
+        max_content_length=current_app.config.get('STREAM_UPLOAD_MAX_CONTENT_LENGTH')
+    )
+    archive_format, stream = open_archive_stream(stream, request.mimetype)
+    if archive_format is None:
+        return jsonify({'message': 'Request body must be a ZIP or TAR archive.'}), 400
+
+    job = create_job('archive_import', user_id=get_jwt_identity(), project_id=project_id)
+    job.update(archive_format=archive_format)
+    job.set_status('running')
+
+    try:
+        pending = import_archive(
+            job, stream, archive_format, project, current_app.extensions['grid_fs'],
+            batch_size=current_app.config.get('ARCHIVE_IMPORT_BATCH_SIZE', 32),
+            max_member_size=current_app.config.get('STREAM_UPLOAD_MAX_FILE_SIZE', 64 * 1024 * 1024)
+        )
+    except (RequestEntityTooLarge, ClientDisconnected) as e:
+        logger.error(f"Archive upload for project {project_id} stopped early: {e}")
+        job.set_status('failed', error=e)
+        return jsonify({'message': 'Upload was interrupted.', 'job': job.to_dict()}), e.code
+    except Exception as e:
+        logger.error(f"Error reading archive for project {project_id}: {e}")
+        job.set_status('failed', error=e)
+        return jsonify({'message': 'Error reading archive.', 'job': job.to_dict()}), 400
 
+    # Clustering waits for every extraction, so it runs off the request thread
+    run_job(job, finish_archive_import, pending, project_id)
+
+    return jsonify({'message': 'Archive received. Processing in background.', 'job': job.to_dict()}), 202
+
+@bp.route('/videoupload/<string:project_id>', methods=['POST'])
+@project_access_required()
+def upload_video_to_project(project_id):
+    """
+    Ingests a video sent as the raw request body (file name in the 'filename' query parameter).
+
+    Keyframes are sampled on scene changes and only faces not tracked from the
+    previous keyframe are embedded; processing continues in the background.
+    """
+    filename = secure_filename(request.args.get('filename', ''))
+    if not filename or not allowed_video_file(filename):
+        return jsonify({'message': f'File type not allowed for file {filename}.'}), 400
+
+    stream = get_input_stream(
+        request.environ,
+        max_content_length=current_app.config.get('STREAM_UPLOAD_MAX_CONTENT_LENGTH')
+    )
+
+    # OpenCV decodes from a path, so spool the body to a temporary file while hashing it
+    sha256 = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix='.' + filename.rsplit('.', 1)[1].lower(), prefix='pikieye-video-')
+    # ingest_video removes the file once its job is dispatched; until then it is ours to clean up
+    job = None
+    try:
+        try:
+            with os.fdopen(fd, 'wb') as video_file:
+                for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+                    video_file.write(chunk)
+        except (RequestEntityTooLarge, ClientDisconnected) as e:
+            os.remove(path)
+            logger.error(f"Video upload for project {project_id} stopped early: {e}")
+            return jsonify({'message': 'Upload was interrupted.'}), e.code
+
+        video_hash = sha256.hexdigest()
+        existing_face = Face.objects(project=project_id, source_hash=video_hash).first()
+        if existing_face:
+            os.remove(path)
+            return jsonify({'message': 'Duplicate video detected.'}), 200
+
+        job = create_job('video_ingest', user_id=get_jwt_identity(), project_id=project_id)
+        run_job(job, ingest_video, path, project_id, filename, current_app.extensions['grid_fs'],
+                video_hash=video_hash,
+                probe_interval=current_app.config.get('VIDEO_PROBE_INTERVAL', 0.2),
+                min_interval=current_app.config.get('VIDEO_MIN_KEYFRAME_INTERVAL', 0.5),
+                max_interval=current_app.config.get('VIDEO_MAX_KEYFRAME_INTERVAL', 5.0),
+                diff_threshold=current_app.config.get('VIDEO_SCENE_CHANGE_THRESHOLD', 10.0))
+    except Exception as e:
+        logger.error(f"Error receiving video {filename} for project {project_id}: {e}")
+        if os.path.exists(path):
+            os.remove(path)
+        if job is not None:
+            job.set_status('failed', error=e)
+        return jsonify({'message': f'Error processing video {filename}.'}), 500
+    logger.info(f"Started video ingest job {job.id} for {filename} in project {project_id}.")
+
+    return jsonify({'message': 'Video received. Processing in background.', 'job': job.to_dict()}), 202
+
+def _matching_images_response(related_image_ids):
+    if not related_image_ids:
+        return jsonify({'message': 'No related images found.'}), 200
+
+    return jsonify({
+        'message': 'Image processed successfully.',
+        'matching_images': related_image_ids
+    }), 200
+
+@bp.route('/find_faces/<string:project_id>', methods=['POST'])
+@project_access_required()
+def find_matching_faces_route(project_id):
+    """
+    Uploads a query image to find matching faces within a specific project.
+
+    Results are cached per project version, query image and tolerance, so
+    repeated searches skip inference (and admission control) entirely.
+    """
     if 'image' not in request.files:
         return jsonify({'message': 'No image part in the request.'}), 400
     
@@ -184,6 +488,21 @@ def find_matching_faces_route(project_id):
     if not is_image_file(io.BytesIO(image_bytes)):
         return jsonify({'message': f'Uploaded file {filename} is not a valid image.'}), 400
 
+    tolerance = SEARCH_TOLERANCE
+    try:
+        key = search_key(project_id, image_bytes, tolerance)
+    except ValueError as ve:
+        return jsonify({'message': str(ve)}), 404
+
+    related_image_ids = get_cached_search(key)
+    if related_image_ids is not None:
+        logger.debug("Served search for image %s in project %s from cache.", filename, project_id)
+        return _matching_images_response(related_image_ids)
+
+    return _search_project(project_id, image_bytes, filename, tolerance, key)
+
+@admission_controlled('inference')
+def _search_project(project_id, image_bytes, filename, tolerance, key):
     try:
         # Extract facial embeddings from the uploaded image
         query_embeddings = extract_features(image_bytes)
@@ -196,7 +515,8 @@ def find_matching_faces_route(project_id):
 
     try:
         # Find matching faces in the project based on embeddings
-        related_image_ids = find_matching_faces(query_embeddings, project_id)
+        related_image_ids = find_matching_faces(query_embeddings, project_id, tolerance=tolerance)
+        cache_search(key, related_image_ids)
         logger.info(f"Found {len(related_image_ids)} related images for uploaded image {filename}.")
     except ValueError as ve:
         logger.error(f"ValueError during face matching: {ve}")
@@ -205,10 +525,4 @@ def find_matching_faces_route(project_id):
         logger.error(f"Unexpected error during face matching: {e}")
         return jsonify({'message': 'An error occurred while matching faces.'}), 500
 
-    if not related_image_ids:
-        return jsonify({'message': 'No related images found.'}), 200
-
-    return jsonify({
-        'message': 'Image processed successfully.',
-        'matching_images': related_image_ids
-    }), 200
+    return _matching_images_response(related_image_ids)
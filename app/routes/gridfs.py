@@ -2,19 +2,20 @@
 
 from flask import Blueprint, Response, current_app
 from bson import ObjectId
-from flask_jwt_extended import jwt_required, get_jwt_identity
 import gridfs
 import logging
 
+from app.utils.auth import image_access_required
+
 bp = Blueprint('gridfs', __name__, url_prefix='/api/gridfs')
 
 logger = logging.getLogger(__name__)
 
 @bp.route('/<gridfs_id>', methods=['GET'])
-@jwt_required(locations=["headers","cookies","query_string"])
+@image_access_required(locations=["headers","cookies","query_string"])
 def get_image(gridfs_id):
     """
-    Serves an image stored in GridFS based on its ID.
+    Serves an image stored in GridFS based on its ID, if it belongs to one of the user's projects.
     """
     try:
         fs = current_app.extensions['grid_fs']
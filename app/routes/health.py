@@ -2,8 +2,19 @@
 
 from flask import Blueprint, jsonify
 
+from app.utils import metrics
+from app.utils.auth import admin_required
+
 bp = Blueprint('health', __name__, url_prefix='/api')
 
 @bp.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'Server is running.'}), 200
+
+@bp.route('/metrics', methods=['GET'])
+@admin_required()
+def metrics_report():
+    """
+    Reports admission, cache and route counters; administrators only.
+    """
+    return jsonify(metrics.collect()), 200
@@ -0,0 +1,25 @@
+# app/routes/jobs.py
+
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import logging
+
+from app.utils.jobs import get_job
+
+bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+logger = logging.getLogger(__name__)
+
+@bp.route('/<string:job_id>', methods=['GET'])
+@jwt_required()
+def get_job_status(job_id):
+    """
+    Retrieves the status and progress of a background job started by the user.
+    """
+    user_id = get_jwt_identity()
+    job = get_job(job_id)
+
+    if not job or job.user_id != str(user_id):
+        return jsonify({'message': 'Job not found.'}), 404
+
+    return jsonify(job.to_dict()), 200
@@ -1,10 +1,21 @@
 # app/routes/project.py
 from app.models.face import Face
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, send_file
 from app.models.project import Project
+from app.models.project_change import ProjectChange
 from app.models.user import User
+from app.utils.project_io import export_project, import_project, EXPORT_DTYPES
+from app.utils.storage_gc import delete_project_cascade
+from app.utils.jobs import create_job, run_job, JobConflict
+from app.utils.auth import project_access_required, user_exists, invalidate_project
+from app.utils.pagination import parse_page_args, paginate, page_of, streamed_page_response
+from app.utils.conditional import version_etag, not_modified, with_etag
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import ClientDisconnected, RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
 import logging
+import shutil
+import tempfile
 
 bp = Blueprint('project', __name__, url_prefix='/project')
 
@@ -36,6 +47,7 @@ def create_project():
     try:
         new_project = Project(p_name=p_name, description=description, user=user)
         new_project.save()
+        User.bump_projects_version(user.id)
         logger.info(f"New project created: {p_name} by user {user.email}")
     except Exception as e:
         logger.error(f"Error creating project {p_name}: {e}")
@@ -43,103 +55,132 @@ def create_project():
 
     return jsonify({'message': 'Project created successfully.', 'project_id': str(new_project.id)}), 201
 
+def _project_summary(doc):
+    """
+    Serializes a raw project document (as returned by as_pymongo) for listings.
+    """
+    return {
+        'id': str(doc['_id']),
+        'p_name': doc.get('p_name'),
+        'description': doc.get('description'),
+        'user': str(doc.get('user')),
+        # Add other project fields as needed
+    }
+
+def _project_page_response(queryset, etag=None):
+    """
+    Returns one page of a project listing, with the next page's cursor in the X-Next-Cursor header.
+    """
+    try:
+        limit, cursor = parse_page_args(
+            default_limit=current_app.config.get('PAGE_SIZE_DEFAULT', 100),
+            max_limit=current_app.config.get('PAGE_SIZE_MAX', 1000)
+        )
+    except ValueError as ve:
+        return jsonify({'message': str(ve)}), 400
+
+    # Project the listed fields only; the faces list and user reference are never loaded
+    page = paginate(queryset.only('id', 'p_name', 'description', 'user').as_pymongo(), limit, cursor)
+    docs, next_cursor = page_of(page, limit)
+
+    response = jsonify([_project_summary(doc) for doc in docs])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if etag:
+        with_etag(response, etag)
+    return response, 200
+
 @bp.route('/user', methods=['GET'])
 @jwt_required()
 def get_user_projects():
     """
-    Retrieves all projects associated with the authenticated user.
+    Retrieves the projects associated with the authenticated user, one page at a time.
     """
     user_id = get_jwt_identity()
-    user = User.objects(id=user_id).first()
 
+    user = User.objects(id=user_id).only('projects_version').as_pymongo().first()
     if not user:
         return jsonify({'message': 'User not found.'}), 404
 
-    projects = Project.objects(user=user)
-    projects_data = [{
-        'id': str(project.id),
-        'p_name': project.p_name,
-        'description': project.description,
-        'user': str(project.user.id),
-        # Add other project fields as needed
-    } for project in projects]
-
-    return jsonify(projects_data), 200
+    etag = version_etag('user', user_id, user.get('projects_version', 0))
+    return not_modified(etag) or _project_page_response(Project.objects(user=user_id), etag)
 
 @bp.route('/getall', methods=['GET'])
 @jwt_required()
 def get_all_projects():
     """
-    Retrieves all projects in the system.
+    Retrieves all projects in the system, one page at a time.
     """
-    projects = Project.objects()
-    projects_data = [{
-        'id': str(project.id),
-        'p_name': project.p_name,
-        'description': project.description,
-        'user': str(project.user.id),
-        # Add other project fields as needed
-    } for project in projects]
-
-    return jsonify(projects_data), 200
+    return _project_page_response(Project.objects())
 
 @bp.route('/<string:project_id>', methods=['GET', 'PUT', 'DELETE'])
-@jwt_required()
+@project_access_required()
 def manage_project(project_id):
     """
     Retrieves, updates, or deletes a specific project by its ID.
     """
     user_id = get_jwt_identity()
-    user = User.objects(id=user_id).first()
-
-    if not user:
-        return jsonify({'message': 'User not found.'}), 404
-
-    project = Project.objects(id=project_id, user=user).first()
 
+    # The faces reference list can be huge and is not needed here
+    project = Project.objects(id=project_id).exclude('faces').first()
     if not project:
         return jsonify({'message': 'Project not found.'}), 404
 
     if request.method == 'GET':
-        # Retrieve all faces associated with this project
-        faces = Face.objects(project=project)
+        etag = version_etag('project', project_id, project.version)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        try:
+            limit, cursor = parse_page_args(
+                default_limit=current_app.config.get('FACE_PAGE_SIZE_DEFAULT', 1000),
+                max_limit=current_app.config.get('FACE_PAGE_SIZE_MAX', 10000)
+            )
+        except ValueError as ve:
+            return jsonify({'message': str(ve)}), 400
 
-        # Compile face data with face_id and gridfs_id
-        gridfs_ids = [str(face.gridfs_id) for face in faces]
+        # Stream one page of the project's gridfs_ids straight from the cursor
+        faces = paginate(Face.objects(project=project.id).only('id', 'gridfs_id').as_pymongo(), limit, cursor)
 
         # Return project details along with associated faces and their gridfs_ids
-        return jsonify({
-            'id': str(project.id),
-            'p_name': project.p_name,
-            'description': project.description,
-            'user': str(project.user.id),
-            'grdifs_ids': gridfs_ids
-        }), 200
+        return with_etag(streamed_page_response(
+            {
+                'id': str(project.id),
+                'p_name': project.p_name,
+                'description': project.description,
+                'user': user_id
+            },
+            'grdifs_ids',
+            faces,
+            limit,
+            lambda doc: str(doc.get('gridfs_id'))
+        ), etag)
 
     elif request.method == 'PUT':
         data = request.get_json()
         p_name = data.get('p_name')
         description = data.get('description')
 
-        updated = False
+        changes = {}
 
         if p_name:
             # Check if another project with the same name exists for the user
-            if Project.objects(p_name=p_name, user=user).exclude(id=project_id).first():
+            if Project.objects(p_name=p_name, user=user_id).exclude(id=project_id).first():
                 return jsonify({'message': 'Project name already in use.'}), 409
-            project.p_name = p_name
-            updated = True
+            changes['set__p_name'] = p_name
 
         if description is not None:
-            project.description = description
-            updated = True
+            changes['set__description'] = description
 
-        if not updated:
+        if not changes:
             return jsonify({'message': 'No valid fields to update.'}), 400
 
         try:
-            project.save()
-            logger.info(f"Project {project_id} updated by user {user.email}")
+            # Fields and version change in one update, so no reader sees new content under the old ETag
+            Project.bump_version(project_id, 'project_updated', **changes)
+            User.bump_projects_version(user_id)
+            logger.info(f"Project {project_id} updated by user {user_id}")
         except Exception as e:
             logger.error(f"Error updating project {project_id}: {e}")
             return jsonify({'message': 'Error updating project.'}), 500
@@ -147,10 +188,128 @@ def manage_project(project_id):
         return jsonify({'message': 'Project updated successfully.'}), 200
 
     elif request.method == 'DELETE':
+        # Registered before the project goes, so storage GC never starts a second cascade for it
+        try:
+            job = create_job('project_delete', user_id=user_id, project_id=project_id, exclusive=True)
+        except JobConflict as conflict:
+            return jsonify({'message': 'Project is already being deleted.', 'job': conflict.job.to_dict()}), 409
+
         try:
             project.delete()
-            logger.info(f"Project {project_id} deleted by user {user.email}")
-            return jsonify({'message': 'Project deleted successfully.'}), 200
+            User.bump_projects_version(user_id)
+            invalidate_project(project_id)
+            logger.info(f"Project {project_id} deleted by user {user_id}")
         except Exception as e:
             logger.error(f"Error deleting project {project_id}: {e}")
+            job.set_status('failed', error=e)
             return jsonify({'message': 'Error deleting project.'}), 500
+
+        # Faces and GridFS blobs are removed in batches in the background
+        run_job(job, delete_project_cascade, project_id, current_app.extensions['mongo_db'],
+                batch_size=current_app.config.get('GC_BATCH_SIZE', 500),
+                pause_seconds=current_app.config.get('GC_PAUSE_SECONDS', 0.1))
+        return jsonify({'message': 'Project deleted successfully.', 'job': job.to_dict()}), 200
+
+@bp.route('/<string:project_id>/changes', methods=['GET'])
+@project_access_required()
+def get_project_changes(project_id):
+    """
+    Lists the project's changes after version 'since', oldest first, for incremental sync.
+
+    When the log no longer reaches back to 'since', 'reset' is true and the
+    client should reload the project from scratch.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'message': 'since and limit must be integers.'}), 400
+    if since < 0 or limit < 1:
+        return jsonify({'message': 'since must be non-negative and limit positive.'}), 400
+
+    project = Project.objects(id=project_id).only('version').as_pymongo().first()
+    if not project:
+        return jsonify({'message': 'Project not found.'}), 404
+    version = project.get('version', 0)
+
+    etag = version_etag('changes', project_id, version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    changes = []
+    if since < version:
+        changes = list(ProjectChange.objects(project=project_id, version__gt=since)
+                       .order_by('version').limit(limit + 1))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    reset = since < version and (not changes or changes[0].version != since + 1)
+
+    response = jsonify({
+        'version': version,
+        'reset': reset,
+        'has_more': has_more,
+        'changes': [] if reset else [change.to_dict() for change in changes]
+    })
+    return with_etag(response, etag), 200
+
+@bp.route('/<string:project_id>/export', methods=['GET'])
+@project_access_required()
+def export_project_route(project_id):
+    """
+    Downloads a project's faces, embeddings and cluster labels as a binary .npz file.
+    """
+    project = Project.objects(id=project_id).exclude('faces').first()
+    if not project:
+        return jsonify({'message': 'Project not found.'}), 404
+
+    dtype = request.args.get('dtype', 'float32')
+    if dtype not in EXPORT_DTYPES:
+        return jsonify({'message': f"dtype must be one of {', '.join(EXPORT_DTYPES)}."}), 400
+
+    export_file = tempfile.TemporaryFile()
+    try:
+        export_project(project, export_file, dtype=dtype)
+    except Exception as e:
+        export_file.close()
+        logger.error(f"Error exporting project {project_id}: {e}")
+        return jsonify({'message': 'Error exporting project.'}), 500
+
+    export_file.seek(0)
+    return send_file(export_file, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"project_{project_id}.npz")
+
+@bp.route('/<string:project_id>/import', methods=['POST'])
+@project_access_required()
+def import_project_route(project_id):
+    """
+    Loads faces from a project export (sent as the raw request body) into a project.
+    """
+    project = Project.objects(id=project_id).first()
+    if not project:
+        return jsonify({'message': 'Project not found.'}), 404
+
+    stream = get_input_stream(
+        request.environ,
+        max_content_length=current_app.config.get('STREAM_UPLOAD_MAX_CONTENT_LENGTH')
+    )
+
+    # np.load needs a seekable file, so spool the body to disk first
+    with tempfile.TemporaryFile() as import_file:
+        try:
+            shutil.copyfileobj(stream, import_file, 1024 * 1024)
+        except (RequestEntityTooLarge, ClientDisconnected) as e:
+            logger.error(f"Import upload for project {project_id} stopped early: {e}")
+            return jsonify({'message': 'Upload was interrupted.'}), e.code
+        import_file.seek(0)
+
+        try:
+            summary = import_project(project, import_file, mongo_db=current_app.extensions.get('mongo_db'))
+            logger.info(f"Project {project_id} imported by user {get_jwt_identity()}")
+        except ValueError as ve:
+            return jsonify({'message': str(ve)}), 400
+        except Exception as e:
+            logger.error(f"Error importing into project {project_id}: {e}")
+            return jsonify({'message': 'Error importing project.'}), 500
+
+    return jsonify({'message': 'Project imported successfully.', **summary}), 200
@@ -1,35 +1,41 @@
 # app/routes/uniquefaces.py
 
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, Response, request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity
 import logging
+from urllib.parse import urlencode
+from bson import ObjectId
+from bson.errors import InvalidId
 
 from app.models.project import Project
 from app.models.face import Face
-from app.models.user import User
 from app.utils.ml_model import get_unique_faces_for_project
+from app.utils.auth import project_access_required
+from app.utils.clustering import recluster_project, merge_clusters, move_faces, split_cluster, NOISE_LABEL
+from app.utils.jobs import create_job, run_job, active_job_exists, JobConflict
+from app.utils.storage_gc import release_images
+from app.utils.sprites import get_project_sprites, sign_sheet_url, valid_sheet_signature
+from app.utils.conditional import version_etag, not_modified, with_etag
 
 bp = Blueprint('uniquefaces', __name__, url_prefix='/uniquefaces')
 
 logger = logging.getLogger(__name__)
 
 @bp.route('/<string:project_id>', methods=['GET', 'PUT', 'DELETE'])
-@jwt_required()
+@project_access_required()
 def handle_unique_faces(project_id):
     """
     Retrieves, updates, or deletes unique faces within a specific project.
     """
-    user_id = get_jwt_identity()
-    user = User.objects(id=user_id).first()
-
-    if not user:
-        return jsonify({'message': 'User not found.'}), 404
-
-    project = Project.objects(id=project_id, user=user).first()
-    if not project:
-        return jsonify({'message': 'Project not found or not owned by user.'}), 404
-
     if request.method == 'GET':
+        project = Project.objects(id=project_id).only('version').as_pymongo().first()
+        if not project:
+            return jsonify({'message': 'Project not found.'}), 404
+        etag = version_etag('uniquefaces', project_id, project.get('version', 0))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
         try:
             unique_faces_list = get_unique_faces_for_project(project_id)
             if not unique_faces_list:
@@ -38,9 +44,9 @@ def handle_unique_faces(project_id):
             logger.error(f"Error retrieving unique faces for project {project_id}: {e}")
             return jsonify({'message': 'Error retrieving unique faces.', 'error': str(e)}), 500
 
-        return jsonify({
+        return with_etag(jsonify({
             'unique_faces': unique_faces_list
-        }), 200
+        }), etag), 200
 
     elif request.method == 'PUT':
         data = request.get_json()
@@ -50,13 +56,18 @@ def handle_unique_faces(project_id):
         if not face_id or not cluster_label:
             return jsonify({'message': 'face_id and cluster_label are required.'}), 400
 
-        face = Face.objects(id=face_id, project=project).first()
+        if _recluster_running(project_id):
+            return jsonify({'message': 'A re-clustering job is running for this project.'}), 409
+
+        face = Face.objects(id=face_id, project=project_id).first()
         if not face:
             return jsonify({'message': 'Face not found.'}), 404
 
         face.cluster_label = cluster_label
+        face.label_locked = True  # Preserved by re-clustering
         try:
             face.save()
+            Project.bump_version(project_id, 'labels_changed', [face.id])
             logger.info(f"Face {face_id} updated with new cluster label {cluster_label}.")
         except Exception as e:
             logger.error(f"Error updating face {face_id}: {e}")
@@ -71,14 +82,198 @@ def handle_unique_faces(project_id):
         if not face_id:
             return jsonify({'message': 'face_id is required.'}), 400
 
-        face = Face.objects(id=face_id, project=project).first()
+        face = Face.objects(id=face_id, project=project_id).first()
         if not face:
             return jsonify({'message': 'Face not found.'}), 404
 
         try:
             face.delete()
+            Project.bump_version(project_id, 'faces_deleted', [face.id], pull__faces=face.id)
             logger.info(f"Face {face_id} deleted from project {project_id}.")
-            return jsonify({'message': 'Unique face deleted successfully.'}), 200
         except Exception as e:
             logger.error(f"Error deleting face {face_id}: {e}")
             return jsonify({'message': 'Error deleting unique face.'}), 500
+
+        # Release the image once no other face of the project shows it; the
+        # blob itself goes with its last reference across projects
+        try:
+            if not Face.objects(project=project_id, gridfs_id=face.gridfs_id).only('id').first():
+                if release_images(current_app.extensions['mongo_db'], [(face.hash, face.gridfs_id)]):
+                    logger.info(f"Deleted GridFS file {face.gridfs_id} of face {face_id}.")
+        except Exception as e:
+            logger.error(f"Error deleting GridFS file {face.gridfs_id} of face {face_id}: {e}")
+
+        return jsonify({'message': 'Unique face deleted successfully.'}), 200
+
+@bp.route('/<string:project_id>/recluster', methods=['POST'])
+@project_access_required()
+def recluster_unique_faces(project_id):
+    """
+    Starts a background job that re-clusters every face in a project.
+
+    Manually assigned labels are preserved.
+    """
+    if _recluster_running(project_id):
+        return jsonify({'message': 'A re-clustering job is already running for this project.'}), 409
+
+    data = request.get_json(silent=True) or {}
+    try:
+        eps = float(data.get('eps', 0.5))
+        min_samples = int(data.get('min_samples', 1))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'eps must be a number and min_samples an integer.'}), 400
+    if not 0 < eps < 2 or min_samples < 1:
+        return jsonify({'message': 'eps must be between 0 and 2 and min_samples at least 1.'}), 400
+
+    # Exclusive across worker processes; the check above only answers early
+    try:
+        job = create_job('recluster', user_id=get_jwt_identity(), project_id=project_id, exclusive=True)
+    except JobConflict:
+        return jsonify({'message': 'A re-clustering job is already running for this project.'}), 409
+    run_job(job, recluster_project, project_id, eps=eps, min_samples=min_samples,
+            max_neighbors=current_app.config.get('RECLUSTER_MAX_NEIGHBORS', 50),
+            block_bytes=current_app.config.get('RECLUSTER_BLOCK_BYTES', 256 * 1024 * 1024))
+    logger.info(f"Started re-clustering job {job.id} for project {project_id}.")
+
+    return jsonify({'message': 'Re-clustering started.', 'job': job.to_dict()}), 202
+
+def _recluster_running(project_id):
+    return active_job_exists('recluster', project_id)
+
+@bp.route('/<string:project_id>/clusters/merge', methods=['POST'])
+@project_access_required()
+def merge_unique_face_clusters(project_id):
+    """
+    Merges clusters: every face labelled with one of 'source_labels' moves to 'target_label'.
+    """
+    data = request.get_json(silent=True) or {}
+    source_labels = data.get('source_labels')
+    target_label = data.get('target_label')
+
+    if not isinstance(source_labels, list) or not source_labels or not target_label:
+        return jsonify({'message': 'source_labels (a list) and target_label are required.'}), 400
+    if _recluster_running(project_id):
+        return jsonify({'message': 'A re-clustering job is running for this project.'}), 409
+
+    try:
+        updated = merge_clusters(project_id, [str(label) for label in source_labels], str(target_label))
+    except Exception as e:
+        logger.error(f"Error merging clusters in project {project_id}: {e}")
+        return jsonify({'message': 'Error merging clusters.'}), 500
+
+    return jsonify({'message': 'Clusters merged successfully.', 'updated': updated}), 200
+
+@bp.route('/<string:project_id>/clusters/move', methods=['POST'])
+@project_access_required()
+def move_unique_faces(project_id):
+    """
+    Moves many faces, given as 'face_ids', to 'cluster_label'.
+    """
+    data = request.get_json(silent=True) or {}
+    face_ids = data.get('face_ids')
+    cluster_label = data.get('cluster_label')
+
+    if not isinstance(face_ids, list) or not face_ids or not cluster_label:
+        return jsonify({'message': 'face_ids (a list) and cluster_label are required.'}), 400
+    try:
+        face_ids = [ObjectId(face_id) for face_id in face_ids]
+    except (InvalidId, TypeError):
+        return jsonify({'message': 'face_ids must be valid face IDs.'}), 400
+    if _recluster_running(project_id):
+        return jsonify({'message': 'A re-clustering job is running for this project.'}), 409
+
+    try:
+        updated = move_faces(project_id, face_ids, str(cluster_label))
+    except Exception as e:
+        logger.error(f"Error moving faces in project {project_id}: {e}")
+        return jsonify({'message': 'Error moving faces.'}), 500
+
+    return jsonify({'message': 'Faces moved successfully.', 'updated': updated,
+                    'not_found': len(face_ids) - updated}), 200
+
+@bp.route('/<string:project_id>/clusters/<string:cluster_label>/split', methods=['POST'])
+@project_access_required()
+def split_unique_face_cluster(project_id, cluster_label):
+    """
+    Splits a cluster by re-clustering its faces at a tighter eps (default 0.35).
+    """
+    if cluster_label == NOISE_LABEL:
+        return jsonify({'message': 'The noise cluster cannot be split.'}), 400
+
+    data = request.get_json(silent=True) or {}
+    try:
+        eps = float(data.get('eps', 0.35))
+        min_samples = int(data.get('min_samples', 1))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'eps must be a number and min_samples an integer.'}), 400
+    if not 0 < eps < 2 or min_samples < 1:
+        return jsonify({'message': 'eps must be between 0 and 2 and min_samples at least 1.'}), 400
+    if _recluster_running(project_id):
+        return jsonify({'message': 'A re-clustering job is running for this project.'}), 409
+
+    try:
+        clusters = split_cluster(project_id, cluster_label, eps=eps, min_samples=min_samples)
+    except Exception as e:
+        logger.error(f"Error splitting cluster {cluster_label} in project {project_id}: {e}")
+        return jsonify({'message': 'Error splitting cluster.'}), 500
+
+    if not clusters:
+        return jsonify({'message': 'Cluster not found.'}), 404
+    return jsonify({'message': 'Cluster split successfully.', 'clusters': clusters}), 200
+
+@bp.route('/<string:project_id>/sprites', methods=['GET'])
+@project_access_required()
+def get_unique_face_sprites(project_id):
+    """
+    Returns the atlas of the project's sprite sheets: for every cluster
+    representative, the sheet and pixel offset of its face crop.
+    """
+    try:
+        atlas, _ = get_project_sprites(project_id)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error building sprites for project {project_id}: {e}")
+        return jsonify({'message': 'Error building sprites.'}), 500
+
+    # Sheets are loaded by <img> tags, which cannot send the Authorization
+    # header; their URLs carry a short-lived signature scoped to the sheet
+    base_url = current_app.config.get('BASE_URL')
+    sheets = [dict(sheet, url=f"{base_url}/uniquefaces/{project_id}/sprites/{sheet['index']}?"
+                              f"{urlencode(sign_sheet_url(project_id, sheet['index'], atlas['version']))}")
+              for sheet in atlas['sheets']]
+    return jsonify(dict(atlas, sheets=sheets)), 200
+
+@bp.route('/<string:project_id>/sprites/<int:sheet>', methods=['GET'])
+def get_unique_face_sprite_sheet(project_id, sheet):
+    """
+    Serves one JPEG sprite sheet, to a signed URL from the atlas or to a JWT
+    in the headers or cookies. URLs carrying the current version (?v=) may be
+    cached by the browser.
+    """
+    if valid_sheet_signature(project_id, sheet, request.args):
+        return _serve_sprite_sheet(project_id, sheet)
+    return _serve_sprite_sheet_with_jwt(project_id=project_id, sheet=sheet)
+
+@project_access_required(locations=["headers", "cookies"])
+def _serve_sprite_sheet_with_jwt(project_id, sheet):
+    return _serve_sprite_sheet(project_id, sheet)
+
+def _serve_sprite_sheet(project_id, sheet):
+    try:
+        atlas, sheets = get_project_sprites(project_id)
+    except ValueError:
+        return Response(status=404)
+    except Exception as e:
+        logger.error(f"Error building sprites for project {project_id}: {e}")
+        return Response(status=500)
+    if sheet >= len(sheets):
+        return Response(status=404)
+
+    response = Response(sheets[sheet], mimetype='image/jpeg')
+    response.set_etag(f"{project_id}-{atlas['version']}-{sheet}")
+    if request.args.get('v') == str(atlas['version']):
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
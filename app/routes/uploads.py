@@ -0,0 +1,164 @@
+# app/routes/uploads.py
+
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity
+from werkzeug.http import parse_content_range_header
+from werkzeug.utils import secure_filename
+from bson import ObjectId
+from bson.errors import InvalidId
+import logging
+
+from app.models.face import Face
+from app.models.project import Project
+from app.models.upload_session import UploadSession
+from app.utils.auth import project_access_required
+from app.utils.image_processing import allowed_file
+from app.utils.ml_model import process_new_images
+from app.utils.jobs import create_job, run_job
+from app.utils.blob_store import acquire_blob
+from app.utils.resumable_upload import (create_session, write_range, finalize_session, delete_chunks,
+                                        sweep_expired_sessions, UploadConflict, UploadInProgress)
+
+bp = Blueprint('uploads', __name__, url_prefix='/uploads')
+
+logger = logging.getLogger(__name__)
+
+def _get_session(project_id, upload_id):
+    try:
+        return UploadSession.objects(id=ObjectId(upload_id), project=ObjectId(project_id),
+                                     user=ObjectId(get_jwt_identity())).first()
+    except (InvalidId, TypeError):
+        return None
+
+def _conflict(offset):
+    response = jsonify({'message': 'Range does not start at the committed offset.', 'offset': offset})
+    response.headers['Upload-Offset'] = str(offset)
+    return response, 409
+
+@bp.route('/<string:project_id>', methods=['POST'])
+@project_access_required()
+def create_upload(project_id):
+    """
+    Opens a resumable upload of one image. Expects JSON with 'filename',
+    'size' and optionally 'sha256'.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    sha256 = data.get('sha256')
+
+    if not allowed_file(filename):
+        return jsonify({'message': f'File type not allowed for file {filename}.'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'size is required and must be an integer.'}), 400
+    max_size = current_app.config.get('STREAM_UPLOAD_MAX_FILE_SIZE', 64 * 1024 * 1024)
+    if not 0 < size <= max_size:
+        return jsonify({'message': f'size must be between 1 and {max_size} bytes.'}), 400
+    if sha256 is not None and (not isinstance(sha256, str) or len(sha256) != 64):
+        return jsonify({'message': 'sha256 must be a hex digest.'}), 400
+
+    mongo_db = current_app.extensions['mongo_db']
+    sweep_expired_sessions(mongo_db)
+
+    session = create_session(get_jwt_identity(), project_id, secure_filename(filename), size, sha256=sha256,
+                             ttl=current_app.config.get('UPLOAD_SESSION_TTL', 86400))
+    logger.info(f"Opened upload {session.id} of {size} bytes for project {project_id}.")
+    return jsonify(session.to_dict()), 201
+
+@bp.route('/<string:project_id>/<string:upload_id>', methods=['GET', 'PUT', 'DELETE'])
+@project_access_required()
+def handle_upload(project_id, upload_id):
+    """
+    GET reports the committed offset, PUT appends the byte range given by the
+    Content-Range header, and DELETE abandons the upload.
+    """
+    session = _get_session(project_id, upload_id)
+    if not session:
+        return jsonify({'message': 'Upload not found.'}), 404
+
+    if request.method == 'GET':
+        response = jsonify(session.to_dict())
+        response.headers['Upload-Offset'] = str(session.offset)
+        return response, 200
+
+    mongo_db = current_app.extensions['mongo_db']
+
+    if request.method == 'DELETE':
+        if session.status != 'finalized':
+            delete_chunks(mongo_db, session.file_id)
+        session.delete()
+        return jsonify({'message': 'Upload deleted.'}), 200
+
+    if session.status != 'open':
+        return jsonify({'message': 'Upload is already finalized.'}), 409
+
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is None or content_range.units != 'bytes' or content_range.start is None:
+        return jsonify({'message': 'A Content-Range header (bytes start-end/size) is required.'}), 400
+    if content_range.length not in (None, session.size):
+        return jsonify({'message': 'Content-Range size does not match the upload size.'}), 400
+
+    try:
+        offset = write_range(session, content_range.start, content_range.stop - content_range.start,
+                             request.stream, mongo_db, ttl=current_app.config.get('UPLOAD_SESSION_TTL', 86400))
+    except UploadConflict as conflict:
+        return _conflict(conflict.offset)
+    except UploadInProgress as busy:
+        response = jsonify({'message': str(busy), 'offset': session.offset})
+        response.headers['Retry-After'] = str(busy.retry_after)
+        return response, 409
+    except ValueError as ve:
+        return jsonify({'message': str(ve)}), 400
+    except Exception as e:
+        logger.error(f"Error writing to upload {upload_id}: {e}")
+        return jsonify({'message': 'Error storing upload data.'}), 500
+
+    response = jsonify({'offset': offset, 'size': session.size})
+    response.headers['Upload-Offset'] = str(offset)
+    return response, 200
+
+@bp.route('/<string:project_id>/<string:upload_id>/finalize', methods=['POST'])
+@project_access_required()
+def finalize_upload(project_id, upload_id):
+    """
+    Verifies the SHA-256 of a complete upload, stores it as a GridFS file
+    and starts face processing in the background.
+    """
+    session = _get_session(project_id, upload_id)
+    if not session:
+        return jsonify({'message': 'Upload not found.'}), 404
+    if session.status == 'finalized':
+        return jsonify({'message': 'Upload already finalized.', 'upload': session.to_dict()}), 200
+
+    data = request.get_json(silent=True) or {}
+    mongo_db = current_app.extensions['mongo_db']
+    try:
+        image_data = finalize_session(session, mongo_db, sha256=data.get('sha256'))
+    except UploadConflict as conflict:
+        return _conflict(conflict.offset)
+    except ValueError as ve:
+        return jsonify({'message': str(ve)}), 422
+
+    existing_face = Face.objects(hash=image_data['hash'], project=project_id).only('id').first()
+    if existing_face:
+        mongo_db.fs.files.delete_one({'_id': session.file_id})
+        delete_chunks(mongo_db, session.file_id)
+        session.update(set__face_id=str(existing_face.id))
+        return jsonify({'message': 'Duplicate image detected.', 'face_id': str(existing_face.id)}), 200
+
+    # Another project may already hold the same bytes; keep only one copy
+    image_data['gridfs_id'], _ = acquire_blob(image_data['hash'], current_app.extensions['grid_fs'],
+                                              gridfs_id=image_data['gridfs_id'], size=image_data['size'])
+    face = Face(gridfs_id=image_data['gridfs_id'], project=ObjectId(project_id), hash=image_data['hash'],
+                cluster_label=None, encoding=None).save()
+    Project.bump_version(project_id, 'faces_added', [face.id], push__faces=face.id)
+
+    job = create_job('upload', user_id=get_jwt_identity(), project_id=project_id)
+    run_job(job, lambda job: process_new_images([image_data], project_id))
+    session.update(set__face_id=str(face.id), set__job_id=job.id)
+    logger.info(f"Upload {upload_id} stored as face {face.id}; processing in job {job.id}.")
+
+    session.reload()
+    return jsonify({'message': 'Upload finalized. Processing in background.', 'upload': session.to_dict(),
+                    'job': job.to_dict()}), 202
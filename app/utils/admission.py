@@ -0,0 +1,225 @@
+# app/utils/admission.py
+
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+import itertools
+import logging
+import math
+import threading
+import time
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted before its deadline.
+    """
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Ticket:
+    __slots__ = ('user_id', 'seq')
+
+    def __init__(self, user_id, seq):
+        self.user_id = user_id
+        self.seq = seq
+
+class AdmissionController:
+    """
+    Caps concurrent expensive requests per process with a bounded, fair wait queue.
+
+    At most `slots` requests run at once and at most `per_user_slots` of them
+    belong to the same user. Waiting requests are admitted in order of how
+    few slots their user already holds, then arrival, so one heavy user cannot
+    monopolize the model. Requests that cannot be queued, or that wait longer
+    than `max_wait` seconds, are rejected immediately with a Retry-After hint.
+    """
+    def __init__(self, name, slots, max_queue, max_wait, per_user_slots=None):
+        self.name = name
+        self.slots = slots
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.per_user_slots = per_user_slots or slots
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = 0
+        self._running_by_user = defaultdict(int)
+        self._seq = itertools.count()
+        self._service_time = 1.0  # Moving average of seconds per request
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def acquire(self, user_id):
+        """
+        Waits for a slot for the user.
+
+        Returns:
+            _Ticket: Ticket to pass to release().
+
+        Raises:
+            AdmissionRejected: If the queue is full or the deadline passes.
+        """
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected('queue full', self._retry_after())
+
+            ticket = _Ticket(user_id, next(self._seq))
+            self._waiting.append(ticket)
+            deadline = time.monotonic() + self.max_wait
+
+            while self._next_eligible() is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self.rejected_timeout += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected('timed out waiting for a slot', self._retry_after())
+                self._cond.wait(remaining)
+
+            self._waiting.remove(ticket)
+            self._running += 1
+            self._running_by_user[user_id] += 1
+            self.admitted += 1
+            # Another slot may still be free for the next waiter
+            self._cond.notify_all()
+            return ticket
+
+    def release(self, ticket, elapsed=None):
+        with self._cond:
+            self._running -= 1
+            self._running_by_user[ticket.user_id] -= 1
+            if not self._running_by_user[ticket.user_id]:
+                del self._running_by_user[ticket.user_id]
+            if elapsed is not None:
+                self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+            self._cond.notify_all()
+
+    def _next_eligible(self):
+        if self._running >= self.slots:
+            return None
+        held = self._running_by_user
+        eligible = [ticket for ticket in self._waiting if held.get(ticket.user_id, 0) < self.per_user_slots]
+        if not eligible:
+            return None
+        return min(eligible, key=lambda ticket: (held.get(ticket.user_id, 0), ticket.seq))
+
+    def _retry_after(self):
+        # Time for the current queue to drain through the available slots
+        backlog = len(self._waiting) + self._running + 1
+        return max(1, math.ceil(self._service_time * backlog / self.slots))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'in_flight': self._running,
+                'queue_depth': len(self._waiting),
+                'max_queue': self.max_queue,
+                'active_users': len(self._running_by_user),
+                'admitted': self.admitted,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_timeout': self.rejected_timeout,
+                'avg_service_seconds': round(self._service_time, 3)
+            }
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def get_controller(name):
+    """
+    Returns the process-wide controller for a class of work, configured from
+    '<NAME>_SLOTS', '<NAME>_QUEUE_SIZE', '<NAME>_QUEUE_TIMEOUT' and '<NAME>_SLOTS_PER_USER'.
+    """
+    with _controllers_lock:
+        controller = _controllers.get(name)
+        if controller is None:
+            prefix = name.upper()
+            config = current_app.config
+            controller = AdmissionController(
+                name,
+                slots=config.get(f'{prefix}_SLOTS', 2),
+                max_queue=config.get(f'{prefix}_QUEUE_SIZE', 16),
+                max_wait=config.get(f'{prefix}_QUEUE_TIMEOUT', 10),
+                per_user_slots=config.get(f'{prefix}_SLOTS_PER_USER')
+            )
+            _controllers[name] = controller
+            metrics.register_provider(f'admission.{name}', controller.stats)
+        return controller
+
+def admission_controlled(name):
+    """
+    Runs the route inside a slot of the named controller, answering 503 with
+    Retry-After when the process is saturated.
+
+    Must be applied below the JWT check so the caller's identity is known.
+    A multipart body is received before the slot is requested, so a slow
+    client uploading images never holds a slot during the transfer.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.mimetype == 'multipart/form-data':
+                request.files  # Parses (and spools) the whole body
+            controller = get_controller(name)
+            user_id = get_jwt_identity()
+            try:
+                ticket = controller.acquire(user_id)
+            except AdmissionRejected as rejected:
+                logger.warning(f"Rejected {name} request from user {user_id}: {rejected.reason}.")
+                response = jsonify({'message': 'Server is busy. Please retry later.'})
+                response.headers['Retry-After'] = str(rejected.retry_after)
+                return response, 503
+
+            started = time.monotonic()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                controller.release(ticket, elapsed=time.monotonic() - started)
+        return wrapper
+    return decorator
+
+_model_semaphore = None
+_model_lock = threading.Lock()
+_model_stats = {'in_flight': 0, 'waiting': 0}
+
+def _model_stats_snapshot():
+    with _model_lock:
+        return dict(_model_stats, slots=current_app.config.get('MODEL_CONCURRENCY', 4))
+
+@contextmanager
+def model_slot():
+    """
+    Holds one of MODEL_CONCURRENCY process-wide slots around a model call.
+
+    Unlike admission_controlled, which sheds HTTP requests, this blocks, so
+    every inference path (interactive and streaming uploads, archive imports,
+    videos, resumable uploads, searches) is bounded by the same limit without
+    failing background work. Slots are held only while the model runs, never
+    during network transfers.
+    """
+    global _model_semaphore
+    with _model_lock:
+        if _model_semaphore is None:
+            _model_semaphore = threading.BoundedSemaphore(current_app.config.get('MODEL_CONCURRENCY', 4))
+            metrics.register_provider('admission.model', _model_stats_snapshot)
+        semaphore = _model_semaphore
+        _model_stats['waiting'] += 1
+    semaphore.acquire()
+    with _model_lock:
+        _model_stats['waiting'] -= 1
+        _model_stats['in_flight'] += 1
+    try:
+        yield
+    finally:
+        with _model_lock:
+            _model_stats['in_flight'] -= 1
+        semaphore.release()
@@ -0,0 +1,234 @@
+# app/utils/archive_import.py
+
+import io
+import os
+import hashlib
+import logging
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from werkzeug.utils import secure_filename
+
+from app.models.face import Face
+from app.models.project import Project
+from app.utils.image_processing import allowed_file, is_image_file
+from app.utils.ml_model import extract_faces_for_image, cluster_and_store_faces
+from app.utils.blob_store import acquire_blob
+from app.utils import background
+
+logger = logging.getLogger(__name__)
+
+ZIP_MAGIC = b'PK\x03\x04'
+ZIP_CONTENT_TYPES = {'application/zip', 'application/x-zip-compressed'}
+TAR_CONTENT_TYPES = {'application/x-tar', 'application/gzip', 'application/x-gzip', 'application/x-gtar'}
+
+class _PrefixedStream(io.RawIOBase):
+    """
+    Re-attaches bytes already read for format sniffing to the front of a stream.
+    """
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._stream.read(), b''
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+def open_archive_stream(stream, content_type=None):
+    """
+    Works out whether a request body is a ZIP or TAR archive.
+
+    Args:
+        stream (io.RawIOBase): Request body stream.
+        content_type (str, optional): Mimetype sent by the client.
+
+    Returns:
+        tuple: (archive_format, stream) where archive_format is 'zip', 'tar' or None,
+        and stream still yields the complete body.
+    """
+    head = stream.read(len(ZIP_MAGIC))
+    stream = _PrefixedStream(head, stream)
+
+    if content_type in ZIP_CONTENT_TYPES or head == ZIP_MAGIC:
+        return 'zip', stream
+    if content_type in TAR_CONTENT_TYPES or head:
+        # tarfile's streaming mode detects plain, gzip, bz2 and xz tarballs itself
+        return 'tar', stream
+    return None, stream
+
+def iter_archive_members(stream, archive_format, max_member_size, spool_size=32 * 1024 * 1024):
+    """
+    Iterates the regular file members of an archive without extracting it to disk.
+
+    TAR archives are read strictly sequentially from the stream. ZIP keeps its
+    directory at the end of the file, so the raw archive is spooled (in memory
+    up to spool_size, then to a temporary file) and members are read from it.
+
+    Args:
+        stream (io.RawIOBase): Archive byte stream.
+        archive_format (str): 'zip' or 'tar'.
+        max_member_size (int): Members larger than this are rejected unread.
+        spool_size (int, optional): In-memory spool limit for ZIP archives.
+
+    Yields:
+        dict: 'name' and 'data' for each member, or 'name' and 'error' if it was skipped.
+    """
+    if archive_format == 'zip':
+        with tempfile.SpooledTemporaryFile(max_size=spool_size) as spool:
+            shutil.copyfileobj(stream, spool, 1024 * 1024)
+            spool.seek(0)
+            with zipfile.ZipFile(spool) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > max_member_size:
+                        yield {'name': info.filename, 'error': 'File exceeds the maximum allowed size.'}
+                        continue
+                    with archive.open(info) as member:
+                        yield {'name': info.filename, 'data': member.read(max_member_size)}
+    else:
+        with tarfile.open(fileobj=stream, mode='r|*') as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                if info.size > max_member_size:
+                    yield {'name': info.name, 'error': 'File exceeds the maximum allowed size.'}
+                    continue
+                member = archive.extractfile(info)
+                yield {'name': info.name, 'data': member.read()}
+
+def import_archive(job, stream, archive_format, project, grid_fs, batch_size=64,
+                   max_member_size=64 * 1024 * 1024):
+    """
+    Stores every new image in an archive and queues it for feature extraction.
+
+    Members are validated and hashed one by one, then deduplicated in batches
+    with a single query per batch before being written to GridFS.
+
+    Args:
+        job (Job): Job used for progress reporting.
+        stream (io.RawIOBase): Archive byte stream.
+        archive_format (str): 'zip' or 'tar'.
+        project (Project): Project to import into.
+        grid_fs (gridfs.GridFS): GridFS instance.
+        batch_size (int, optional): Images deduplicated and stored per batch.
+        max_member_size (int, optional): Largest accepted image size.
+
+    Returns:
+        List[tuple]: (image_data, future) pairs for the queued extractions.
+    """
+    pending = []
+    batch = []
+
+    for member in iter_archive_members(stream, archive_format, max_member_size):
+        name = member['name']
+        basename = os.path.basename(name)
+        # Skip metadata entries such as __MACOSX/._IMG_0001.jpg
+        if not basename or basename.startswith('.') or '__MACOSX/' in name:
+            continue
+
+        job.increment('members_seen')
+        if 'error' in member or not allowed_file(basename):
+            job.increment('rejected')
+            continue
+
+        image_bytes = member['data']
+        if not is_image_file(io.BytesIO(image_bytes)):
+            logger.warning(f"Archive member {name} is not a valid image.")
+            job.increment('rejected')
+            continue
+
+        batch.append({
+            'original_filename': secure_filename(basename),
+            'hash': hashlib.sha256(image_bytes).hexdigest(),
+            'data': image_bytes
+        })
+        if len(batch) >= batch_size:
+            _store_batch(job, batch, project, grid_fs, pending)
+            batch = []
+
+    if batch:
+        _store_batch(job, batch, project, grid_fs, pending)
+
+    logger.info(f"Archive import {job.id} stored {len(pending)} new images for project {project.id}.")
+    return pending
+
+def _store_batch(job, batch, project, grid_fs, pending):
+    """
+    Drops duplicates from a batch, stores the rest and queues them for extraction.
+    """
+    existing_hashes = set(Face.objects(project=project, hash__in=[item['hash'] for item in batch])
+                          .distinct('hash'))
+
+    stored = []
+    new_faces = []
+    for item in batch:
+        if item['hash'] in existing_hashes:
+            job.increment('duplicates')
+            continue
+        existing_hashes.add(item['hash'])  # Also catches duplicates within the archive
+
+        try:
+            gridfs_id, deduplicated = acquire_blob(item['hash'], grid_fs, data=item.pop('data'),
+                                                   filename=item['original_filename'])
+        except Exception as e:
+            logger.error(f"Error storing image {item['original_filename']} in GridFS: {e}")
+            job.increment('errors')
+            continue
+
+        if deduplicated:
+            job.increment('deduplicated')
+        item['gridfs_id'] = str(gridfs_id)
+        stored.append(item)
+        new_faces.append(Face(gridfs_id=item['gridfs_id'], project=project, hash=item['hash'],
+                              cluster_label=None, encoding=None))
+
+    if not new_faces:
+        return
+
+    # One bulk insert and one project update per batch
+    face_ids = Face.objects.insert(new_faces, load_bulk=False)
+    Project.bump_version(project.id, 'faces_added', face_ids, push_all__faces=face_ids)
+    job.increment('images_stored', len(stored))
+
+    for image_data, face_id in zip(stored, face_ids):
+        image_data['face_id'] = str(face_id)
+        future = background.submit('ingest', extract_faces_for_image, image_data)
+        future.add_done_callback(lambda _: job.increment('images_processed'))
+        pending.append((image_data, future))
+
+def finish_archive_import(job, pending, project_id):
+    """
+    Waits for queued extractions and clusters the imported faces.
+
+    Intended to run as the body of a background job.
+
+    Returns:
+        dict: Summary of the import.
+    """
+    records = []
+    for image_data, future in pending:
+        try:
+            records.extend(future.result())
+        except Exception as e:
+            logger.error(f"Error extracting features from image {image_data['gridfs_id']}: {e}")
+            job.increment('errors')
+
+    job.update(faces_detected=len(records))
+    cluster_and_store_faces(records, project_id)
+
+    return {
+        'images_imported': len(pending),
+        'faces_detected': len(records)
+    }
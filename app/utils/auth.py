@@ -0,0 +1,149 @@
+# app/utils/auth.py
+
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from mongoengine.errors import ValidationError
+import logging
+
+from app.models.face import Face
+from app.models.project import Project
+from app.models.user import User
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Entries live for a short time so other worker processes converge after a change
+AUTH_CACHE_TTL = 60
+
+_users = TTLCache(AUTH_CACHE_TTL)        # user_id -> exists
+_ownership = TTLCache(AUTH_CACHE_TTL)    # (user_id, project_id) -> owned
+_image_projects = TTLCache(AUTH_CACHE_TTL)  # gridfs_id -> project ids referencing it
+
+def user_exists(user_id):
+    """
+    Checks that the user behind a JWT identity still exists.
+    """
+    exists = _users.get(user_id)
+    if exists is None:
+        try:
+            exists = User.objects(id=user_id).only('id').first() is not None
+        except ValidationError:
+            exists = False
+        _users.set(user_id, exists)
+    return exists
+
+def owns_project(user_id, project_id):
+    """
+    Checks that a project exists and belongs to the user.
+    """
+    key = (str(user_id), str(project_id))
+    owned = _ownership.get(key)
+    if owned is None:
+        try:
+            owned = Project.objects(id=project_id, user=user_id).only('id').first() is not None
+        except ValidationError:
+            owned = False
+        _ownership.set(key, owned)
+    return owned
+
+def owns_image(user_id, gridfs_id):
+    """
+    Checks that a GridFS image belongs to one of the user's projects.
+
+    Images are shared between projects that uploaded the same bytes, so a
+    cached project list that denies access is refreshed once before refusing;
+    another worker process may just have added the user's project.
+    """
+    project_ids = _image_projects.get(gridfs_id)
+    if project_ids is not None and any(owns_project(user_id, project_id) for project_id in project_ids):
+        return True
+    project_ids = tuple(str(project_id) for project_id
+                        in Face._get_collection().distinct('project', {'gridfs_id': gridfs_id}))
+    if project_ids:
+        _image_projects.set(gridfs_id, project_ids)
+    else:
+        _image_projects.pop(gridfs_id)
+    return any(owns_project(user_id, project_id) for project_id in project_ids)
+
+def invalidate_image(gridfs_id):
+    """
+    Drops the cached projects of an image (e.g. after a project started or stopped sharing it).
+    """
+    _image_projects.pop(str(gridfs_id))
+
+def invalidate_project(project_id):
+    """
+    Drops cached ownership of a project (e.g. after it was deleted).
+    """
+    project_id = str(project_id)
+    _ownership.invalidate(lambda key: key[1] == project_id)
+    _image_projects.invalidate(lambda key: True)
+
+def invalidate_user(user_id):
+    """
+    Drops everything cached for a user (e.g. after their profile changed).
+    """
+    user_id = str(user_id)
+    _users.pop(user_id)
+    _ownership.invalidate(lambda key: key[0] == user_id)
+
+def project_access_required(locations=None):
+    """
+    Requires a valid JWT whose user owns the project in the route's project_id argument.
+
+    Ownership lookups are cached, so steady-state requests make no auth queries.
+
+    Args:
+        locations (List[str], optional): Where to look for the JWT, as for jwt_required.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required(locations=locations)
+        def wrapper(*args, **kwargs):
+            user_id = get_jwt_identity()
+            if not user_exists(user_id):
+                return jsonify({'message': 'User not found.'}), 404
+            if not owns_project(user_id, kwargs['project_id']):
+                return jsonify({'message': 'Project not found or not owned by user.'}), 404
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def image_access_required(locations=None):
+    """
+    Requires a valid JWT whose user owns a project containing the route's gridfs_id image.
+
+    Args:
+        locations (List[str], optional): Where to look for the JWT, as for jwt_required.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required(locations=locations)
+        def wrapper(*args, **kwargs):
+            user_id = get_jwt_identity()
+            if not user_exists(user_id) or not owns_image(user_id, kwargs['gridfs_id']):
+                return '', 404
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def admin_required():
+    """
+    Requires a valid JWT whose user is an administrator.
+
+    Not cached, so revoking the flag takes effect on the next request.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            try:
+                user = User.objects(id=get_jwt_identity()).only('is_admin').first()
+            except ValidationError:
+                user = None
+            if not user or user.is_admin != 'true':
+                return jsonify({'message': 'Administrator access required.'}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,53 @@
+# app/utils/background.py
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Named thread pools, created lazily on first use
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(pool_name):
+    """
+    Returns the shared thread pool for the given name, creating it on first use.
+
+    The pool size is read from the '<POOL_NAME>_WORKERS' config value.
+
+    Args:
+        pool_name (str): Name of the pool (e.g. 'ingest').
+
+    Returns:
+        ThreadPoolExecutor: The pool.
+    """
+    with _executors_lock:
+        executor = _executors.get(pool_name)
+        if executor is None:
+            max_workers = current_app.config.get(f'{pool_name.upper()}_WORKERS', 2)
+            executor = ThreadPoolExecutor(max_workers=max_workers,
+                                          thread_name_prefix=f'pikieye-{pool_name}')
+            _executors[pool_name] = executor
+            logger.info(f"Started '{pool_name}' worker pool with {max_workers} threads.")
+        return executor
+
+def submit(pool_name, fn, *args, **kwargs):
+    """
+    Runs a function on a named pool inside the current Flask application context.
+
+    Args:
+        pool_name (str): Name of the pool.
+        fn (callable): Function to run.
+
+    Returns:
+        concurrent.futures.Future: Future holding the function's result.
+    """
+    app = current_app._get_current_object()
+
+    def run_in_app_context():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return get_executor(pool_name).submit(run_in_app_context)
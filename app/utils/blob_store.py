@@ -0,0 +1,161 @@
+# app/utils/blob_store.py
+
+from collections import Counter
+import json
+import logging
+import numpy as np
+from bson import ObjectId
+from mongoengine.errors import NotUniqueError
+from pymongo import ReturnDocument
+
+from app.models.blob import Blob
+from app.utils.auth import invalidate_image
+
+logger = logging.getLogger(__name__)
+
+def _collection():
+    return Blob._get_collection()
+
+def acquire_blob(image_hash, grid_fs, data=None, gridfs_id=None, size=None, filename=None, content_type=None):
+    """
+    Adds a reference to the blob holding the given content, storing it first if it is new.
+
+    Either pass the bytes in data, or pass the gridfs_id of a copy already
+    written (e.g. by a streaming upload); a redundant copy is deleted.
+
+    Args:
+        image_hash (str): SHA-256 of the content.
+        grid_fs (gridfs.GridFS): GridFS instance.
+        data (bytes, optional): The content.
+        gridfs_id (str, optional): An already stored copy of the content.
+        size (int, optional): Size of that copy.
+        filename (str, optional): Name stored with a new GridFS file.
+        content_type (str, optional): Content type stored with a new GridFS file.
+
+    Returns:
+        tuple: (gridfs_id of the shared blob, True if the content was already stored).
+    """
+    while True:
+        existing = _collection().find_one_and_update(
+            {'_id': image_hash}, {'$inc': {'refcount': 1, 'uploads': 1}},
+            projection={'gridfs_id': 1}, return_document=ReturnDocument.AFTER)
+        if existing:
+            if gridfs_id is not None and gridfs_id != existing['gridfs_id']:
+                grid_fs.delete(ObjectId(gridfs_id))
+            # The image gains a project; cached ownership must not deny the new owner
+            invalidate_image(existing['gridfs_id'])
+            return existing['gridfs_id'], True
+
+        if gridfs_id is None:
+            gridfs_id = str(grid_fs.put(data, filename=filename, content_type=content_type))
+            size = len(data)
+        try:
+            Blob(sha256=image_hash, gridfs_id=gridfs_id, size=size or 0, refcount=1, uploads=1).save(force_insert=True)
+            return gridfs_id, False
+        except NotUniqueError:
+            # Another upload stored the same content meanwhile; reference theirs instead
+            continue
+
+def retain_blobs(images):
+    """
+    Adds a reference per (image_hash, gridfs_id) pair, for faces linked to
+    stored content without an upload (e.g. by a project import). Pairs whose
+    file is not the blob of that hash are ignored.
+    """
+    for (image_hash, gridfs_id), count in Counter(images).items():
+        _collection().update_one({'_id': image_hash, 'gridfs_id': gridfs_id}, {'$inc': {'refcount': count}})
+
+def release_blobs(images):
+    """
+    Drops a reference per (image_hash, gridfs_id) pair and forgets blobs whose
+    last reference went.
+
+    Args:
+        images (List[tuple]): (image_hash, gridfs_id) of project images no longer stored.
+
+    Returns:
+        tuple: (gridfs_ids of the freed blobs, for the caller to delete;
+        gridfs_ids not counted by any blob, e.g. stored before content
+        addressing, whose references the caller must check itself).
+    """
+    freed = []
+    uncounted = []
+    for (image_hash, gridfs_id), count in Counter(images).items():
+        blob = None
+        if image_hash:
+            blob = _collection().find_one_and_update(
+                {'_id': image_hash, 'gridfs_id': gridfs_id}, {'$inc': {'refcount': -count}},
+                projection={'refcount': 1}, return_document=ReturnDocument.AFTER)
+        invalidate_image(gridfs_id)
+        if blob is None:
+            uncounted.append(gridfs_id)
+        elif blob['refcount'] <= 0:
+            # Conditional, so a concurrent acquire_blob that revived the blob wins
+            if _collection().delete_one({'_id': image_hash, 'refcount': {'$lte': 0}}).deleted_count:
+                freed.append(gridfs_id)
+    return freed, uncounted
+
+def shared_gridfs_ids(gridfs_ids):
+    """
+    Returns the given GridFS IDs that belong to a blob still referenced.
+    """
+    return set(_collection().distinct('gridfs_id', {'gridfs_id': {'$in': list(gridfs_ids)}, 'refcount': {'$gt': 0}}))
+
+def forget_blobs(gridfs_ids):
+    """
+    Drops the blob documents of deleted GridFS files.
+    """
+    return _collection().delete_many({'gridfs_id': {'$in': list(gridfs_ids)}}).deleted_count
+
+def cached_records(image_hash, extractor):
+    """
+    Returns the face records extracted earlier from the same content with the
+    same settings, or None.
+    """
+    blob = _collection().find_one_and_update(
+        {'_id': image_hash, 'extractor': extractor, 'records': {'$ne': None}},
+        {'$inc': {'reuses': 1}}, projection={'records': 1})
+    if blob is None:
+        return None
+    records = json.loads(blob['records'])
+    for record in records:
+        record['embedding'] = np.asarray(record['embedding'], dtype=np.float32)
+    return records
+
+def store_records(image_hash, extractor, records):
+    """
+    Caches the face records of a blob's content for later uploads of the same bytes.
+
+    Does nothing when the blob is not stored (yet), e.g. when extraction of an
+    in-memory upload finished before its GridFS write.
+    """
+    serialized = [dict(record, embedding=np.asarray(record['embedding']).tolist()) for record in records]
+    # default= converts NumPy scalars such as quality scores
+    _collection().update_one({'_id': image_hash}, {'$set': {
+        'records': json.dumps(serialized, default=lambda value: value.item()),
+        'extractor': extractor
+    }})
+
+def storage_report():
+    """
+    Summarizes what content addressing saved.
+
+    Returns:
+        dict: Blob and reference counts, stored bytes, bytes that duplicate
+        uploads would have added, and extractions skipped.
+    """
+    totals = list(_collection().aggregate([{'$group': {
+        '_id': None,
+        'blobs': {'$sum': 1},
+        'references': {'$sum': '$refcount'},
+        'uploads': {'$sum': '$uploads'},
+        'stored_bytes': {'$sum': '$size'},
+        'deduplicated_bytes': {'$sum': {'$multiply': ['$size', {'$subtract': ['$uploads', 1]}]}},
+        'extractions_saved': {'$sum': '$reuses'},
+        'shared_blobs': {'$sum': {'$cond': [{'$gt': ['$refcount', 1]}, 1, 0]}}
+    }}]))
+    report = totals[0] if totals else {'blobs': 0, 'references': 0, 'uploads': 0, 'stored_bytes': 0,
+                                       'deduplicated_bytes': 0, 'extractions_saved': 0, 'shared_blobs': 0}
+    report.pop('_id', None)
+    report['duplicate_uploads'] = report['uploads'] - report['blobs']
+    return report
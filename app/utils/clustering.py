@@ -0,0 +1,357 @@
+# app/utils/clustering.py
+
+import json
+import logging
+import tempfile
+from collections import Counter, defaultdict
+import numpy as np
+from pymongo import UpdateMany
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from app.models.face import Face
+from app.models.project import Project
+from app.utils.embedding_index import invalidate_project_index
+
+logger = logging.getLogger(__name__)
+
+NOISE_LABEL = '-1'
+
+def load_project_embeddings(project_id, memmap_threshold=512 * 1024 * 1024, batch_size=2000):
+    """
+    Loads every encoded, searchable face in a project into a normalized float32 matrix.
+
+    Matrices larger than memmap_threshold bytes are backed by a temporary
+    memory-mapped file instead of RAM.
+
+    Args:
+        project_id (str): ID of the project.
+        memmap_threshold (int, optional): Size above which the matrix is memory-mapped.
+        batch_size (int, optional): Cursor batch size.
+
+    Returns:
+        dict: 'ids' (List[ObjectId]), 'labels' (List[str]), 'locked' (np.ndarray of bool)
+        and 'embeddings' (np.ndarray of shape (n, d)).
+    """
+    query = Face.objects(project=project_id, encoding__ne=None, searchable__ne=False)
+    total = query.count()
+
+    ids = []
+    labels = []
+    locked = np.zeros(total, dtype=bool)
+    embeddings = None
+
+    cursor = (query.only('id', 'encoding', 'cluster_label', 'label_locked')
+              .as_pymongo().batch_size(batch_size))
+    for doc in cursor:
+        if len(ids) == total:
+            break  # Faces encoded after the count are picked up by the next run
+        vector = np.asarray(json.loads(doc['encoding']), dtype=np.float32)
+        if embeddings is None:
+            embeddings = _allocate_matrix(total, vector.shape[0], memmap_threshold)
+        norm = np.linalg.norm(vector)
+        embeddings[len(ids)] = vector / norm if norm else vector
+        locked[len(ids)] = bool(doc.get('label_locked'))
+        labels.append(doc.get('cluster_label'))
+        ids.append(doc['_id'])
+
+    if embeddings is None:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    count = len(ids)
+    return {'ids': ids, 'labels': labels, 'locked': locked[:count], 'embeddings': embeddings[:count]}
+
+def _allocate_matrix(rows, dims, memmap_threshold):
+    if rows * dims * 4 <= memmap_threshold:
+        return np.empty((rows, dims), dtype=np.float32)
+    # The temporary file is removed as soon as the mapping is released
+    backing_file = tempfile.TemporaryFile(prefix='pikieye-embeddings-')
+    logger.info(f"Memory-mapping a {rows}x{dims} embedding matrix.")
+    return np.memmap(backing_file, dtype=np.float32, mode='w+', shape=(rows, dims))
+
+def density_clusters(embeddings, eps=0.5, min_samples=1, max_neighbors=50,
+                     block_bytes=256 * 1024 * 1024, progress=None):
+    """
+    Clusters normalized embeddings with DBSCAN semantics over a thresholded k-NN graph.
+
+    The cosine similarity matrix is never materialized: rows are processed in
+    blocks of chunked matrix multiplies, and only each point's max_neighbors
+    strongest edges with distance <= eps are kept, so the graph holds at most
+    n * max_neighbors edges however dense a cluster is. Clusters are the
+    connected components of the core points, with border points joining a
+    neighbouring core's cluster. Core status still counts every neighbour.
+
+    Without a cap and with min_samples=1 this is the same result as DBSCAN.
+    With the cap, an edge survives if either endpoint ranks it among its
+    strongest, so clusters stay connected unless two groups were joined only
+    by links that both sides ranked below their top max_neighbors; such a
+    cluster comes out split in two.
+
+    Args:
+        embeddings (np.ndarray): L2-normalized embeddings of shape (n, d).
+        eps (float, optional): Maximum cosine distance between neighbours. Defaults to 0.5.
+        min_samples (int, optional): Neighbours (including itself) for a core point. Defaults to 1.
+        max_neighbors (int, optional): Cap on the edges kept per point; None keeps every edge.
+        block_bytes (int, optional): Memory budget for one block of similarities.
+        progress (callable, optional): Called with (rows_done, total_rows) after each block.
+
+    Returns:
+        np.ndarray: Cluster index per row, -1 for noise.
+    """
+    n = len(embeddings)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    threshold = 1.0 - eps
+    block_rows = max(1, block_bytes // (n * 4))
+    neighbor_counts = np.zeros(n, dtype=np.int64)
+    edge_rows = []
+    edge_cols = []
+
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        similarities = embeddings[start:stop] @ embeddings.T
+        mask = similarities >= threshold
+        neighbor_counts[start:stop] = mask.sum(axis=1)
+
+        if max_neighbors is not None:
+            # Keep only the strongest edges for rows with too many neighbours
+            dense = np.nonzero(neighbor_counts[start:stop] > max_neighbors)[0]
+            if len(dense):
+                keep = np.argpartition(similarities[dense], -max_neighbors, axis=1)[:, -max_neighbors:]
+                mask[dense] = False
+                mask[dense[:, None], keep] = np.take_along_axis(similarities[dense], keep, axis=1) >= threshold
+
+        rows, cols = np.nonzero(mask)
+        rows = rows + start
+        not_self = cols != rows  # Self loops carry no information
+        edge_rows.append(rows[not_self].astype(np.int32))
+        edge_cols.append(cols[not_self].astype(np.int32))
+
+        if progress is not None:
+            progress(stop, n)
+
+    rows = np.concatenate(edge_rows)
+    cols = np.concatenate(edge_cols)
+    core = neighbor_counts >= min_samples
+
+    # Core points are connected through core-core edges only
+    core_edges = core[rows] & core[cols]
+    graph = coo_matrix((np.ones(core_edges.sum(), dtype=np.int8), (rows[core_edges], cols[core_edges])),
+                       shape=(n, n))
+    _, components = connected_components(graph, directed=False)
+
+    labels = np.full(n, -1, dtype=np.int64)
+    labels[core] = components[core]
+
+    # Border points join the cluster of their first core neighbour
+    border_edges = ~core[rows] & core[cols]
+    border_rows = rows[border_edges]
+    border_cols = cols[border_edges]
+    first = np.unique(border_rows, return_index=True)[1]
+    labels[border_rows[first]] = components[border_cols[first]]
+
+    return labels
+
+def assign_cluster_labels(clusters, current_labels, locked):
+    """
+    Turns cluster indices into stored label strings, honouring manually assigned labels.
+
+    Locked faces always keep their label. A cluster containing locked faces takes
+    the most common locked label; other clusters get fresh numeric labels that do
+    not collide with any locked label.
+
+    Args:
+        clusters (np.ndarray): Cluster index per face, -1 for noise.
+        current_labels (List[str]): Labels currently stored.
+        locked (np.ndarray): Whether each face's label was set manually.
+
+    Returns:
+        List[str]: New label per face.
+    """
+    locked_votes = defaultdict(Counter)
+    reserved = set()
+    for cluster, label, is_locked in zip(clusters, current_labels, locked):
+        if is_locked and label is not None:
+            reserved.add(label)
+            if cluster >= 0:
+                locked_votes[cluster][label] += 1
+
+    next_label = 1 + max([int(label) for label in reserved if label.lstrip('-').isdigit()] + [-1])
+    cluster_names = {}
+    new_labels = []
+    for cluster, label, is_locked in zip(clusters, current_labels, locked):
+        if is_locked and label is not None:
+            new_labels.append(label)
+            continue
+        if cluster < 0:
+            new_labels.append(NOISE_LABEL)
+            continue
+        if cluster not in cluster_names:
+            if locked_votes[cluster]:
+                cluster_names[cluster] = locked_votes[cluster].most_common(1)[0][0]
+            else:
+                while str(next_label) in reserved:
+                    next_label += 1
+                cluster_names[cluster] = str(next_label)
+                next_label += 1
+        new_labels.append(cluster_names[cluster])
+    return new_labels
+
+def write_cluster_labels(face_ids, labels, current_labels=None, batch_size=500, skip_locked=True):
+    """
+    Writes cluster labels back with one UpdateMany per label.
+
+    Args:
+        face_ids (List[ObjectId]): Face IDs.
+        labels (List[str]): New label per face.
+        current_labels (List[str], optional): Faces whose label is unchanged are skipped.
+        batch_size (int, optional): Update operations per bulk write.
+        skip_locked (bool, optional): Leave faces alone whose label was set manually,
+            including after the labels were computed. Defaults to True.
+
+    Returns:
+        int: Number of faces whose label changed.
+    """
+    by_label = defaultdict(list)
+    for i, (face_id, label) in enumerate(zip(face_ids, labels)):
+        if current_labels is None or current_labels[i] != label:
+            by_label[label].append(face_id)
+
+    operations = []
+    for label, ids in by_label.items():
+        query = {'_id': {'$in': ids}}
+        if skip_locked:
+            query['label_locked'] = {'$ne': True}
+        operations.append(UpdateMany(query, {'$set': {'cluster_label': label}}))
+    collection = Face._get_collection()
+    updated = 0
+    for start in range(0, len(operations), batch_size):
+        updated += collection.bulk_write(operations[start:start + batch_size], ordered=False).modified_count
+
+    return updated
+
+def recluster_project(job, project_id, eps=0.5, min_samples=1, max_neighbors=50,
+                      block_bytes=256 * 1024 * 1024):
+    """
+    Re-clusters every encoded face in a project from scratch.
+
+    Intended to run as the body of a background job.
+
+    Returns:
+        dict: Summary of the run.
+    """
+    job.update(phase='loading')
+    data = load_project_embeddings(project_id)
+    total = len(data['ids'])
+    job.update(phase='clustering', faces=total)
+    logger.info(f"Re-clustering {total} faces for project {project_id} (eps={eps}, min_samples={min_samples}).")
+
+    clusters = density_clusters(
+        data['embeddings'], eps=eps, min_samples=min_samples, max_neighbors=max_neighbors,
+        block_bytes=block_bytes, progress=lambda done, _: job.update(rows_done=done)
+    )
+
+    job.update(phase='writing')
+    labels = assign_cluster_labels(clusters, data['labels'], data['locked'])
+    updated = write_cluster_labels(data['ids'], labels, current_labels=data['labels'])
+    if updated:
+        Project.bump_version(project_id, 'labels_changed')
+
+    cluster_count = len(set(labels) - {NOISE_LABEL})
+    job.update(phase='done', clusters=cluster_count, updated=updated)
+    logger.info(f"Re-clustered project {project_id}: {cluster_count} clusters, {updated} faces relabelled.")
+    return {'faces': total, 'clusters': cluster_count, 'updated': updated}
+
+def _labels_changed(project_id, face_ids=None):
+    # Bumping the version invalidates every worker's caches; drop this worker's index right away
+    Project.bump_version(project_id, 'labels_changed', face_ids)
+    invalidate_project_index(project_id)
+
+def next_free_label(project_id):
+    """
+    Returns a numeric label no face in the project uses yet.
+    """
+    labels = Face.objects(project=project_id).distinct('cluster_label')
+    return str(1 + max([int(label) for label in labels if label and label.lstrip('-').isdigit()] + [-1]))
+
+def merge_clusters(project_id, source_labels, target_label):
+    """
+    Relabels every face of the source clusters to target_label with a single update.
+
+    Merged faces are locked so re-clustering keeps them together.
+
+    Returns:
+        int: Number of faces relabelled.
+    """
+    sources = [label for label in source_labels if label != target_label]
+    updated = Face.objects(project=project_id, cluster_label__in=sources).update(
+        set__cluster_label=target_label, set__label_locked=True)
+    if updated:
+        _labels_changed(project_id)
+    logger.info(f"Merged clusters {sources} into {target_label} in project {project_id}: {updated} faces.")
+    return updated
+
+def move_faces(project_id, face_ids, target_label):
+    """
+    Moves the given faces of a project to target_label with a single update.
+
+    Returns:
+        int: Number of faces found and moved.
+    """
+    updated = Face.objects(project=project_id, id__in=face_ids).update(
+        set__cluster_label=target_label, set__label_locked=True)
+    if updated:
+        _labels_changed(project_id, face_ids)
+    logger.info(f"Moved {updated} faces to cluster {target_label} in project {project_id}.")
+    return updated
+
+def split_cluster(project_id, label, eps=0.35, min_samples=1):
+    """
+    Re-clusters one cluster's faces at a tighter eps.
+
+    The largest resulting cluster keeps the label, every other one gets a
+    fresh label and faces left as noise get the noise label. Clustered faces
+    are locked so re-clustering keeps the split.
+
+    Args:
+        project_id (str): ID of the project.
+        label (str): Label of the cluster to split.
+        eps (float, optional): Maximum cosine distance between neighbours.
+        min_samples (int, optional): Neighbours (including itself) for a core point.
+
+    Returns:
+        dict: New label to number of faces.
+    """
+    ids = []
+    vectors = []
+    for doc in (Face.objects(project=project_id, cluster_label=label, encoding__ne=None)
+                .only('id', 'encoding').as_pymongo()):
+        vector = np.asarray(json.loads(doc['encoding']), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vectors.append(vector / norm if norm else vector)
+        ids.append(doc['_id'])
+    if not ids:
+        return {}
+
+    clusters = density_clusters(np.vstack(vectors), eps=eps, min_samples=min_samples)
+    sizes = Counter(int(cluster) for cluster in clusters if cluster >= 0)
+    names = {}
+    next_label = int(next_free_label(project_id))
+    for rank, (cluster, _) in enumerate(sizes.most_common()):
+        if rank == 0:
+            names[cluster] = label
+        else:
+            names[cluster] = str(next_label)
+            next_label += 1
+    labels = [names.get(int(cluster), NOISE_LABEL) for cluster in clusters]
+
+    # Locked faces of the cluster are split too, and stay locked below
+    write_cluster_labels(ids, labels, skip_locked=False)
+    Face.objects(id__in=[face_id for face_id, new_label in zip(ids, labels) if new_label != NOISE_LABEL]
+                 ).update(set__label_locked=True)
+    _labels_changed(project_id, ids)
+
+    summary = dict(Counter(labels))
+    logger.info(f"Split cluster {label} of project {project_id} into {summary}.")
+    return summary
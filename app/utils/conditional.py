@@ -0,0 +1,28 @@
+# app/utils/conditional.py
+
+import hashlib
+from flask import Response, request
+
+def version_etag(*parts):
+    """
+    Builds an ETag from version counters and the request's query string,
+    which selects the page or filter of the payload.
+    """
+    query = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return '-'.join(str(part) for part in parts) + f'-{query}'
+
+def not_modified(etag):
+    """
+    Returns a 304 response when the request's If-None-Match matches etag, else None.
+    """
+    if request.if_none_match.contains(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+def with_etag(response, etag):
+    """
+    Tags a response so clients revalidate it with If-None-Match.
+    """
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,218 @@
+# app/utils/db_audit.py
+
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+from bson import ObjectId
+
+from app.models.blob import Blob
+from app.models.face import Face
+from app.models.job import Job
+from app.models.project import Project
+from app.models.project_change import ProjectChange
+from app.models.upload_session import UploadSession
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+MODELS = (User, Project, Face, ProjectChange, UploadSession, Blob, Job)
+
+# Query shapes issued by the application, built from sample values found in the database
+QUERY_SHAPES = {
+    'face_by_project_hash': lambda s: Face.objects(project=s['project'], hash=s['hash']),
+    'face_by_project_gridfs_id': lambda s: Face.objects(project=s['project'], gridfs_id=s['gridfs_id']),
+    'faces_by_gridfs_id': lambda s: Face.objects(gridfs_id=s['gridfs_id']),
+    'blobs_by_gridfs_id': lambda s: Blob.objects(gridfs_id=s['gridfs_id']),
+    'face_by_project_source_hash': lambda s: Face.objects(project=s['project'], source_hash=s['source_hash']),
+    'unique_faces': lambda s: Face.objects(project=s['project'], cluster_label__ne='-1')
+                                  .order_by('cluster_label', '-quality'),
+    'project_faces_page': lambda s: Face.objects(project=s['project'], id__gt=s['face'])
+                                        .order_by('id').limit(101),
+    'project_index_load': lambda s: Face.objects(project=s['project'], encoding__ne=None, searchable__ne=False),
+    'project_changes_since': lambda s: ProjectChange.objects(project=s['project'], version__gt=0)
+                                           .order_by('version').limit(101),
+    'active_project_jobs': lambda s: Job.objects(project_id=str(s['project']), kind='recluster',
+                                                 status__in=['queued', 'running']),
+    'expired_upload_sessions': lambda s: UploadSession.objects(expires_at__lt=datetime.now(timezone.utc)),
+    'user_projects_page': lambda s: Project.objects(user=s['user']).order_by('id').limit(101),
+    'project_by_user_name': lambda s: Project.objects(user=s['user'], p_name=s['p_name']),
+    'user_by_email': lambda s: User.objects(email=s['email'])
+}
+
+def _index_keys(spec):
+    # The server may report directions as floats (1.0)
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in spec)
+
+def index_report():
+    """
+    Compares the indexes declared in each model's meta with those that exist.
+
+    Returns:
+        dict: Per collection, the 'missing' declared indexes and the 'unmanaged'
+        existing ones (by name) that no model declares.
+    """
+    report = {}
+    for model in MODELS:
+        collection = model._get_collection()
+        declared = {_index_keys(spec) for spec in model.list_indexes()}
+        existing = {name: _index_keys(info['key']) for name, info in collection.index_information().items()}
+        report[collection.name] = {
+            'missing': [list(keys) for keys in declared - set(existing.values())],
+            'unmanaged': sorted(name for name, keys in existing.items()
+                                if keys not in declared and name != '_id_')
+        }
+    return report
+
+def ensure_indexes(drop_unmanaged=False):
+    """
+    Creates every declared index, optionally dropping indexes no model declares.
+
+    Returns:
+        dict: The index report after the changes.
+    """
+    for model in MODELS:
+        model.ensure_indexes()
+        if drop_unmanaged:
+            collection = model._get_collection()
+            for name in index_report()[collection.name]['unmanaged']:
+                logger.info(f"Dropping unmanaged index {name} on {collection.name}.")
+                collection.drop_index(name)
+    return index_report()
+
+def _sample_values():
+    """
+    Picks real field values so explained queries hit realistic plans. Empty
+    collections fall back to placeholders, which still yield a plan.
+    """
+    face = Face.objects.only('id', 'project', 'hash', 'gridfs_id', 'source_hash').as_pymongo().first() or {}
+    project = Project.objects.only('user', 'p_name').as_pymongo().first() or {}
+    user = User.objects.only('email').as_pymongo().first() or {}
+    return {
+        'face': face.get('_id', ObjectId()),
+        'project': face.get('project', ObjectId()),
+        'hash': face.get('hash', ''),
+        'gridfs_id': face.get('gridfs_id', ''),
+        'source_hash': face.get('source_hash', ''),
+        'user': project.get('user', ObjectId()),
+        'p_name': project.get('p_name', ''),
+        'email': user.get('email', '')
+    }
+
+def _plan_stages(plan):
+    """
+    Yields the stage names of a query plan tree, classic or slot-based.
+    """
+    if not isinstance(plan, dict):
+        return
+    if 'queryPlan' in plan:  # Slot-based engine wraps the classic tree
+        plan = plan['queryPlan']
+    if 'stage' in plan:
+        yield plan['stage']
+    if 'inputStage' in plan:
+        yield from _plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+def _index_names(plan):
+    if not isinstance(plan, dict):
+        return
+    if 'queryPlan' in plan:
+        plan = plan['queryPlan']
+    if plan.get('indexName'):
+        yield plan['indexName']
+    if 'inputStage' in plan:
+        yield from _index_names(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        yield from _index_names(child)
+
+def explain_query(name, queryset):
+    """
+    Explains a query and flags collection scans and in-memory sorts.
+
+    Returns:
+        dict: The query's plan summary and a list of 'problems'.
+    """
+    explain = queryset.explain()
+    winning = explain.get('queryPlanner', {}).get('winningPlan', {})
+    stages = list(_plan_stages(winning))
+    stats = explain.get('executionStats', {})
+
+    problems = []
+    if 'COLLSCAN' in stages:
+        problems.append('COLLSCAN')
+    if 'SORT' in stages:
+        problems.append('in-memory SORT')
+
+    return {
+        'query': name,
+        'stages': stages,
+        'indexes': list(_index_names(winning)),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'returned': stats.get('nReturned'),
+        'millis': stats.get('executionTimeMillis'),
+        'problems': problems
+    }
+
+def audit_queries(report_path=None):
+    """
+    Explains every known query shape and reports plans that scan or sort in memory.
+
+    Args:
+        report_path (str, optional): Where to write the JSON report.
+
+    Returns:
+        dict: The report, with 'indexes', 'queries' and 'problems'.
+    """
+    samples = _sample_values()
+    queries = []
+    for name, build in QUERY_SHAPES.items():
+        try:
+            queries.append(explain_query(name, build(samples)))
+        except Exception as e:
+            logger.error(f"Error explaining query {name}: {e}")
+            queries.append({'query': name, 'error': str(e), 'problems': ['explain failed']})
+
+    problems = [f"{query['query']}: {problem}" for query in queries for problem in query['problems']]
+    for problem in problems:
+        logger.warning(f"Query audit: {problem}")
+
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'indexes': index_report(),
+        'queries': queries,
+        'problems': problems
+    }
+
+    if report_path:
+        directory = os.path.dirname(report_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        logger.info(f"Wrote query audit report to {report_path}.")
+
+    return report
+
+def start_startup_audit(app):
+    """
+    Audits indexes and query plans on a daemon thread when DB_AUDIT_ON_STARTUP is set.
+    """
+    if not app.config.get('DB_AUDIT_ON_STARTUP'):
+        return None
+
+    def run():
+        with app.app_context():
+            try:
+                ensure_indexes()
+                report = audit_queries(app.config.get('DB_AUDIT_REPORT_PATH'))
+                logger.info(f"Startup query audit found {len(report['problems'])} problems.")
+            except Exception as e:
+                logger.error(f"Startup query audit failed: {e}")
+
+    thread = threading.Thread(target=run, name='pikieye-db-audit', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,488 @@
+# app/utils/embedding_index.py
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from bson import ObjectId
+from flask import current_app
+
+from app.models.face import Face
+from app.models.project import Project
+from app.utils.cache import TTLCache
+from app.utils import metrics, background
+from app.utils.similarity import kernel_for, quantize_int8
+
+logger = logging.getLogger(__name__)
+
+INDEX_MODES = ('float32', 'float16', 'int8', 'pca', 'pq')
+
+# Projects smaller than this fall back to float16; PCA/PQ need data to train on
+MIN_TRAINING_ROWS = 1024
+TRAINING_SAMPLE = 20000
+
+# Rows scored per block, bounding the temporaries of the PQ lookups
+SCORE_BLOCK_ROWS = 65536
+
+class Float32Codec:
+    """
+    Keeps the full-precision vectors; scores are exact and need no rerank.
+    """
+    exact = True
+
+    def fit(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def score(self, codes, query):
+        return kernel_for('float32').cosine(codes, query)
+
+    @property
+    def nbytes(self):
+        return 0
+
+class Float16Codec(Float32Codec):
+    """
+    Halves memory; scores are accurate to about 1e-3.
+    """
+    exact = False
+
+    def encode(self, vectors):
+        return np.ascontiguousarray(vectors, dtype=np.float16)
+
+    def score(self, codes, query):
+        return kernel_for('float16').cosine(codes, query)
+
+class Int8Codec(Float32Codec):
+    """
+    Quarters memory with per-row scaled int8; scores are accurate to about 1e-2.
+    """
+    exact = False
+
+    def encode(self, vectors):
+        return quantize_int8(vectors)
+
+    def score(self, codes, query):
+        return kernel_for('int8').cosine(codes, query)
+
+class PCACodec:
+    """
+    Projects vectors onto their top principal directions.
+
+    The projection is not centred, so inner products of projected vectors
+    approximate inner products of the originals.
+    """
+    exact = False
+
+    def __init__(self, dims=128):
+        self.dims = dims
+        self.components = None
+
+    def fit(self, vectors):
+        _, _, vt = np.linalg.svd(vectors, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:self.dims].T, dtype=np.float32)
+        return self
+
+    def encode(self, vectors):
+        return np.ascontiguousarray((vectors @ self.components).astype(np.float16))
+
+    def score(self, codes, query):
+        return kernel_for('float16').cosine(codes, query @ self.components)
+
+    @property
+    def nbytes(self):
+        return self.components.nbytes
+
+class PQCodec:
+    """
+    Product quantization: each vector is split into `subspaces` parts and
+    every part is replaced by the index of its nearest of 256 centroids, so a
+    512-d vector costs `subspaces` bytes. Queries are scored asymmetrically
+    against a per-query lookup table of part/centroid inner products.
+
+    Dimensions that `subspaces` does not divide are spread with
+    np.array_split, so parts may differ in width by one; `subspaces` is
+    capped at the embedding dimension.
+    """
+    exact = False
+
+    def __init__(self, subspaces=64, iterations=20, seed=0):
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None  # Per subspace, (256, part_dims)
+
+    def fit(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        self.subspaces = max(1, min(self.subspaces, vectors.shape[1]))
+        parts = np.array_split(vectors, self.subspaces, axis=1)
+        self.centroids = [_kmeans(part, 256, self.iterations, rng) for part in parts]
+        return self
+
+    def encode(self, vectors, batch_size=4096):
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            for i, part in enumerate(np.array_split(batch, self.subspaces, axis=1)):
+                codes[start:start + batch_size, i] = _nearest(part, self.centroids[i])
+        return codes
+
+    def score(self, codes, query):
+        parts = np.array_split(query, self.subspaces)
+        table = np.stack([centroids @ part for centroids, part in zip(self.centroids, parts)])  # (subspaces, 256)
+        subspaces = np.arange(self.subspaces)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + SCORE_BLOCK_ROWS] = table[subspaces, block].sum(axis=1)
+        return scores
+
+    @property
+    def nbytes(self):
+        return sum(centroids.nbytes for centroids in self.centroids)
+
+def _nearest(vectors, centroids):
+    # argmin ||v - c||^2 == argmax (v.c - |c|^2 / 2)
+    return np.argmax(vectors @ centroids.T - 0.5 * np.sum(centroids ** 2, axis=1), axis=1)
+
+def _kmeans(vectors, k, iterations, rng):
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    if len(centroids) < 256:
+        # Pad so codes always index a full table
+        centroids = np.vstack([centroids, np.repeat(centroids[-1:], 256 - len(centroids), axis=0)])
+    return centroids.astype(np.float32)
+
+def make_codec(mode, pca_dims=128, pq_subspaces=64):
+    if mode == 'float16':
+        return Float16Codec()
+    if mode == 'int8':
+        return Int8Codec()
+    if mode == 'pca':
+        return PCACodec(pca_dims)
+    if mode == 'pq':
+        return PQCodec(pq_subspaces)
+    return Float32Codec()
+
+def load_encodings(face_ids):
+    """
+    Loads and normalizes the full-precision embeddings of the given faces.
+
+    Args:
+        face_ids (List[ObjectId]): Faces to load.
+
+    Returns:
+        np.ndarray: (len(face_ids), d) float32 matrix in the order of face_ids. Rows of
+        faces deleted since the index was built are zero, so they never match.
+    """
+    docs = Face.objects(id__in=list(face_ids)).only('id', 'encoding').as_pymongo()
+    by_id = {doc['_id']: json.loads(doc['encoding']) for doc in docs if doc.get('encoding')}
+    dims = len(next(iter(by_id.values()))) if by_id else 512
+    vectors = np.zeros((len(face_ids), dims), dtype=np.float32)
+    for row, face_id in enumerate(face_ids):
+        if face_id in by_id:
+            vectors[row] = by_id[face_id]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class EmbeddingIndex:
+    """
+    In-memory search index over a project's face embeddings.
+
+    Candidates are scored on the compressed representation; those within
+    `rerank_margin` of the tolerance (or among the best `candidates` for top-k
+    queries) are rescored exactly against full-precision vectors fetched with
+    `loader`.
+
+    Args:
+        face_ids (np.ndarray): Face ObjectIds, one per row.
+        gridfs_ids (np.ndarray): GridFS ID of each face's image.
+        vectors (np.ndarray): Normalized float32 embeddings.
+        mode (str, optional): One of INDEX_MODES.
+        version (int, optional): Project version the index was built from.
+        loader (callable, optional): Maps a sequence of face ids to their full vectors.
+        rerank_margin (float, optional): Score slack for threshold searches.
+        **codec_options: Passed to make_codec.
+    """
+    def __init__(self, face_ids, gridfs_ids, vectors, mode='float32', version=0, loader=load_encodings,
+                 rerank_margin=0.1, **codec_options):
+        if mode in ('pca', 'pq') and len(vectors) < MIN_TRAINING_ROWS:
+            mode = 'float16'
+        self.mode = mode
+        self.version = version
+        self.face_ids = face_ids
+        self.gridfs_ids = gridfs_ids
+        self.loader = loader
+        self.rerank_margin = rerank_margin
+        self.codec = make_codec(mode, **codec_options)
+        if len(vectors):
+            sample = vectors
+            if len(vectors) > TRAINING_SAMPLE:
+                rows = np.random.default_rng(0).choice(len(vectors), size=TRAINING_SAMPLE, replace=False)
+                sample = vectors[np.sort(rows)]
+            self.codec.fit(np.asarray(sample, dtype=np.float32))
+        self.codes = self.codec.encode(vectors)
+
+    def __len__(self):
+        return len(self.face_ids)
+
+    @property
+    def nbytes(self):
+        return int(self.codes.nbytes + self.codec.nbytes)
+
+    def _rerank(self, rows, query):
+        if self.codec.exact:
+            return self.codes[rows] @ query
+        return self.loader(self.face_ids[rows]) @ query
+
+    def search(self, query, tolerance):
+        """
+        Returns the rows whose similarity to query exceeds tolerance.
+
+        Args:
+            query (np.ndarray): Normalized float32 query vector.
+            tolerance (float): Cosine similarity threshold.
+
+        Returns:
+            tuple: (rows, similarities) as arrays.
+        """
+        if not len(self):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        coarse = self.codec.score(self.codes, query)
+        margin = 0 if self.codec.exact else self.rerank_margin
+        rows = np.where(coarse > tolerance - margin)[0]
+        if not len(rows):
+            return rows, np.array([], dtype=np.float32)
+        similarities = coarse[rows] if self.codec.exact else self._rerank(rows, query)
+        keep = similarities > tolerance
+        return rows[keep], similarities[keep]
+
+    def top_k(self, query, k=10, candidates=100):
+        """
+        Returns the k most similar rows, reranking the best `candidates` coarse hits exactly.
+        """
+        if not len(self):
+            return np.array([], dtype=np.int64)
+        coarse = self.codec.score(self.codes, query)
+        candidates = min(len(self), max(k, candidates))
+        rows = np.argpartition(-coarse, candidates - 1)[:candidates]
+        similarities = self._rerank(rows, query)
+        return rows[np.argsort(-similarities)[:k]]
+
+def load_project_vectors(project_id, batch_size=2000):
+    """
+    Loads a project's searchable face embeddings from MongoDB.
+
+    Returns:
+        tuple: (face_ids, gridfs_ids, matrix) where matrix holds normalized float32 rows.
+    """
+    query = Face.objects(project=project_id, encoding__ne=None, searchable__ne=False)
+    cursor = query.only('id', 'gridfs_id', 'encoding').as_pymongo().batch_size(batch_size)
+
+    face_ids, gridfs_ids, vectors = [], [], []
+    for doc in cursor:
+        try:
+            vectors.append(np.asarray(json.loads(doc['encoding']), dtype=np.float32))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Skipping face {doc['_id']} with an unreadable encoding: {e}")
+            continue
+        face_ids.append(doc['_id'])
+        gridfs_ids.append(doc['gridfs_id'])
+
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, 512), dtype=np.float32)
+    if len(matrix):
+        # Zero-norm rows stay zero instead of turning into NaN
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return np.array(face_ids, dtype=object), np.array(gridfs_ids, dtype=object), matrix
+
+def snapshot_path(project_id, directory=None):
+    return os.path.join(directory or snapshot_dir(), f'{project_id}.npz')
+
+def snapshot_dir():
+    return current_app.config.get('INDEX_SNAPSHOT_DIR') or os.path.join(current_app.instance_path, 'index_snapshots')
+
+def save_snapshot(project_id, version, face_ids, gridfs_ids, matrix, directory=None):
+    """
+    Writes a project's full-precision vectors to disk, atomically replacing any older snapshot.
+
+    Snapshots hold float32 vectors rather than compressed codes so they stay
+    valid when EMBEDDING_INDEX_MODE changes.
+    """
+    path = snapshot_path(project_id, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, version=np.array(version),
+                     face_ids=np.array([str(face_id) for face_id in face_ids], dtype='S24'),
+                     gridfs_ids=np.array([str(gridfs_id) for gridfs_id in gridfs_ids], dtype='S24'),
+                     vectors=matrix.astype(np.float32, copy=False))
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+def _write_snapshot(project_id, version, face_ids, gridfs_ids, matrix, directory):
+    try:
+        save_snapshot(project_id, version, face_ids, gridfs_ids, matrix, directory)
+    except Exception as e:
+        logger.error(f"Error writing index snapshot for project {project_id}: {e}")
+
+def remove_snapshot(project_id, directory=None):
+    try:
+        os.remove(snapshot_path(project_id, directory))
+    except FileNotFoundError:
+        pass
+
+def load_snapshot(project_id, directory=None):
+    """
+    Reads a project's snapshot.
+
+    Returns:
+        tuple: (version, face_ids, gridfs_ids, matrix), or None if there is no readable snapshot.
+    """
+    path = snapshot_path(project_id, directory)
+    try:
+        with np.load(path) as data:
+            face_ids = np.array([ObjectId(face_id.decode()) for face_id in data['face_ids']], dtype=object)
+            gridfs_ids = np.array([gridfs_id.decode() for gridfs_id in data['gridfs_ids']], dtype=object)
+            return int(data['version']), face_ids, gridfs_ids, data['vectors']
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Ignoring unreadable index snapshot {path}: {e}")
+        return None
+
+def snapshot_version(project_id, directory=None):
+    """
+    Returns the version recorded in a project's snapshot without loading its vectors.
+    """
+    try:
+        with np.load(snapshot_path(project_id, directory)) as data:
+            return int(data['version'])
+    except Exception:
+        return None
+
+def build_project_index(project_id, version=0, mode='float32', snapshot=True, **options):
+    """
+    Builds an EmbeddingIndex over a project's searchable faces.
+
+    A snapshot written for the same version is used instead of scanning
+    MongoDB; otherwise the vectors are loaded from MongoDB and, when snapshot
+    is set, written out in the background for the next start.
+    """
+    source = 'snapshot'
+    loaded = load_snapshot(project_id) if snapshot else None
+    if loaded is not None and loaded[0] == version:
+        _, face_ids, gridfs_ids, matrix = loaded
+    else:
+        source = 'database'
+        face_ids, gridfs_ids, matrix = load_project_vectors(project_id)
+        if snapshot:
+            background.submit('snapshots', _write_snapshot, project_id, version, face_ids, gridfs_ids, matrix,
+                              snapshot_dir())
+
+    index = EmbeddingIndex(face_ids, gridfs_ids, matrix, mode=mode, version=version, **options)
+    logger.info(f"Built {index.mode} index for project {project_id} from {source}: "
+                f"{len(index)} faces, {index.nbytes} bytes.")
+    return index
+
+_indexes = None
+_indexes_lock = threading.Lock()
+
+def _index_cache():
+    global _indexes
+    with _indexes_lock:
+        if _indexes is None:
+            _indexes = TTLCache(ttl=current_app.config.get('EMBEDDING_INDEX_TTL', 3600),
+                                max_entries=current_app.config.get('EMBEDDING_INDEX_CACHE_SIZE', 32))
+            metrics.register_provider('embedding_index', index_stats)
+        return _indexes
+
+def index_stats():
+    if _indexes is None:
+        return {}
+    stats = _indexes.stats()
+    indexes = _indexes.values()
+    stats['faces'] = sum(len(index) for index in indexes)
+    stats['bytes'] = sum(index.nbytes for index in indexes)
+    stats['modes'] = sorted({index.mode for index in indexes})
+    return stats
+
+def get_project_index(project_id):
+    """
+    Returns the cached index of a project, rebuilding it when the project's
+    version has moved on since it was built.
+
+    Raises:
+        ValueError: If the project does not exist.
+    """
+    doc = Project.objects(id=project_id).only('version').as_pymongo().first()
+    if doc is None:
+        raise ValueError("Project not found.")
+    version = doc.get('version', 0)
+
+    cache = _index_cache()
+    index = cache.get(str(project_id))
+    if index is None or index.version != version:
+        index = build_and_cache_index(project_id, version)
+    _mark_active(project_id)
+    return index
+
+def build_and_cache_index(project_id, version):
+    """
+    Builds a project's index for the given version with the app's settings and caches it.
+    """
+    config = current_app.config
+    index = build_project_index(
+        ObjectId(str(project_id)), version=version,
+        mode=config.get('EMBEDDING_INDEX_MODE', 'float32'),
+        snapshot=config.get('INDEX_SNAPSHOTS_ENABLED', True),
+        rerank_margin=config.get('EMBEDDING_RERANK_MARGIN', 0.1),
+        pca_dims=config.get('EMBEDDING_PCA_DIMS', 128),
+        pq_subspaces=config.get('EMBEDDING_PQ_SUBSPACES', 64)
+    )
+    _index_cache().set(str(project_id), index)
+    return index
+
+# Snapshot mtimes record when a project was last searched; touched at most once a minute
+ACTIVITY_TOUCH_INTERVAL = 60
+_last_touched = {}
+
+def _mark_active(project_id):
+    now = time.monotonic()
+    if now - _last_touched.get(str(project_id), -ACTIVITY_TOUCH_INTERVAL) < ACTIVITY_TOUCH_INTERVAL:
+        return
+    _last_touched[str(project_id)] = now
+    try:
+        os.utime(snapshot_path(project_id))
+    except OSError:
+        pass  # No snapshot (disabled or not written yet)
+
+def recently_active_projects(limit, directory=None):
+    """
+    Returns the IDs of the projects whose snapshots were used most recently.
+    """
+    directory = directory or snapshot_dir()
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.npz')]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [entry.name[:-len('.npz')] for entry in entries[:limit]]
+
+def invalidate_project_index(project_id):
+    if _indexes is not None:
+        _indexes.pop(str(project_id))
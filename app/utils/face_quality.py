@@ -0,0 +1,131 @@
+# app/utils/face_quality.py
+
+import math
+import cv2
+import numpy as np
+
+# Side of the square face crop the sharpness measure is computed on
+SHARPNESS_CROP_SIZE = 112
+
+def eye_distance(face):
+    """
+    Distance in pixels between the two eye landmarks, or 0 without landmarks.
+    """
+    if getattr(face, 'kps', None) is None:
+        return 0.0
+    return float(np.linalg.norm(face.kps[0] - face.kps[1]))
+
+def sharpness(img, bbox):
+    """
+    Variance of the Laplacian of the face crop, resized to a fixed size so that
+    values are comparable across face sizes. Higher is sharper.
+    """
+    height, width = img.shape[:2]
+    x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+    x2, y2 = min(width, int(math.ceil(bbox[2]))), min(height, int(math.ceil(bbox[3])))
+    if x2 <= x1 or y2 <= y1:
+        return 0.0
+    crop = cv2.cvtColor(img[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    crop = cv2.resize(crop, (SHARPNESS_CROP_SIZE, SHARPNESS_CROP_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(crop, cv2.CV_64F).var())
+
+def estimate_yaw(face):
+    """
+    Approximate head yaw in degrees from the five-point landmarks.
+
+    Uses how far the nose tip sits from the midpoint of the eyes, relative to
+    the eye distance; 0 is frontal, values near 90 are profile.
+    """
+    if getattr(face, 'pose', None) is not None:
+        return abs(float(face.pose[1]))  # (pitch, yaw, roll) from the 3D landmark model
+    if getattr(face, 'kps', None) is None:
+        return 0.0
+    left_eye, right_eye, nose = face.kps[0], face.kps[1], face.kps[2]
+    distance = np.linalg.norm(right_eye - left_eye)
+    if distance == 0:
+        return 90.0
+    offset = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / (distance / 2)
+    return math.degrees(math.asin(min(1.0, offset)))
+
+class QualityGate:
+    """
+    Scores detected faces and decides which of them are worth indexing.
+
+    In 'annotate' mode every face is kept and searchable and only its quality
+    score is recorded. In 'flag' mode faces below any threshold are kept but
+    marked non-searchable. In 'drop' mode they are discarded before embedding.
+    """
+    def __init__(self, min_det_score=0.5, min_eye_distance=10.0, min_sharpness=30.0, max_yaw=60.0,
+                 mode='annotate'):
+        self.min_det_score = min_det_score
+        self.min_eye_distance = min_eye_distance
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+        self.mode = mode
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Builds the gate from FACE_QUALITY_* settings, or returns None when gating is disabled.
+        """
+        if not config.get('FACE_QUALITY_ENABLED'):
+            return None
+        return cls(
+            min_det_score=config.get('FACE_QUALITY_MIN_DET_SCORE', 0.5),
+            min_eye_distance=config.get('FACE_QUALITY_MIN_EYE_DISTANCE', 10.0),
+            min_sharpness=config.get('FACE_QUALITY_MIN_SHARPNESS', 30.0),
+            max_yaw=config.get('FACE_QUALITY_MAX_YAW', 60.0),
+            mode=config.get('FACE_QUALITY_MODE', 'annotate')
+        )
+
+    def measure(self, img, face):
+        """
+        Computes the raw quality measurements of a detected face.
+
+        Returns:
+            dict: 'det_score', 'eye_distance', 'sharpness' and 'yaw'.
+        """
+        return {
+            'det_score': float(face.det_score),
+            'eye_distance': eye_distance(face),
+            'sharpness': sharpness(img, face.bbox),
+            'yaw': estimate_yaw(face)
+        }
+
+    def passes(self, measurements):
+        return (measurements['det_score'] >= self.min_det_score
+                and measurements['eye_distance'] >= self.min_eye_distance
+                and measurements['sharpness'] >= self.min_sharpness
+                and measurements['yaw'] <= self.max_yaw)
+
+    def score(self, measurements):
+        """
+        Combines measurements into a single score in [0, 1], used to pick
+        cluster representatives. Each factor saturates at twice its threshold.
+        """
+        size = min(1.0, measurements['eye_distance'] / (2 * self.min_eye_distance or 1))
+        focus = min(1.0, measurements['sharpness'] / (2 * self.min_sharpness or 1))
+        pose = math.cos(math.radians(min(90.0, measurements['yaw'])))
+        return float(measurements['det_score'] * size * focus * pose)
+
+    def apply(self, img, faces):
+        """
+        Scores faces, setting 'quality' and 'searchable' on each, and drops
+        failing faces in 'drop' mode only.
+
+        Args:
+            img (np.ndarray): BGR image the faces were detected in.
+            faces (List[insightface.app.common.Face]): Detected faces.
+
+        Returns:
+            List[insightface.app.common.Face]: The faces to embed.
+        """
+        kept = []
+        for face in faces:
+            measurements = self.measure(img, face)
+            face.quality = self.score(measurements)
+            passed = self.passes(measurements)
+            face.searchable = passed or self.mode == 'annotate'
+            if passed or self.mode != 'drop':
+                kept.append(face)
+        return kept
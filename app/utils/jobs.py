@@ -0,0 +1,113 @@
+# app/utils/jobs.py
+
+from datetime import datetime, timedelta, timezone
+import logging
+from mongoengine.errors import NotUniqueError
+from flask import current_app
+
+from app.models.job import Job
+from app.utils import background
+
+logger = logging.getLogger(__name__)
+
+class JobConflict(Exception):
+    """
+    Raised when an exclusive job of the same kind is already active for a project.
+    """
+    def __init__(self, job):
+        super().__init__(f"Job {job.id} ({job.kind}) is already active.")
+        self.job = job
+
+def _stale_cutoff():
+    # Active jobs silent for longer than this belong to a worker process that died
+    return datetime.now(timezone.utc) - timedelta(seconds=current_app.config.get('JOB_STALE_SECONDS', 900))
+
+def create_job(kind, user_id=None, project_id=None, exclusive=False):
+    """
+    Registers a new job.
+
+    Args:
+        kind (str): Type of job (e.g. 'archive_import').
+        user_id (str, optional): ID of the user who started the job.
+        project_id (str, optional): ID of the project the job works on.
+        exclusive (bool, optional): Refuse to start while another job of this
+            kind is active for the project, in any worker process.
+
+    Returns:
+        Job: The new job.
+
+    Raises:
+        JobConflict: If exclusive and such a job is active.
+    """
+    job = Job(kind=kind, user_id=str(user_id) if user_id else None,
+              project_id=str(project_id) if project_id else None)
+    if not exclusive:
+        return job.save(force_insert=True)
+
+    job.lock = f'{kind}:{job.project_id}'
+    for _ in range(2):
+        try:
+            return job.save(force_insert=True)
+        except NotUniqueError:
+            holder = Job.objects(lock=job.lock).first()
+            if holder is None:
+                continue  # Finished meanwhile
+            if holder.updated_at.replace(tzinfo=timezone.utc) >= _stale_cutoff():
+                raise JobConflict(holder)
+            # The holder's worker died; fail it and take over the lock
+            logger.warning(f"Releasing stale job {holder.id} ({holder.kind}).")
+            Job.objects(id=holder.id, updated_at=holder.updated_at).update_one(
+                set__status='failed', set__error='Abandoned by its worker.', unset__lock=True)
+    raise JobConflict(Job.objects(lock=job.lock).first() or job)
+
+def get_job(job_id):
+    """
+    Looks up a job by ID.
+
+    Returns:
+        Job or None: The job, if it has not expired.
+    """
+    return Job.objects(id=job_id).first()
+
+def active_job_exists(kind, project_id):
+    """
+    Checks whether a job of the given kind is queued or running for the
+    project in any worker process, ignoring jobs whose worker died.
+    """
+    return Job.objects(project_id=str(project_id), kind=kind, status__in=['queued', 'running'],
+                       updated_at__gte=_stale_cutoff()).only('id').first() is not None
+
+def list_jobs(kind=None, project_id=None):
+    """
+    Returns the stored jobs, optionally filtered by kind and project.
+    """
+    query = Job.objects
+    if kind is not None:
+        query = query.filter(kind=kind)
+    if project_id is not None:
+        query = query.filter(project_id=str(project_id))
+    return list(query.order_by('-created_at'))
+
+def run_job(job, fn, *args, **kwargs):
+    """
+    Runs a function for a job on the background 'jobs' pool.
+
+    The function receives the job as its first argument; its return value is
+    stored as the job result.
+
+    Returns:
+        concurrent.futures.Future: Future holding the function's result.
+    """
+    def run():
+        job.set_status('running')
+        try:
+            result = fn(job, *args, **kwargs)
+            job.set_status('completed', result=result)
+            logger.info(f"Job {job.id} ({job.kind}) completed.")
+            return result
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.set_status('failed', error=e)
+            raise
+
+    return background.submit('jobs', run)
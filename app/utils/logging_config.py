@@ -0,0 +1,186 @@
+# app/utils/logging_config.py
+
+import atexit
+import copy
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from app.utils import metrics
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# Distinct events tracked by a SamplingFilter before its counters are reset
+MAX_SAMPLED_EVENTS = 10000
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line.
+    """
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName
+        }
+        if getattr(record, 'sample_rate', 1) > 1:
+            entry['sample_rate'] = record.sample_rate
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes only one in N records of each high-volume event.
+
+    An event is identified by logger name and unformatted message, so calls
+    must use lazy %-style arguments for repeats to be recognised. Rates are
+    looked up by the longest matching logger name prefix; only records at or
+    below max_level are sampled.
+
+    Args:
+        rates (dict): Logger name (prefix) to N.
+        max_level (int, optional): Highest level that is sampled.
+    """
+    def __init__(self, rates, max_level=logging.DEBUG):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.max_level = max_level
+        self._counters = defaultdict(itertools.count)
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        rate = self._rate(record.name)
+        if rate <= 1:
+            return True
+        with self._lock:
+            if len(self._counters) >= MAX_SAMPLED_EVENTS:
+                self._counters.clear()  # Eagerly formatted messages never repeat
+            seen = next(self._counters[(record.name, record.msg)])
+            if seen % rate:
+                self.suppressed += 1
+                return False
+        record.sample_rate = rate
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that drops records instead of blocking when the queue is full.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        """
+        Enqueues the raw record instead of a formatted one.
+
+        The stdlib version runs the full formatter on the calling thread. Here
+        only the message is merged with its arguments, which may be mutated
+        once the call returns; timestamps, JSON and tracebacks (exc_info is
+        kept, since the queue never leaves the process) are formatted by the
+        listener's handlers.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def configure_logging(app):
+    """
+    Routes the application's log records through a bounded queue to a
+    background writer thread, so request threads never block on file I/O or
+    rotation.
+
+    In debug and testing, records go to the console at DEBUG for every
+    logger; otherwise they go to a rotating file at LOG_LEVEL for the
+    application's loggers.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    global _pipeline
+    config = app.config
+    verbose = app.debug or app.testing
+
+    if verbose:
+        target = logging.StreamHandler()
+        attach_to = logging.getLogger()
+        level = logging.DEBUG
+    else:
+        log_file = config.get('LOG_FILE', 'logs/app.log')
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        target = RotatingFileHandler(log_file, maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                     backupCount=config.get('LOG_BACKUP_COUNT', 10))
+        attach_to = app.logger
+        level = logging.getLevelName(config.get('LOG_LEVEL', 'INFO'))
+
+    target.setFormatter(JsonFormatter() if config.get('LOG_FORMAT') == 'json' else logging.Formatter(TEXT_FORMAT))
+    target.setLevel(level)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(config.get('LOG_QUEUE_SIZE', 10000)))
+    sampler = SamplingFilter(config.get('LOG_SAMPLE_RATES'))
+    queue_handler.addFilter(sampler)
+    listener = QueueListener(queue_handler.queue, target, respect_handler_level=True)
+
+    with _pipeline_lock:
+        if _pipeline is not None:
+            # create_app was called again (tests, load harness); replace the previous pipeline
+            previous_logger, previous_handler, previous_listener, _ = _pipeline
+            previous_logger.removeHandler(previous_handler)
+            previous_listener.stop()
+        else:
+            atexit.register(_stop_pipeline)
+        attach_to.addHandler(queue_handler)
+        attach_to.setLevel(level)
+        listener.start()
+        _pipeline = (attach_to, queue_handler, listener, sampler)
+
+    metrics.register_provider('logging', logging_stats)
+
+def _stop_pipeline():
+    # Flushes queued records on interpreter exit
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline[2].stop()
+
+def logging_stats():
+    if _pipeline is None:
+        return {}
+    _, queue_handler, _, sampler = _pipeline
+    return {
+        'queue_depth': queue_handler.queue.qsize(),
+        'dropped': queue_handler.dropped,
+        'sampled_out': sampler.suppressed
+    }
@@ -0,0 +1,39 @@
+# app/utils/metrics.py
+
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def register_provider(name, fn):
+    """
+    Registers a function whose (JSON-serializable) return value is reported under name.
+
+    Args:
+        name (str): Section name in the metrics report.
+        fn (callable): Function returning the section's metrics.
+    """
+    with _providers_lock:
+        _providers[name] = fn
+
+def collect():
+    """
+    Gathers the current metrics from every registered provider.
+
+    Returns:
+        dict: Metrics keyed by provider name.
+    """
+    with _providers_lock:
+        providers = dict(_providers)
+
+    report = {}
+    for name, fn in providers.items():
+        try:
+            report[name] = fn()
+        except Exception as e:
+            logger.error(f"Error collecting metrics from {name}: {e}")
+            report[name] = {'error': str(e)}
+    return report
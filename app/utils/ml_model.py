@@ -7,18 +7,29 @@ from sklearn.cluster import DBSCAN
 from sklearn.preprocessing import normalize
 import insightface
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face as DetectedFace
+from insightface.utils.face_align import arcface_dst
 import logging
 import io
 from bson import ObjectId
 from app.models.project import Project
 from app.models.face import Face
+from app.utils.face_quality import QualityGate
+from app.utils.embedding_index import get_project_index
 import torch
 import json
-from flask import current_app
+import hashlib
+from flask import current_app, has_app_context
+from app.utils import background
+from app.utils.admission import model_slot
+from app.utils.blob_store import cached_records, store_records
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Model pack loaded by FaceAnalysis(); part of the extraction signature
+EXTRACTION_MODEL = 'buffalo_l'
+
 # Initialize the InsightFace application as a singleton
 class InsightFaceSingleton:
     _instance = None
@@ -34,7 +45,7 @@ class InsightFaceSingleton:
                     ctx_id = -1
                     logger.info("GPU is not available. Using CPU for face analysis.")
                 
-                cls._instance.app_insight = FaceAnalysis()
+                cls._instance.app_insight = FaceAnalysis(name=EXTRACTION_MODEL)
                 cls._instance.app_insight.prepare(ctx_id=ctx_id, det_size=(640, 640))
                 logger.info("InsightFace model initialized successfully.")
             except Exception as e:
@@ -58,8 +69,217 @@ def preprocess_image(image_bytes):
         logger.error(f"Error in image preprocessing: {e}")
         return None
 
-def extract_features(image_bytes):
-    img = preprocess_image(image_bytes)
+def _detect(img):
+    """
+    Runs the detection model once.
+
+    Returns:
+        tuple: (bboxes, kpss) where bboxes is (n, 5) with the score in the last column.
+    """
+    bboxes, kpss = app_insight_singleton.app_insight.det_model.detect(img, max_num=0, metric='default')
+    if kpss is None:
+        kpss = np.zeros((len(bboxes), 5, 2), dtype=np.float32)
+    return bboxes, kpss
+
+def _tiling_options():
+    if not has_app_context() or not current_app.config.get('TILED_DETECTION_ENABLED'):
+        return None
+    config = current_app.config
+    return {
+        'min_side': config.get('TILED_DETECTION_MIN_SIDE', 2000),
+        'small_face': config.get('TILED_DETECTION_SMALL_FACE', 24),
+        'tile_size': config.get('TILED_DETECTION_TILE_SIZE', 1280),
+        'overlap': config.get('TILED_DETECTION_OVERLAP', 192),
+        'nms_threshold': config.get('TILED_DETECTION_NMS_THRESHOLD', 0.4)
+    }
+
+def _needs_tiling(img, bboxes, min_side, small_face, **_):
+    """
+    Tiles only large images where the downscaled pass found no faces, or
+    found faces so small that smaller ones were probably lost.
+    """
+    long_side = max(img.shape[:2])
+    if long_side < min_side:
+        return False
+    if not len(bboxes):
+        return True
+    det_scale = max(app_insight_singleton.app_insight.det_model.input_size) / long_side
+    heights = (bboxes[:, 3] - bboxes[:, 1]) * det_scale
+    return float(heights.min()) < small_face
+
+def _tile_origins(length, tile_size, overlap):
+    if length <= tile_size:
+        return [0]
+    step = tile_size - overlap
+    origins = list(range(0, length - tile_size, step))
+    return origins + [length - tile_size]
+
+def _detect_tile(img, x0, y0, tile_size):
+    """
+    Detects faces in one tile, drops those cut by an inner tile edge (they
+    are whole in the neighbouring tile) and maps the rest to image coordinates.
+    """
+    height, width = img.shape[:2]
+    x1, y1 = min(x0 + tile_size, width), min(y0 + tile_size, height)
+    bboxes, kpss = _detect(img[y0:y1, x0:x1])
+    if not len(bboxes):
+        return bboxes, kpss
+
+    margin = 2
+    keep = np.ones(len(bboxes), dtype=bool)
+    if x0 > 0:
+        keep &= bboxes[:, 0] > margin
+    if y0 > 0:
+        keep &= bboxes[:, 1] > margin
+    if x1 < width:
+        keep &= bboxes[:, 2] < (x1 - x0) - margin
+    if y1 < height:
+        keep &= bboxes[:, 3] < (y1 - y0) - margin
+
+    bboxes, kpss = bboxes[keep].copy(), kpss[keep].copy()
+    bboxes[:, [0, 2]] += x0
+    bboxes[:, [1, 3]] += y0
+    kpss += [x0, y0]
+    return bboxes, kpss
+
+def _nms(bboxes, threshold):
+    """
+    Greedy non-maximum suppression on (n, 5) boxes with scores in the last column.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, best first.
+    """
+    order = np.argsort(-bboxes[:, 4])
+    areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(np.minimum(bboxes[best, 2], bboxes[rest, 2]) - np.maximum(bboxes[best, 0], bboxes[rest, 0]), 0, None)
+        height = np.clip(np.minimum(bboxes[best, 3], bboxes[rest, 3]) - np.maximum(bboxes[best, 1], bboxes[rest, 1]), 0, None)
+        intersection = width * height
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-6)
+        order = rest[iou <= threshold]
+    return np.array(keep, dtype=np.int64)
+
+def detect_tiled(img, bboxes, kpss, tile_size=1280, overlap=192, nms_threshold=0.4, **_):
+    """
+    Adds detections from overlapping native-resolution tiles to those of the
+    downscaled pass and merges them with non-maximum suppression.
+
+    Tiles are detected in parallel on the 'detection' pool; ONNX Runtime
+    releases the GIL while it runs.
+
+    Returns:
+        tuple: Merged (bboxes, kpss).
+    """
+    height, width = img.shape[:2]
+    origins = [(x0, y0) for y0 in _tile_origins(height, tile_size, overlap)
+               for x0 in _tile_origins(width, tile_size, overlap)]
+    executor = background.get_executor('detection')
+    results = list(executor.map(lambda origin: _detect_tile(img, origin[0], origin[1], tile_size), origins))
+
+    all_bboxes = np.vstack([bboxes] + [result[0] for result in results])
+    all_kpss = np.concatenate([kpss] + [result[1] for result in results])
+    keep = _nms(all_bboxes, nms_threshold)
+    logger.debug("Tiled detection over %d tiles: %d boxes, %d after NMS.", len(origins), len(all_bboxes), len(keep))
+    return all_bboxes[keep], all_kpss[keep]
+
+def detect_face_boxes(img):
+    """
+    Runs only the detection model on an image.
+
+    With TILED_DETECTION_ENABLED, large images whose downscaled pass finds
+    no or only tiny faces are also detected tile by tile at native scale.
+
+    Args:
+        img (np.ndarray): BGR image.
+
+    Returns:
+        List[insightface.app.common.Face]: Detected faces with bbox, kps and det_score
+        but no embedding yet.
+    """
+    bboxes, kpss = _detect(img)
+    tiling = _tiling_options()
+    if tiling and _needs_tiling(img, bboxes, **tiling):
+        bboxes, kpss = detect_tiled(img, bboxes, kpss, **tiling)
+
+    faces = []
+    for i in range(bboxes.shape[0]):
+        faces.append(DetectedFace(bbox=bboxes[i, 0:4], kps=kpss[i], det_score=bboxes[i, 4]))
+    return faces
+
+def embed_faces(img, faces):
+    """
+    Runs the non-detection models (recognition, landmarks, ...) on already detected faces.
+
+    Args:
+        img (np.ndarray): BGR image the faces were detected in.
+        faces (List[insightface.app.common.Face]): Faces from detect_face_boxes.
+
+    Returns:
+        List[insightface.app.common.Face]: The same faces, now carrying an embedding.
+    """
+    for taskname, model in app_insight_singleton.app_insight.models.items():
+        if taskname == 'detection':
+            continue
+        for face in faces:
+            model.get(img, face)
+    return faces
+
+def warm_up_model():
+    """
+    Runs every model once on a blank image so ONNX Runtime allocates its
+    kernels and buffers before the first real request.
+    """
+    if app_insight_singleton.app_insight is None:
+        logger.error("InsightFace model is not initialized.")
+        return
+    img = np.zeros((640, 640, 3), dtype=np.uint8)
+    detect_face_boxes(img)
+    # A synthetic face placed on the ArcFace landmark template exercises the remaining models
+    offset = np.array([264, 264], dtype=np.float32)
+    face = DetectedFace(bbox=np.array([264, 264, 376, 376], dtype=np.float32), kps=arcface_dst + offset,
+                        det_score=1.0)
+    embed_faces(img, [face])
+
+def face_record(face):
+    """
+    Converts a detected face into the plain record stored on a Face document.
+
+    Returns:
+        dict: 'embedding', 'bbox' ([x1, y1, x2, y2]) and 'det_score', plus 'quality'
+        and 'searchable' when the face went through a QualityGate.
+    """
+    record = {
+        'embedding': face.embedding,
+        'bbox': [float(v) for v in face.bbox],
+        'det_score': float(face.det_score)
+    }
+    if getattr(face, 'quality', None) is not None:
+        record['quality'] = face.quality
+        record['searchable'] = face.searchable
+    return record
+
+def quality_gate():
+    """
+    Returns the ingest QualityGate configured for the app, or None when gating is disabled.
+    """
+    return QualityGate.from_config(current_app.config)
+
+def extract_face_records(image, gate=None):
+    """
+    Decodes an image and returns a record for every face found in it.
+
+    Args:
+        image (bytes or np.ndarray): Encoded image, or an already decoded BGR array.
+        gate (QualityGate, optional): Scores faces between detection and embedding,
+            so dropped faces are never embedded.
+
+    Returns:
+        List[dict]: Face records (see face_record), possibly empty.
+    """
+    img = image if isinstance(image, np.ndarray) else preprocess_image(image)
     if img is None:
         logger.error("Image preprocessing returned None.")
         return []
@@ -69,64 +289,186 @@ def extract_features(image_bytes):
         return []
     
     try:
-        faces = app_insight_singleton.app_insight.get(img)
-        logger.info(f"Detected {len(faces)} faces in the image.")
-        face_embeddings = [face.embedding for face in faces if hasattr(face, 'embedding')]
-        return face_embeddings
+        with model_slot():
+            faces = detect_face_boxes(img)
+            detected = len(faces)
+            if gate is not None:
+                faces = gate.apply(img, faces)
+            faces = embed_faces(img, faces)
+        logger.info("Detected %d faces in the image, kept %d.", detected, len(faces))
+        return [face_record(face) for face in faces if getattr(face, 'embedding', None) is not None]
     except Exception as e:
         logger.error(f"Error during feature extraction: {e}")
         return []
 
-def process_new_images(image_data_list, project_id, eps=0.5, min_samples=1):
-    logger.info(f"Starting processing of {len(image_data_list)} images for project {project_id}.")
+def extract_features(image_bytes):
+    return [record['embedding'] for record in extract_face_records(image_bytes)]
 
-    embeddings = []
-    face_ids = []
-    for image_data in image_data_list:
-        gridfs_id = image_data['gridfs_id']
+def load_image_bytes(gridfs_id, grid_fs=None):
+    """
+    Reads the bytes of a stored image back out of GridFS.
+
+    Args:
+        gridfs_id (str): GridFS ID of the image.
+        grid_fs (gridfs.GridFS, optional): GridFS instance. Defaults to the app's.
+
+    Returns:
+        bytes: Raw image bytes.
+    """
+    if grid_fs is None:
+        grid_fs = current_app.extensions['grid_fs']
+    return grid_fs.get(ObjectId(gridfs_id)).read()
+
+def extraction_signature():
+    """
+    Identifies the model and settings face records are extracted with, so
+    records cached for a blob are only reused while they would come out the same.
+    """
+    settings = {key: value for key, value in current_app.config.items()
+                if key.startswith(('FACE_QUALITY_', 'TILED_DETECTION_'))}
+    settings['model'] = EXTRACTION_MODEL
+    return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+def extract_faces_for_image(image_data, grid_fs=None):
+    """
+    Extracts a record for each face in an uploaded image.
+
+    The image is taken from 'image' (a decoded BGR array) or 'image_bytes' when
+    the caller still holds it, and read back from GridFS only otherwise, e.g.
+    when reprocessing. Records already extracted from the same content (by
+    hash) with the same settings are reused without touching the image.
+
+    Args:
+        image_data (dict): Image metadata with 'gridfs_id' (only required when the
+            image is not passed in memory), and 'hash' to reuse earlier extractions.
+        grid_fs (gridfs.GridFS, optional): GridFS instance. Defaults to the app's.
+
+    Returns:
+        List[dict]: Face records tagged with the image's 'gridfs_id' (may be empty).
+    """
+    gridfs_id = image_data.get('gridfs_id')
+    image_hash = image_data.get('hash')
+    signature = None
+    if image_hash and current_app.config.get('EXTRACTION_REUSE_ENABLED', True):
+        signature = extraction_signature()
+        records = cached_records(image_hash, signature)
+        if records is not None:
+            logger.info("Reused %d face records extracted earlier from image %s.", len(records), image_hash)
+            for record in records:
+                record['gridfs_id'] = gridfs_id
+            return records
+
+    image = image_data.get('image')
+    if image is None:
+        image = image_data.get('image_bytes')
+    if image is None:
         try:
-            grid_fs = current_app.extensions['grid_fs']
-            image_bytes = grid_fs.get(ObjectId(gridfs_id)).read()
+            image = load_image_bytes(gridfs_id, grid_fs)
         except Exception as e:
             logger.error(f"Error retrieving image {gridfs_id} from GridFS: {e}")
-            continue  # Skip this image
-        
-        image_embeddings = extract_features(image_bytes)
-        if not image_embeddings:
-            logger.warning(f"No faces detected in image {gridfs_id}.")
-            continue  # Skip images with no faces
-        
-        for embedding in image_embeddings:
-            embeddings.append(embedding)
-            face_ids.append(image_data['gridfs_id'])
-
-    if not embeddings:
+            return []
+
+    records = extract_face_records(image, gate=quality_gate())
+    if not records:
+        # Not cached: an empty result may also mean the extraction failed
+        logger.warning("No faces detected in image %s.", gridfs_id)
+    elif signature:
+        try:
+            store_records(image_hash, signature, records)
+        except Exception as e:
+            logger.error(f"Error caching face records of image {image_hash}: {e}")
+    for record in records:
+        record['gridfs_id'] = gridfs_id
+    return records
+
+def cluster_and_store_faces(records, project_id, eps=0.5, min_samples=1):
+    """
+    Clusters a batch of face records with DBSCAN and stores one Face document per face.
+
+    The first face of each image fills in the image's placeholder Face document;
+    every further face in the same image gets its own Face document sharing the
+    image's hash and gridfs_id.
+
+    Args:
+        records (List[dict]): Face records, each with 'gridfs_id', 'embedding', 'bbox'
+            and 'det_score', plus optional 'quality', 'searchable', 'frame_ts' and
+            'source_hash'. Non-searchable faces are stored with the noise label.
+        project_id (str): ID of the project the images belong to.
+        eps (float, optional): DBSCAN neighbourhood radius. Defaults to 0.5.
+        min_samples (int, optional): DBSCAN core point size. Defaults to 1.
+    """
+    if not records:
         logger.warning("No valid embeddings extracted from the uploaded images.")
         return
 
-    embeddings = np.array(embeddings)
-    embeddings_normalized = normalize(embeddings)
-
-    try:
-        clustering = DBSCAN(eps=eps, min_samples=min_samples, metric='cosine').fit(embeddings_normalized)
-        labels = clustering.labels_
-        logger.info(f"DBSCAN clustering completed with {len(set(labels))} clusters.")
-    except Exception as e:
-        logger.error(f"Error during DBSCAN clustering: {e}")
-        raise
+    # Faces flagged by the quality gate are stored as noise rather than clustered
+    labels = np.full(len(records), -1)
+    searchable = [i for i, record in enumerate(records) if record.get('searchable', True)]
+    if searchable:
+        embeddings = np.array([records[i]['embedding'] for i in searchable])
+        embeddings_normalized = normalize(embeddings)
 
-    for face_id, label, embedding in zip(face_ids, labels, embeddings):
         try:
-            face = Face.objects(gridfs_id=face_id, project=project_id).first()
-            if face:
-                face.cluster_label = str(label)
-                face.set_encoding(embedding)
-                face.save()
-                logger.debug(f"Updated Face {face.id} with cluster_label={label}.")
+            clustering = DBSCAN(eps=eps, min_samples=min_samples, metric='cosine').fit(embeddings_normalized)
+            labels[searchable] = clustering.labels_
+            logger.info(f"DBSCAN clustering completed with {len(set(clustering.labels_))} clusters.")
+        except Exception as e:
+            logger.error(f"Error during DBSCAN clustering: {e}")
+            raise
+
+    placeholders = {}  # gridfs_id -> the image's placeholder Face, filled by its first face
+    new_faces = []
+    stored = []
+    for record, label in zip(records, labels):
+        gridfs_id = record['gridfs_id']
+        try:
+            if gridfs_id in placeholders:
+                # Further faces in the same image get their own Face document
+                face = Face(gridfs_id=gridfs_id, project=ObjectId(str(project_id)), hash=placeholders[gridfs_id].hash)
+                new_faces.append(face)
             else:
-                logger.warning(f"Face document with gridfs_id={face_id} not found.")
+                face = Face.objects(gridfs_id=gridfs_id, project=project_id).first()
+                if not face:
+                    logger.warning(f"Face document with gridfs_id={gridfs_id} not found.")
+                    continue
+                placeholders[gridfs_id] = face
+
+            face.cluster_label = str(label)
+            face.set_encoding(record['embedding'])
+            face.bbox = record.get('bbox')
+            face.det_score = record.get('det_score')
+            face.quality = record.get('quality')
+            face.searchable = record.get('searchable', True)
+            face.frame_ts = record.get('frame_ts')
+            face.source_hash = record.get('source_hash')
+            face.save()
+            stored.append(face.id)
+            logger.debug("Updated Face %s with cluster_label=%s.", face.id, label)
         except Exception as e:
-            logger.error(f"Error updating Face document {face_id}: {e}")
+            logger.error(f"Error updating Face document {gridfs_id}: {e}")
+
+    new_face_ids = [face.id for face in new_faces if face.id]
+    update = {'push_all__faces': new_face_ids} if new_face_ids else {}
+    Project.bump_version(project_id, 'faces_processed', stored, **update)
+
+def process_new_images(image_data_list, project_id, eps=0.5, min_samples=1):
+    """
+    Extracts the faces of newly stored images and clusters them into the project.
+
+    Args:
+        image_data_list (List[dict]): Image metadata as taken by extract_faces_for_image;
+            entries carrying 'image' or 'image_bytes' are not read back from GridFS.
+        project_id (str): ID of the project the images belong to.
+        eps (float, optional): DBSCAN neighbourhood radius. Defaults to 0.5.
+        min_samples (int, optional): DBSCAN core point size. Defaults to 1.
+    """
+    logger.info(f"Starting processing of {len(image_data_list)} images for project {project_id}.")
+
+    records = []
+    for image_data in image_data_list:
+        records.extend(extract_faces_for_image(image_data))
+
+    cluster_and_store_faces(records, project_id, eps=eps, min_samples=min_samples)
 
 # app/utils/ml_model.py
 
@@ -145,77 +487,44 @@ def find_matching_faces(query_embeddings, project_id, tolerance=0.6):
     Raises:
         ValueError: If the project is not found or no faces are detected in the project.
     """
-    logger.debug(f"Starting face matching for project_id={project_id} with tolerance={tolerance}")
-    project = Project.objects(id=project_id).first()
-    if not project:
+    logger.debug("Starting face matching for project_id=%s with tolerance=%s", project_id, tolerance)
+    try:
+        index = get_project_index(project_id)
+    except ValueError:
         logger.error(f"Project with ID {project_id} not found.")
-        raise ValueError("Project not found.")
-
-    faces = project.faces
-    logger.debug(f"Found {len(faces)} faces in the project.")
-    if not faces:
-        logger.info("No faces found in the project.")
-        return []
+        raise
 
-    # Convert QuerySet to list to ensure it's indexable
-    project_faces = list(Face.objects(id__in=[face.id for face in faces if face.encoding]))
-    logger.debug(f"Found {len(project_faces)} project faces with valid encodings.")
-    if not project_faces:
+    if not len(index):
         logger.info("No valid face encodings found in the project.")
         return []
-
-    project_embeddings = []
-    for face in project_faces:
-        try:
-            encoding = face.get_encoding()
-            project_embeddings.append(encoding)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decoding error for Face ID {face.id}: {e}")
-            continue  # Skip this face
-        except Exception as e:
-            logger.error(f"Unexpected error decoding encoding for Face ID {face.id}: {e}")
-            continue  # Skip this face
-
-    if not project_embeddings:
-        logger.error("No valid embeddings found after decoding.")
-        raise Exception("No valid embeddings available for matching.")
-
-    logger.debug(f"Collected {len(project_embeddings)} embeddings for matching.")
-    project_embeddings = np.array(project_embeddings)
-    project_embeddings_normalized = normalize(project_embeddings)
-    logger.debug("Normalized project embeddings.")
+    logger.debug("Searching %d faces in a %s index.", len(index), index.mode)
 
     related_image_ids = set()
 
     for query_idx, query_embedding in enumerate(query_embeddings):
         try:
-            query_embedding_normalized = normalize([query_embedding])[0]
-            similarities = np.dot(project_embeddings_normalized, query_embedding_normalized)
-            matches = np.where(similarities > tolerance)[0].tolist()  # Convert to list of integers
-            logger.debug(f"Query Embedding {query_idx + 1}: Found {len(matches)} matches with tolerance {tolerance}.")
-
-            for idx in matches:
-                # Ensure idx is a standard Python int
-                matching_face = project_faces[int(idx)]
-                related_image_ids.add(matching_face.gridfs_id)
-                logger.debug(f"Match Found: Query Embedding {query_idx + 1} matches with Image ID {matching_face.gridfs_id} (Similarity: {similarities[idx]:.2f})")
+            query_embedding_normalized = normalize([query_embedding])[0].astype(np.float32)
+            matches, similarities = index.search(query_embedding_normalized, tolerance)
+            logger.debug("Query Embedding %d: Found %d matches with tolerance %s.", query_idx + 1, len(matches), tolerance)
+            related_image_ids.update(index.gridfs_ids[matches])
         except Exception as e:
             logger.error(f"Error processing query embedding {query_idx + 1}: {e}")
             continue  # Skip this query embedding
 
-    logger.debug(f"Total matching images: {len(related_image_ids)}")
+    logger.debug("Total matching images: %d", len(related_image_ids))
 
     return list(related_image_ids)
 
 
 
 def get_unique_faces_for_project(project_id):
-    project = Project.objects(id=project_id).first()
+    project = Project.objects(id=project_id).only('id').first()
     if not project:
         logger.error(f"Project with ID {project_id} not found.")
         return []
 
-    faces = Face.objects(project=project_id).exclude(cluster_label="-1").order_by('cluster_label')
+    # Within a cluster the highest-quality face comes first and becomes its representative
+    faces = Face.objects(project=project_id, cluster_label__ne="-1").order_by('cluster_label', '-quality')
 
     if not faces:
         logger.info("No faces found in the project.")
@@ -0,0 +1,97 @@
+# app/utils/pagination.py
+
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Response, request, stream_with_context
+
+def parse_page_args(default_limit=100, max_limit=1000):
+    """
+    Reads the 'limit' and 'cursor' query parameters of a paginated request.
+
+    Args:
+        default_limit (int, optional): Page size when none is given.
+        max_limit (int, optional): Largest page size accepted.
+
+    Returns:
+        tuple: (limit, cursor) where cursor is an ObjectId or None.
+
+    Raises:
+        ValueError: If either parameter is malformed.
+    """
+    try:
+        limit = int(request.args.get('limit', default_limit))
+    except ValueError:
+        raise ValueError('limit must be an integer.')
+    if limit < 1:
+        raise ValueError('limit must be positive.')
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor = ObjectId(cursor)
+        except (InvalidId, TypeError):
+            raise ValueError('Invalid cursor.')
+
+    return min(limit, max_limit), cursor or None
+
+def paginate(queryset, limit, cursor=None):
+    """
+    Applies keyset pagination on _id to a QuerySet.
+
+    One extra document is requested so the caller can tell whether another page exists.
+
+    Returns:
+        QuerySet: The page query, sorted by _id.
+    """
+    if cursor is not None:
+        queryset = queryset.filter(id__gt=cursor)
+    return queryset.order_by('id').limit(limit + 1)
+
+def page_of(docs, limit):
+    """
+    Splits a fetched page (of up to limit + 1 raw documents) into items and next cursor.
+
+    Returns:
+        tuple: (docs, next_cursor) where next_cursor is a string or None.
+    """
+    docs = list(docs)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, str(docs[-1]['_id'])
+    return docs, None
+
+def streamed_page_response(fields, items_key, docs, limit, serialize):
+    """
+    Streams a JSON object whose items_key holds one page of documents.
+
+    The page is encoded item by item as the database cursor is consumed, and
+    'next_cursor' is written after the items, so the page is never held in
+    memory as one list.
+
+    Args:
+        fields (dict): Other top-level fields of the object.
+        items_key (str): Key of the streamed array.
+        docs (iterable): Raw documents, up to limit + 1 of them.
+        limit (int): Page size.
+        serialize (callable): Turns a raw document into a JSON-serializable value.
+
+    Returns:
+        Response: Streamed application/json response.
+    """
+    def generate():
+        head = json.dumps(fields)
+        yield head[:-1] + (', ' if fields else '') + json.dumps(items_key) + ': ['
+
+        next_cursor = None
+        last_id = None
+        for count, doc in enumerate(docs):
+            if count == limit:
+                next_cursor = str(last_id)
+                break
+            yield (', ' if count else '') + json.dumps(serialize(doc))
+            last_id = doc['_id']
+
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,231 @@
+# app/utils/project_io.py
+
+import json
+import logging
+import numpy as np
+from bson import ObjectId
+
+from app.models.face import Face
+from app.models.project import Project
+from app.utils.blob_store import retain_blobs
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_VERSION = 2
+# Version 1 exports lack the per-face detection and review columns
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+EXPORT_DTYPES = {'float32': np.float32, 'float16': np.float16}
+
+def export_project(project, fileobj, dtype='float32', batch_size=2000):
+    """
+    Writes a project's faces, embeddings, cluster labels and per-face detection
+    and review fields to a columnar .npz file.
+
+    Face documents are streamed as raw dictionaries with a projection, so no
+    Document objects are built and memory holds only the output columns.
+
+    Args:
+        project (Project): Project to export.
+        fileobj (file-like): Writable binary file.
+        dtype (str, optional): 'float32' or 'float16' for the embedding matrix.
+        batch_size (int, optional): Cursor batch size.
+
+    Returns:
+        dict: Summary of the export.
+    """
+    if dtype not in EXPORT_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {dtype}.")
+
+    query = Face.objects(project=project.id)
+    total = query.count()
+
+    face_ids = np.empty(total, dtype='S24')
+    gridfs_ids = np.empty(total, dtype='S24')
+    hashes = np.empty(total, dtype='S64')
+    cluster_labels = []
+    embeddings = None
+    has_embedding = np.zeros(total, dtype=bool)
+    label_locked = np.zeros(total, dtype=bool)
+    searchable = np.ones(total, dtype=bool)
+    # Missing boxes and scores are stored as NaN
+    bboxes = np.full((total, 4), np.nan, dtype=np.float64)
+    det_scores = np.full(total, np.nan, dtype=np.float64)
+    qualities = np.full(total, np.nan, dtype=np.float64)
+    frame_ts = np.full(total, np.nan, dtype=np.float64)
+    source_hashes = np.empty(total, dtype='S64')
+
+    count = 0
+    cursor = (query.only('id', 'hash', 'gridfs_id', 'cluster_label', 'encoding', 'label_locked', 'searchable',
+                         'bbox', 'det_score', 'quality', 'source_hash', 'frame_ts')
+              .as_pymongo().batch_size(batch_size))
+    for doc in cursor:
+        if count == total:
+            break  # Faces added while exporting are left for the next export
+        face_ids[count] = str(doc['_id'])
+        gridfs_ids[count] = doc.get('gridfs_id', '')
+        hashes[count] = doc.get('hash', '')
+        cluster_labels.append(doc.get('cluster_label') or '')
+        label_locked[count] = bool(doc.get('label_locked', False))
+        searchable[count] = doc.get('searchable', True) is not False
+        if doc.get('bbox'):
+            bboxes[count] = doc['bbox']
+        for column, field in ((det_scores, 'det_score'), (qualities, 'quality'), (frame_ts, 'frame_ts')):
+            if doc.get(field) is not None:
+                column[count] = doc[field]
+        source_hashes[count] = doc.get('source_hash') or ''
+
+        encoding = doc.get('encoding')
+        if encoding:
+            vector = np.asarray(json.loads(encoding), dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.zeros((total, vector.shape[0]), dtype=EXPORT_DTYPES[dtype])
+            embeddings[count] = vector
+            has_embedding[count] = True
+        count += 1
+
+    if embeddings is None:
+        embeddings = np.zeros((total, 0), dtype=EXPORT_DTYPES[dtype])
+
+    meta = {
+        'format_version': EXPORT_FORMAT_VERSION,
+        'project_id': str(project.id),
+        'p_name': project.p_name,
+        'description': project.description,
+        'dtype': dtype,
+        'count': count
+    }
+    np.savez(
+        fileobj,
+        meta=np.array(json.dumps(meta)),
+        face_ids=face_ids[:count],
+        gridfs_ids=gridfs_ids[:count],
+        hashes=hashes[:count],
+        cluster_labels=np.array(cluster_labels, dtype=str),
+        has_embedding=has_embedding[:count],
+        embeddings=embeddings[:count],
+        label_locked=label_locked[:count],
+        searchable=searchable[:count],
+        bboxes=bboxes[:count],
+        det_scores=det_scores[:count],
+        qualities=qualities[:count],
+        source_hashes=source_hashes[:count],
+        frame_ts=frame_ts[:count]
+    )
+
+    logger.info(f"Exported {count} faces from project {project.id} ({dtype}).")
+    return meta
+
+def import_project(project, fileobj, mongo_db=None, batch_size=2000):
+    """
+    Loads faces from an export file into a project with bulk inserts.
+
+    Faces already in the project (same image hash and bounding box) are
+    skipped, so an import can be safely repeated; every face of a multi-face
+    image is imported. The referenced GridFS blobs are not part of the export
+    and must already exist in the target database.
+
+    Args:
+        project (Project): Project to import into.
+        fileobj (file-like): Seekable binary file produced by export_project.
+        mongo_db (pymongo.database.Database, optional): Used to count missing GridFS blobs.
+        batch_size (int, optional): Documents inserted per bulk write.
+
+    Returns:
+        dict: Summary of the import.
+
+    Raises:
+        ValueError: If the file is not a supported export.
+    """
+    with np.load(fileobj, allow_pickle=False) as data:
+        try:
+            meta = json.loads(str(data['meta']))
+        except KeyError:
+            raise ValueError("File is not a project export.")
+        if meta.get('format_version') not in SUPPORTED_FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported export format version {meta.get('format_version')}.")
+
+        gridfs_ids = data['gridfs_ids']
+        hashes = data['hashes']
+        cluster_labels = data['cluster_labels']
+        has_embedding = data['has_embedding']
+        embeddings = data['embeddings'].astype(np.float32)
+        total = len(hashes)
+        if meta['format_version'] >= 2:
+            label_locked = data['label_locked']
+            searchable = data['searchable']
+            bboxes = data['bboxes']
+            det_scores = data['det_scores']
+            qualities = data['qualities']
+            source_hashes = data['source_hashes']
+            frame_ts = data['frame_ts']
+        else:
+            label_locked = np.zeros(total, dtype=bool)
+            searchable = np.ones(total, dtype=bool)
+            bboxes = np.full((total, 4), np.nan)
+            det_scores = qualities = frame_ts = np.full(total, np.nan)
+            source_hashes = np.full(total, b'', dtype='S64')
+
+    collection = Face._get_collection()
+    existing_faces = set()
+    images = set()  # (hash, gridfs_id) already placed in the project
+    for doc in Face.objects(project=project.id).only('hash', 'gridfs_id', 'bbox').as_pymongo():
+        existing_faces.add((doc.get('hash'), tuple(doc.get('bbox') or ())))
+        images.add((doc.get('hash'), doc.get('gridfs_id')))
+
+    imported = 0
+    skipped = 0
+    missing_blobs = 0
+    for start in range(0, total, batch_size):
+        docs = []
+        new_images = []
+        for i in range(start, min(start + batch_size, total)):
+            image_hash = hashes[i].decode()
+            gridfs_id = gridfs_ids[i].decode()
+            bbox = [float(v) for v in bboxes[i]] if not np.isnan(bboxes[i]).any() else []
+            key = (image_hash, tuple(bbox))
+            if key in existing_faces:
+                skipped += 1
+                continue
+            existing_faces.add(key)
+            if (image_hash, gridfs_id) not in images:
+                images.add((image_hash, gridfs_id))
+                new_images.append((image_hash, gridfs_id))
+
+            doc = {
+                'hash': image_hash,
+                'project': project.id,
+                'gridfs_id': gridfs_id,
+                'cluster_label': str(cluster_labels[i]) or None,
+                'encoding': json.dumps(embeddings[i].tolist()) if has_embedding[i] else None,
+                'label_locked': bool(label_locked[i]),
+                'searchable': bool(searchable[i])
+            }
+            if bbox:
+                doc['bbox'] = bbox
+            for field, column in (('det_score', det_scores), ('quality', qualities), ('frame_ts', frame_ts)):
+                if not np.isnan(column[i]):
+                    doc[field] = float(column[i])
+            if source_hashes[i]:
+                doc['source_hash'] = source_hashes[i].decode()
+            docs.append(doc)
+        if not docs:
+            continue
+
+        if mongo_db is not None:
+            blob_ids = list({ObjectId(doc['gridfs_id']) for doc in docs})
+            found = mongo_db.fs.files.count_documents({'_id': {'$in': blob_ids}})
+            missing_blobs += len(blob_ids) - found
+
+        result = collection.insert_many(docs, ordered=False)
+        retain_blobs(new_images)
+        Project.bump_version(project.id, 'faces_imported', result.inserted_ids, push_all__faces=result.inserted_ids)
+        imported += len(result.inserted_ids)
+
+    logger.info(f"Imported {imported} faces into project {project.id} ({skipped} skipped, "
+                f"{missing_blobs} missing GridFS blobs).")
+    return {
+        'imported': imported,
+        'skipped': skipped,
+        'missing_blobs': missing_blobs,
+        'source_project_id': meta.get('project_id')
+    }
@@ -0,0 +1,288 @@
+# app/utils/resumable_upload.py
+
+from datetime import datetime, timedelta, timezone
+import hashlib
+import io
+import logging
+import threading
+import time
+import uuid
+from bson import Binary, ObjectId
+from mongoengine.queryset.visitor import Q
+from werkzeug.exceptions import ClientDisconnected
+
+from app.models.upload_session import UploadSession
+from app.utils.image_processing import is_image_file
+
+logger = logging.getLogger(__name__)
+
+# Matches the default GridFS chunk size, so finalized files read like any other
+CHUNK_SIZE = 255 * 1024
+
+# Minimum seconds between sweeps triggered by new sessions
+SWEEP_INTERVAL = 600
+
+# Seconds a writer's lease lasts without renewal; renewed while chunks keep arriving
+WRITE_LEASE = 120
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+class UploadConflict(Exception):
+    """
+    Raised when a byte range does not start at the session's committed offset.
+    """
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}.")
+        self.offset = offset
+
+class UploadInProgress(Exception):
+    """
+    Raised when another request holds the session's write lease.
+    """
+    def __init__(self, retry_after):
+        super().__init__('Another request is writing to this upload.')
+        self.retry_after = retry_after
+
+def create_session(user_id, project_id, filename, size, sha256=None, ttl=86400):
+    """
+    Opens a resumable upload of one file.
+
+    Args:
+        user_id (str): ID of the uploading user.
+        project_id (str): ID of the target project.
+        filename (str): Sanitized file name.
+        size (int): Total size in bytes.
+        sha256 (str, optional): Expected hex digest, checked on finalize.
+        ttl (int, optional): Seconds of inactivity after which the session expires.
+
+    Returns:
+        UploadSession: The saved session.
+    """
+    return UploadSession(
+        user=ObjectId(str(user_id)),
+        project=ObjectId(str(project_id)),
+        filename=filename,
+        size=size,
+        sha256=sha256.lower() if sha256 else None,
+        chunk_size=CHUNK_SIZE,
+        file_id=ObjectId(),
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    ).save()
+
+def _put_chunk(chunks, file_id, n, data):
+    # Upsert, so retried ranges overwrite the chunks they wrote before
+    chunks.replace_one({'files_id': file_id, 'n': n},
+                       {'files_id': file_id, 'n': n, 'data': Binary(data)}, upsert=True)
+
+def _lease_filter(session_id, now):
+    return Q(id=session_id, status='open') & (Q(writer=None) | Q(lease_expires_at__lt=now))
+
+def write_range(session, start, length, stream, mongo_db, ttl=86400):
+    """
+    Writes a byte range of the upload directly into GridFS chunks.
+
+    The range must start at the committed offset, and the request must first
+    take the session's write lease, so a client retrying while its earlier
+    request is still streaming cannot overwrite the chunks that request
+    writes. The lease is renewed while data keeps arriving; a writer that
+    loses it stops writing. A trailing partial chunk is stored as is and
+    completed by the next range. The offset is advanced only after the chunks
+    are written, and also when the client disconnects part-way, so a retry
+    resumes after the last byte received.
+
+    Args:
+        session (UploadSession): Open session.
+        start (int): First byte of the range.
+        length (int): Number of bytes in the range.
+        stream (io.RawIOBase): Request body.
+        mongo_db (pymongo.database.Database): Database holding the 'fs' bucket.
+        ttl (int, optional): New inactivity timeout in seconds.
+
+    Returns:
+        int: The new committed offset.
+
+    Raises:
+        UploadConflict: If start is not the committed offset.
+        UploadInProgress: If another request is writing to the session.
+        ValueError: If the range runs past the announced size.
+    """
+    if start != session.offset:
+        raise UploadConflict(session.offset)
+    if length < 0 or start + length > session.size:
+        raise ValueError('Range exceeds the announced upload size.')
+
+    token = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    if not UploadSession.objects(_lease_filter(session.id, now) & Q(offset=start)).update_one(
+            set__writer=token, set__lease_expires_at=now + timedelta(seconds=WRITE_LEASE)):
+        session.reload()
+        if session.offset != start or session.status != 'open':
+            raise UploadConflict(session.offset)
+        raise UploadInProgress(WRITE_LEASE)
+    renewed = time.monotonic()
+
+    chunks = mongo_db.fs.chunks
+    chunk_size = session.chunk_size
+    n, partial = divmod(start, chunk_size)
+    buffer = b''
+    received = 0
+    lease_lost = False
+    try:
+        if partial:
+            existing = chunks.find_one({'files_id': session.file_id, 'n': n}, {'data': 1})
+            if existing is None or len(existing['data']) < partial:
+                raise UploadConflict(n * chunk_size)
+            buffer = bytes(existing['data'][:partial])
+
+        try:
+            while received < length:
+                data = stream.read(min(chunk_size, length - received))
+                if not data:
+                    break
+                if time.monotonic() - renewed > WRITE_LEASE / 2:
+                    if not UploadSession.objects(id=session.id, writer=token).update_one(
+                            set__lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=WRITE_LEASE)):
+                        lease_lost = True
+                        break
+                    renewed = time.monotonic()
+                received += len(data)
+                buffer += data
+                while len(buffer) >= chunk_size:
+                    _put_chunk(chunks, session.file_id, n, buffer[:chunk_size])
+                    n += 1
+                    buffer = buffer[chunk_size:]
+        except ClientDisconnected:
+            logger.info("Client disconnected from upload %s after %d bytes.", session.id, received)
+        finally:
+            if buffer and not lease_lost:
+                _put_chunk(chunks, session.file_id, n, buffer)
+    except BaseException:
+        UploadSession.objects(id=session.id, writer=token).update_one(unset__writer=True,
+                                                                      unset__lease_expires_at=True)
+        raise
+
+    if lease_lost:
+        logger.warning("Upload %s lost its write lease after %d bytes.", session.id, received)
+        session.reload()
+        raise UploadConflict(session.offset)
+
+    offset = start + received
+    committed = UploadSession.objects(id=session.id, offset=start, status='open', writer=token).update_one(
+        set__offset=offset, set__expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl),
+        unset__writer=True, unset__lease_expires_at=True)
+    if not committed:
+        session.reload()
+        raise UploadConflict(session.offset)
+    session.offset = offset
+    return offset
+
+def delete_chunks(mongo_db, file_id):
+    return mongo_db.fs.chunks.delete_many({'files_id': file_id}).deleted_count
+
+def finalize_session(session, mongo_db, sha256=None):
+    """
+    Verifies a complete upload and publishes it as a GridFS file.
+
+    The chunks are hashed in order; a digest that does not match the expected
+    one, or content that is not an image, discards the upload.
+
+    Args:
+        session (UploadSession): Open session whose offset equals its size.
+        mongo_db (pymongo.database.Database): Database holding the 'fs' bucket.
+        sha256 (str, optional): Expected hex digest, if not given at creation.
+
+    Returns:
+        dict: Image data with 'gridfs_id', 'original_filename', 'hash' and 'size'.
+
+    Raises:
+        ValueError: If the upload is incomplete, corrupted or not an image.
+        UploadConflict: If another request is finalizing the session.
+    """
+    if session.offset != session.size:
+        raise ValueError(f"Upload is incomplete: {session.offset} of {session.size} bytes received.")
+    expected = (sha256 or session.sha256 or '').lower()
+    if not expected:
+        raise ValueError('sha256 is required to finalize the upload.')
+    if not UploadSession.objects(id=session.id, status='open', offset=session.size).update_one(
+            set__status='finalizing'):
+        raise UploadConflict(session.offset)  # Finalized concurrently
+
+    digest = hashlib.sha256()
+    header = b''
+    length = 0
+    for chunk in mongo_db.fs.chunks.find({'files_id': session.file_id}).sort('n', 1):
+        data = bytes(chunk['data'])
+        if not header:
+            header = data[:512]
+        digest.update(data)
+        length += len(data)
+
+    failure = None
+    if length != session.size:
+        failure = f"Stored upload has {length} bytes, expected {session.size}."
+    elif digest.hexdigest() != expected:
+        failure = 'SHA-256 mismatch; the upload was corrupted.'
+    elif not is_image_file(io.BytesIO(header)):
+        failure = f"Uploaded file {session.filename} is not a valid image."
+    if failure:
+        delete_chunks(mongo_db, session.file_id)
+        session.delete()
+        raise ValueError(failure)
+
+    mongo_db.fs.files.insert_one({
+        '_id': session.file_id,
+        'length': session.size,
+        'chunkSize': session.chunk_size,
+        'uploadDate': datetime.now(timezone.utc),
+        'filename': session.filename
+    })
+    session.update(set__status='finalized', set__sha256=expected)
+    session.status = 'finalized'
+    logger.info("Finalized resumable upload %s into GridFS file %s.", session.id, session.file_id)
+    return {
+        'gridfs_id': str(session.file_id),
+        'original_filename': session.filename,
+        'hash': expected,
+        'size': session.size
+    }
+
+def expire_sessions(mongo_db, dry_run=False, now=None):
+    """
+    Removes expired sessions, and the chunks of those never finalized
+    (including finalizations interrupted by a crash).
+
+    Returns:
+        dict: Number of 'expired_uploads' and 'expired_upload_bytes' reclaimed.
+    """
+    now = now or datetime.now(timezone.utc)
+    summary = {'expired_uploads': 0, 'expired_upload_bytes': 0}
+    for session in UploadSession.objects(expires_at__lt=now).only('id', 'file_id', 'offset', 'status'):
+        summary['expired_uploads'] += 1
+        if session.status != 'finalized':
+            summary['expired_upload_bytes'] += session.offset
+        if dry_run:
+            continue
+        if session.status != 'finalized':
+            delete_chunks(mongo_db, session.file_id)
+        session.delete()
+    return summary
+
+def sweep_expired_sessions(mongo_db):
+    """
+    Runs expire_sessions at most once every SWEEP_INTERVAL seconds, so
+    abandoned uploads are reclaimed even when periodic GC is disabled.
+    """
+    global _last_sweep
+    with _sweep_lock:
+        if time.monotonic() - _last_sweep < SWEEP_INTERVAL:
+            return None
+        _last_sweep = time.monotonic()
+    try:
+        summary = expire_sessions(mongo_db)
+        if summary['expired_uploads']:
+            logger.info(f"Expired {summary['expired_uploads']} upload sessions.")
+        return summary
+    except Exception as e:
+        logger.error(f"Error expiring upload sessions: {e}")
+        return None
@@ -0,0 +1,62 @@
+# app/utils/search_cache.py
+
+import hashlib
+import sys
+import threading
+from flask import current_app
+
+from app.models.project import Project
+from app.utils.cache import SizedLRUCache
+from app.utils import metrics
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def _sizeof(result):
+    # A tuple of GridFS id strings
+    return sys.getsizeof(result) + sum(sys.getsizeof(gridfs_id) for gridfs_id in result)
+
+def _search_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SizedLRUCache(max_entries=current_app.config.get('SEARCH_CACHE_ENTRIES', 1000),
+                                   max_bytes=current_app.config.get('SEARCH_CACHE_BYTES', 64 * 1024 * 1024),
+                                   sizeof=_sizeof)
+            metrics.register_provider('search_cache', _cache.stats)
+        return _cache
+
+def search_key(project_id, image_bytes, tolerance):
+    """
+    Builds the cache key of a search: (project_id, project version, query image hash, tolerance).
+
+    The version is read before searching, so results computed while the
+    project changes are stored under the old version and never served after it.
+
+    Raises:
+        ValueError: If the project is not found.
+    """
+    project = Project.objects(id=project_id).only('version').as_pymongo().first()
+    if not project:
+        raise ValueError(f"Project with ID {project_id} not found.")
+    return (str(project_id), project.get('version', 0), hashlib.sha256(image_bytes).hexdigest(), float(tolerance))
+
+def get_cached_search(key):
+    """
+    Returns the cached matching GridFS ids for key, or None.
+    """
+    if not current_app.config.get('SEARCH_CACHE_ENABLED', True):
+        return None
+    result = _search_cache().get(key)
+    return list(result) if result is not None else None
+
+def cache_search(key, related_image_ids):
+    """
+    Stores a search result and drops the project's results for older versions.
+    """
+    if not current_app.config.get('SEARCH_CACHE_ENABLED', True):
+        return
+    cache = _search_cache()
+    project_id, version = key[0], key[1]
+    cache.invalidate(lambda other: other[0] == project_id and other[1] < version)
+    cache.set(key, tuple(related_image_ids))
@@ -0,0 +1,232 @@
+# app/utils/similarity.py
+
+from datetime import datetime, timezone
+import logging
+import threading
+import time
+import numpy as np
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DTYPES = ('float32', 'float16', 'int8')
+
+# Rows up-cast per block by the numpy float16/int8 kernels
+BLOCK_ROWS = 65536
+
+def quantize_int8(vectors):
+    """
+    Scales each row so its largest component maps to 127 and rounds to int8.
+    Cosine similarity is unaffected by the per-row scale.
+
+    Args:
+        vectors (np.ndarray): (n, d) or (d,) float matrix.
+
+    Returns:
+        np.ndarray: int8 array of the same shape.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    peaks = np.max(np.abs(vectors), axis=-1, keepdims=True)
+    return np.round(vectors * (127.0 / np.maximum(peaks, 1e-12))).astype(np.int8)
+
+class NumpyKernel:
+    """
+    BLAS matrix-vector product. float16 and int8 rows are up-cast to float32
+    block by block, since numpy has no fast kernels for them; int8 rows are
+    divided by their norms, float rows are assumed to be normalized.
+    """
+    library = 'numpy'
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.name = f'numpy-{dtype}'
+
+    def cosine(self, matrix, query):
+        query = np.asarray(query, dtype=np.float32)
+        if self.dtype == 'float32':
+            return matrix @ query
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = matrix[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ query
+            if self.dtype == 'int8':
+                norms = np.sqrt(np.einsum('ij,ij->i', block, block))
+                scores[start:start + BLOCK_ROWS] /= np.maximum(norms, 1e-12) * np.linalg.norm(query)
+        return scores
+
+class SimsimdKernel:
+    """
+    SimSIMD's SIMD cosine distance, dispatched at runtime to the best
+    instruction set of the host CPU (AVX2, AVX-512, NEON, SVE).
+    """
+    library = 'simsimd'
+
+    def __init__(self, dtype):
+        import simsimd
+
+        self._simsimd = simsimd
+        self.dtype = dtype
+        self.name = f'simsimd-{dtype}'
+
+    def cosine(self, matrix, query):
+        if self.dtype == 'int8':
+            query = quantize_int8(query)
+        else:
+            query = np.asarray(query, dtype=matrix.dtype)
+        if not len(matrix):
+            return np.empty(0, dtype=np.float32)
+        distances = np.asarray(self._simsimd.cdist(query[None, :], matrix, metric='cosine'))
+        return (1.0 - distances.reshape(-1)).astype(np.float32)
+
+def available_kernels():
+    """
+    Builds every kernel usable on this host. simsimd is optional.
+
+    Returns:
+        List: Kernels, numpy first.
+    """
+    kernels = [NumpyKernel(dtype) for dtype in STORAGE_DTYPES]
+    try:
+        kernels += [SimsimdKernel(dtype) for dtype in STORAGE_DTYPES]
+    except ImportError:
+        logger.info("simsimd is not installed; using numpy similarity kernels only.")
+    return kernels
+
+def _prepare(vectors, dtype):
+    if dtype == 'int8':
+        return quantize_int8(vectors)
+    return np.ascontiguousarray(vectors, dtype=dtype)
+
+def benchmark(rows=20000, dims=512, repeats=5, seed=0):
+    """
+    Times every available kernel on random normalized vectors.
+
+    Args:
+        rows (int, optional): Rows in the benchmark matrix.
+        dims (int, optional): Embedding dimensions.
+        repeats (int, optional): Timed runs per kernel; the fastest counts.
+        seed (int, optional): Random seed.
+
+    Returns:
+        dict: Per kernel name, its 'dtype', 'rows_per_sec' and 'max_error'
+        against a float64 reference.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(rows, dims))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = vectors[0] + rng.normal(scale=0.5, size=dims)
+    query /= np.linalg.norm(query)
+    reference = vectors @ query
+    query = query.astype(np.float32)
+
+    results = {}
+    matrices = {dtype: _prepare(vectors, dtype) for dtype in STORAGE_DTYPES}
+    for kernel in available_kernels():
+        matrix = matrices[kernel.dtype]
+        try:
+            scores = kernel.cosine(matrix, query)  # Also warms caches and lazy dispatch
+            best = float('inf')
+            for _ in range(repeats):
+                started = time.perf_counter()
+                kernel.cosine(matrix, query)
+                best = min(best, time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"Similarity kernel {kernel.name} failed its benchmark: {e}")
+            continue
+        results[kernel.name] = {
+            'dtype': kernel.dtype,
+            'rows_per_sec': round(rows / max(best, 1e-9)),
+            'max_error': round(float(np.max(np.abs(scores - reference))), 6)
+        }
+    return results
+
+_selected = {dtype: NumpyKernel(dtype) for dtype in STORAGE_DTYPES}
+_status = {'state': 'default'}
+_lock = threading.Lock()
+
+def kernel_for(dtype):
+    """
+    Returns the kernel selected for rows stored as dtype. Until calibrate has
+    run this is the numpy kernel.
+    """
+    return _selected[dtype]
+
+def calibrate(backend='auto', rows=20000, dims=512, max_error=0.02):
+    """
+    Selects a kernel per storage dtype.
+
+    With backend 'auto', every available kernel is benchmarked and the
+    fastest one per dtype whose scores stay within max_error of the float64
+    reference wins, so a fast but inaccurate kernel never decides tolerance
+    matches; the numpy kernel serves when none qualifies. 'numpy' or
+    'simsimd' forces that library.
+
+    Args:
+        backend (str, optional): 'auto', 'numpy' or 'simsimd'.
+        rows (int, optional): Benchmark matrix rows.
+        dims (int, optional): Embedding dimensions.
+        max_error (float, optional): Largest absolute score error accepted in 'auto' mode.
+
+    Returns:
+        dict: Selected kernel name per dtype.
+    """
+    kernels = {kernel.name: kernel for kernel in available_kernels()}
+    results = {}
+    if backend == 'auto':
+        results = benchmark(rows=rows, dims=dims)
+
+    selected = {}
+    for dtype in STORAGE_DTYPES:
+        candidates = [kernel for kernel in kernels.values() if kernel.dtype == dtype]
+        if backend == 'auto':
+            candidates = [kernel for kernel in candidates
+                          if kernel.name in results and results[kernel.name]['max_error'] <= max_error]
+            candidates.sort(key=lambda kernel: -results[kernel.name]['rows_per_sec'])
+        else:
+            candidates = [kernel for kernel in candidates if kernel.library == backend] or candidates
+        selected[dtype] = candidates[0] if candidates else NumpyKernel(dtype)
+
+    with _lock:
+        _selected.update(selected)
+        _status.clear()
+        _status.update({
+            'state': 'calibrated' if backend == 'auto' else 'forced',
+            'backend': backend,
+            'calibrated_at': datetime.now(timezone.utc).isoformat(),
+            'benchmark': results,
+            'max_error': max_error
+        })
+    names = {dtype: kernel.name for dtype, kernel in selected.items()}
+    logger.info(f"Similarity kernels: {names}")
+    return names
+
+def similarity_stats():
+    with _lock:
+        stats = dict(_status)
+        stats['selected'] = {dtype: kernel.name for dtype, kernel in _selected.items()}
+    if stats.get('benchmark'):
+        stats['fastest'] = max(stats['benchmark'], key=lambda name: stats['benchmark'][name]['rows_per_sec'])
+    return stats
+
+def start_calibration(app):
+    """
+    Applies SIMILARITY_BACKEND. A forced library is selected right away;
+    'auto' benchmarks on a daemon thread, and numpy serves until it finishes.
+    """
+    metrics.register_provider('similarity', similarity_stats)
+    backend = app.config.get('SIMILARITY_BACKEND', 'auto')
+    if backend != 'auto':
+        calibrate(backend)
+        return None
+
+    def run():
+        try:
+            calibrate('auto', rows=app.config.get('SIMILARITY_BENCH_ROWS', 20000),
+                      max_error=app.config.get('SIMILARITY_MAX_ERROR', 0.02))
+        except Exception as e:
+            logger.error(f"Similarity kernel calibration failed: {e}")
+
+    thread = threading.Thread(target=run, name='pikieye-similarity', daemon=True)
+    thread.start()
+    return thread
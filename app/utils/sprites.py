@@ -0,0 +1,217 @@
+# app/utils/sprites.py
+
+import hashlib
+import hmac
+import logging
+import math
+import time
+import cv2
+import numpy as np
+from bson import ObjectId
+from flask import current_app
+
+from app.models.face import Face
+from app.models.project import Project
+from app.utils.cache import TTLCache
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Context kept around the detected box, as a fraction of its size
+CROP_MARGIN = 0.25
+
+_crops = None    # (face_id, gridfs_id, bbox, size) -> BGR crop
+_sheets = None   # (project_id, version) -> (atlas, [JPEG bytes per sheet])
+
+def _caches():
+    global _crops, _sheets
+    if _crops is None:
+        config = current_app.config
+        _crops = TTLCache(ttl=config.get('SPRITE_CACHE_TTL', 3600),
+                          max_entries=config.get('SPRITE_CROP_CACHE_SIZE', 2000))
+        _sheets = TTLCache(ttl=config.get('SPRITE_CACHE_TTL', 3600),
+                           max_entries=config.get('SPRITE_SHEET_CACHE_SIZE', 16))
+        metrics.register_provider('sprites', sprite_stats)
+    return _crops, _sheets
+
+def sprite_stats():
+    if _crops is None:
+        return {}
+    return {
+        'crops_cached': len(_crops.values()),
+        'crop_hits': _crops.hits,
+        'crop_misses': _crops.misses,
+        'sheets_cached': len(_sheets.values()),
+        'sheet_hits': _sheets.hits,
+        'sheet_misses': _sheets.misses
+    }
+
+def crop_face(img, bbox, size):
+    """
+    Cuts a square crop around a face box, padded by CROP_MARGIN, and scales it to size.
+
+    Faces stored without a box are represented by a centre crop of the image.
+    """
+    height, width = img.shape[:2]
+    if bbox:
+        x1, y1, x2, y2 = bbox
+        side = max(x2 - x1, y2 - y1) * (1 + 2 * CROP_MARGIN)
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    else:
+        side = min(height, width)
+        cx, cy = width / 2, height / 2
+    side = max(1, min(int(side), height, width))
+    left = int(min(max(cx - side / 2, 0), width - side))
+    top = int(min(max(cy - side / 2, 0), height - side))
+    return cv2.resize(img[top:top + side, left:left + side], (size, size), interpolation=cv2.INTER_AREA)
+
+def unique_face_representatives(project_id):
+    """
+    Returns the highest-quality face of every cluster, ordered by label.
+
+    Returns:
+        List[dict]: Raw face documents with 'cluster_label', 'gridfs_id' and 'bbox'.
+    """
+    representatives = {}
+    faces = (Face.objects(project=project_id, cluster_label__ne='-1')
+             .order_by('cluster_label', '-quality')
+             .only('id', 'cluster_label', 'gridfs_id', 'bbox').as_pymongo())
+    for face in faces:
+        representatives.setdefault(face['cluster_label'], face)
+    return list(representatives.values())
+
+def _load_crops(faces, size, grid_fs):
+    """
+    Returns a crop per face, decoding each source image at most once and
+    reusing crops cached from earlier versions of the sheets.
+    """
+    crop_cache, _ = _caches()
+    crops = {}
+    missing = {}
+    for face in faces:
+        key = (face['_id'], face['gridfs_id'], tuple(face.get('bbox') or ()), size)
+        crop = crop_cache.get(key)
+        if crop is None:
+            missing.setdefault(face['gridfs_id'], []).append((key, face))
+        else:
+            crops[face['_id']] = crop
+
+    for gridfs_id, entries in missing.items():
+        try:
+            data = np.frombuffer(grid_fs.get(ObjectId(gridfs_id)).read(), dtype=np.uint8)
+            img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        except Exception as e:
+            logger.error(f"Error loading image {gridfs_id} for sprites: {e}")
+            img = None
+        for key, face in entries:
+            crop = crop_face(img, face.get('bbox'), size) if img is not None else np.zeros((size, size, 3), np.uint8)
+            if img is not None:
+                crop_cache.set(key, crop)
+            crops[face['_id']] = crop
+    return crops
+
+def build_sprites(project_id, version, grid_fs=None):
+    """
+    Tiles every cluster representative's face crop into JPEG sprite sheets.
+
+    Args:
+        project_id (str): ID of the project.
+        version (int): Project version the sheets are built for.
+        grid_fs (gridfs.GridFS, optional): GridFS instance. Defaults to the app's.
+
+    Returns:
+        tuple: (atlas, sheets) where atlas maps each face to its sheet and
+        offsets, and sheets holds the JPEG bytes of each sheet.
+    """
+    config = current_app.config
+    grid_fs = grid_fs or current_app.extensions['grid_fs']
+    size = config.get('SPRITE_CROP_SIZE', 96)
+    columns = config.get('SPRITE_COLUMNS', 20)
+    per_sheet = columns * config.get('SPRITE_ROWS', 20)
+    quality = config.get('SPRITE_JPEG_QUALITY', 85)
+
+    faces = unique_face_representatives(project_id)
+    crops = _load_crops(faces, size, grid_fs)
+
+    entries = []
+    sheets = []
+    for start in range(0, len(faces), per_sheet):
+        batch = faces[start:start + per_sheet]
+        rows = -(-len(batch) // columns)
+        canvas = np.zeros((rows * size, min(len(batch), columns) * size, 3), dtype=np.uint8)
+        for i, face in enumerate(batch):
+            x, y = (i % columns) * size, (i // columns) * size
+            canvas[y:y + size, x:x + size] = crops[face['_id']]
+            entries.append({
+                'cluster_label': face['cluster_label'],
+                'face_id': str(face['_id']),
+                'gridfs_id': face['gridfs_id'],
+                'sheet': len(sheets),
+                'x': x,
+                'y': y
+            })
+        ok, encoded = cv2.imencode('.jpg', canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError(f"Could not encode sprite sheet {len(sheets)} of project {project_id}.")
+        sheets.append(encoded.tobytes())
+
+    atlas = {
+        'version': version,
+        'size': size,
+        'sheets': [{'index': i, 'bytes': len(sheet)} for i, sheet in enumerate(sheets)],
+        'faces': entries
+    }
+    logger.info(f"Built {len(sheets)} sprite sheets with {len(entries)} faces for project {project_id}.")
+    return atlas, sheets
+
+def get_project_sprites(project_id):
+    """
+    Returns the project's sprite atlas and sheets, rebuilding them when the project version changed.
+
+    Raises:
+        ValueError: If the project is not found.
+    """
+    project = Project.objects(id=project_id).only('version').as_pymongo().first()
+    if not project:
+        raise ValueError(f"Project with ID {project_id} not found.")
+    version = project.get('version', 0)
+
+    _, sheet_cache = _caches()
+    key = (str(project_id), version)
+    cached = sheet_cache.get(key)
+    if cached is None:
+        cached = build_sprites(project_id, version)
+        sheet_cache.invalidate(lambda other: other[0] == key[0] and other[1] != version)
+        sheet_cache.set(key, cached)
+    return cached
+
+def _sheet_signature(project_id, sheet, version, expires):
+    message = f"sprite:{project_id}:{sheet}:{version}:{expires}".encode()
+    return hmac.new(current_app.config['SECRET_KEY'].encode(), message, hashlib.sha256).hexdigest()
+
+def sign_sheet_url(project_id, sheet, version):
+    """
+    Returns the query parameters of a short-lived URL for one sprite sheet.
+
+    The expiry is rounded up to a multiple of SPRITE_URL_TTL, so the URL, and
+    with it the browser's cached copy, stays the same within a window.
+
+    Returns:
+        dict: 'v', 'exp' and 'sig' parameters.
+    """
+    ttl = current_app.config.get('SPRITE_URL_TTL', 3600)
+    expires = math.ceil((time.time() + ttl) / ttl) * ttl
+    return {'v': version, 'exp': expires, 'sig': _sheet_signature(project_id, sheet, version, expires)}
+
+def valid_sheet_signature(project_id, sheet, args):
+    """
+    Checks the 'v', 'exp' and 'sig' query parameters of a signed sprite sheet URL.
+    """
+    try:
+        expires = int(args.get('exp', ''))
+    except ValueError:
+        return False
+    if expires < time.time():
+        return False
+    expected = _sheet_signature(project_id, sheet, args.get('v', ''), expires)
+    return hmac.compare_digest(expected, args.get('sig', ''))
@@ -0,0 +1,263 @@
+# app/utils/storage_gc.py
+
+from datetime import datetime, timedelta, timezone
+import threading
+import logging
+import time
+from bson import ObjectId
+
+from app.models.face import Face
+from app.models.project import Project
+from app.models.project_change import ProjectChange
+from app.utils.blob_store import release_blobs, shared_gridfs_ids, forget_blobs
+from app.utils.resumable_upload import expire_sessions
+from app.utils.jobs import create_job, active_job_exists, JobConflict
+
+logger = logging.getLogger(__name__)
+
+def _to_object_ids(gridfs_ids):
+    object_ids = []
+    for gridfs_id in gridfs_ids:
+        try:
+            object_ids.append(ObjectId(gridfs_id))
+        except Exception:
+            logger.warning(f"Skipping malformed GridFS ID {gridfs_id}.")
+    return object_ids
+
+def delete_blobs(mongo_db, gridfs_ids):
+    """
+    Deletes GridFS files and their chunks with two bulk deletes, and forgets
+    any blob documents pointing at them.
+
+    Args:
+        mongo_db (pymongo.database.Database): Database holding the 'fs' bucket.
+        gridfs_ids (List[str]): GridFS IDs to delete.
+
+    Returns:
+        int: Number of files deleted.
+    """
+    object_ids = _to_object_ids(gridfs_ids)
+    if not object_ids:
+        return 0
+    # Files first, so a half-finished delete never leaves a file without chunks
+    deleted = mongo_db.fs.files.delete_many({'_id': {'$in': object_ids}}).deleted_count
+    mongo_db.fs.chunks.delete_many({'files_id': {'$in': object_ids}})
+    forget_blobs(gridfs_ids)
+    return deleted
+
+def unreferenced_blobs(gridfs_ids, exclude_face_ids=None):
+    """
+    Returns the GridFS IDs that no Face document points at.
+
+    Args:
+        gridfs_ids (List[str]): Candidate GridFS IDs.
+        exclude_face_ids (List[ObjectId], optional): Faces to ignore (e.g. about to be deleted).
+
+    Returns:
+        List[str]: The unreferenced IDs.
+    """
+    query = Face.objects(gridfs_id__in=list(gridfs_ids))
+    if exclude_face_ids:
+        query = query.filter(id__nin=list(exclude_face_ids))
+    referenced = set(query.distinct('gridfs_id'))
+    return [gridfs_id for gridfs_id in gridfs_ids if gridfs_id not in referenced]
+
+def release_images(mongo_db, images):
+    """
+    Releases the blobs of project images whose Face documents are gone and
+    deletes the files no project uses any more.
+
+    Files stored before content addressing carry no reference count and are
+    deleted only when no Face document points at them.
+
+    Args:
+        mongo_db (pymongo.database.Database): Database holding the 'fs' bucket.
+        images (List[tuple]): (image_hash, gridfs_id) of each released project image.
+
+    Returns:
+        int: Number of files deleted.
+    """
+    freed, uncounted = release_blobs(images)
+    if uncounted:
+        freed += unreferenced_blobs(uncounted)
+    return delete_blobs(mongo_db, freed)
+
+def delete_project_cascade(job, project_id, mongo_db, batch_size=500, pause_seconds=0.0):
+    """
+    Deletes a project's faces and the GridFS blobs only they referenced, in batches.
+
+    Intended to run as the body of an exclusive 'project_delete' job after the
+    project document itself has been removed. Each batch is claimed with the
+    run's ID before it is deleted, and only images whose faces this run
+    removed are released, so a blob shared with another project never loses
+    more than the deleted project's reference.
+
+    Returns:
+        dict: Number of faces and blobs deleted.
+    """
+    project_id = ObjectId(str(project_id))
+    run_id = str(job.id) if job is not None else str(ObjectId())
+    collection = Face._get_collection()
+    faces_deleted = 0
+    blobs_deleted = 0
+
+    # The job lock makes this the only live run; adopt claims left by runs that died
+    collection.update_many({'project': project_id, 'delete_claim': {'$exists': True}},
+                           {'$set': {'delete_claim': run_id}})
+
+    while True:
+        batch = list(collection.find({'project': project_id, 'delete_claim': {'$in': [None, run_id]}},
+                                     {'_id': 1}).limit(batch_size))
+        if not batch:
+            break
+
+        collection.update_many({'_id': {'$in': [doc['_id'] for doc in batch]},
+                                'delete_claim': {'$in': [None, run_id]}},
+                               {'$set': {'delete_claim': run_id}})
+        claimed = list(collection.find({'project': project_id, 'delete_claim': run_id},
+                                       {'_id': 1, 'gridfs_id': 1, 'hash': 1}))
+        face_ids = [doc['_id'] for doc in claimed]
+        deleted = collection.delete_many({'_id': {'$in': face_ids}, 'delete_claim': run_id}).deleted_count
+        faces_deleted += deleted
+
+        if deleted != len(claimed):
+            # Another run took some of the claimed faces; leaking their blobs is safer than
+            # releasing a reference twice and deleting a file another project still uses
+            logger.warning(f"Cascade delete of project {project_id} lost {len(claimed) - deleted} claimed "
+                           f"faces to another run; their images are not released.")
+        elif claimed:
+            images = {(doc.get('hash'), doc['gridfs_id']) for doc in claimed if doc.get('gridfs_id')}
+            # An image whose other faces fall in a later batch is released with them
+            remaining = set(collection.distinct('gridfs_id', {
+                'project': project_id, 'gridfs_id': {'$in': [gridfs_id for _, gridfs_id in images]}}))
+            blobs_deleted += release_images(mongo_db, [image for image in images if image[1] not in remaining])
+
+        if job is not None:
+            job.update(faces_deleted=faces_deleted, blobs_deleted=blobs_deleted)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    ProjectChange.objects(project=project_id).delete()
+    logger.info(f"Cascade delete of project {project_id} removed {faces_deleted} faces and "
+                f"{blobs_deleted} GridFS files.")
+    return {'faces_deleted': faces_deleted, 'blobs_deleted': blobs_deleted}
+
+def collect_garbage(job=None, mongo_db=None, dry_run=True, batch_size=500, pause_seconds=0.1,
+                    grace_period=timedelta(hours=1)):
+    """
+    Mark-and-sweep collection of storage no longer reachable from any project.
+
+    Expired resumable upload sessions and their chunks are removed and faces
+    whose project no longer exists are deleted first. GridFS files are then
+    scanned in batches and those with no referencing Face are removed with
+    rate-limited bulk deletes. Files younger than grace_period are skipped so
+    in-flight uploads are never collected, as are files of blobs that still
+    hold references, which only release_images frees.
+
+    Args:
+        job (Job, optional): Job used for progress reporting.
+        mongo_db (pymongo.database.Database): Database holding the 'fs' bucket.
+        dry_run (bool, optional): Only report what would be reclaimed. Defaults to True.
+        batch_size (int, optional): GridFS files examined per batch.
+        pause_seconds (float, optional): Sleep between delete batches.
+        grace_period (timedelta, optional): Minimum age of a collectable file.
+
+    Returns:
+        dict: Counts and bytes found (and deleted, unless dry_run).
+    """
+    summary = {
+        'dry_run': dry_run,
+        'orphaned_faces': 0,
+        'orphaned_files': 0,
+        'reclaimable_bytes': 0,
+        'deleted_files': 0
+    }
+    summary.update(expire_sessions(mongo_db, dry_run=dry_run))
+
+    # Faces left behind by projects that no longer exist
+    live_projects = set(Project.objects.distinct('id'))
+    face_projects = set(Face._get_collection().distinct('project'))
+    for project_id in face_projects - live_projects:
+        # A project being deleted right now is left to its own job
+        if active_job_exists('project_delete', project_id):
+            continue
+        orphaned = Face.objects(project=project_id).count()
+        summary['orphaned_faces'] += orphaned
+        if not dry_run:
+            _cascade_orphaned_project(project_id, mongo_db, batch_size, pause_seconds)
+
+    cutoff = datetime.now(timezone.utc) - grace_period
+    cursor = (mongo_db.fs.files.find({'uploadDate': {'$lt': cutoff}}, {'_id': 1, 'length': 1})
+              .sort('_id', 1).batch_size(batch_size))
+
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _sweep_batch(batch, mongo_db, dry_run, summary, job)
+            batch = []
+            if pause_seconds and not dry_run:
+                time.sleep(pause_seconds)
+    if batch:
+        _sweep_batch(batch, mongo_db, dry_run, summary, job)
+
+    logger.info(f"Storage GC ({'dry run' if dry_run else 'sweep'}): {summary['orphaned_files']} orphaned "
+                f"files, {summary['reclaimable_bytes']} bytes, {summary['orphaned_faces']} orphaned faces.")
+    return summary
+
+def _cascade_orphaned_project(project_id, mongo_db, batch_size, pause_seconds):
+    # Runs under the same exclusive job lock as the project's own delete job
+    try:
+        cascade = create_job('project_delete', project_id=project_id, exclusive=True)
+    except JobConflict:
+        return
+    cascade.set_status('running')
+    try:
+        result = delete_project_cascade(cascade, project_id, mongo_db, batch_size=batch_size,
+                                        pause_seconds=pause_seconds)
+        cascade.set_status('completed', result=result)
+    except Exception as e:
+        cascade.set_status('failed', error=e)
+        raise
+
+def _sweep_batch(batch, mongo_db, dry_run, summary, job):
+    sizes = {str(doc['_id']): doc.get('length', 0) for doc in batch}
+    shared = shared_gridfs_ids(list(sizes))
+    orphaned = [gridfs_id for gridfs_id in unreferenced_blobs(list(sizes)) if gridfs_id not in shared]
+
+    summary['orphaned_files'] += len(orphaned)
+    summary['reclaimable_bytes'] += sum(sizes[gridfs_id] for gridfs_id in orphaned)
+    if not dry_run and orphaned:
+        summary['deleted_files'] += delete_blobs(mongo_db, orphaned)
+
+    if job is not None:
+        job.update(**{key: value for key, value in summary.items() if key != 'dry_run'})
+
+def start_periodic_gc(app):
+    """
+    Runs collect_garbage on a daemon thread every GC_INTERVAL_SECONDS.
+
+    Does nothing when the interval is not set.
+    """
+    interval = app.config.get('GC_INTERVAL_SECONDS')
+    if not interval:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    collect_garbage(
+                        mongo_db=app.extensions['mongo_db'],
+                        dry_run=app.config.get('GC_DRY_RUN', False),
+                        batch_size=app.config.get('GC_BATCH_SIZE', 500),
+                        pause_seconds=app.config.get('GC_PAUSE_SECONDS', 0.1)
+                    )
+                except Exception as e:
+                    logger.error(f"Periodic storage GC failed: {e}")
+
+    thread = threading.Thread(target=loop, name='pikieye-gc', daemon=True)
+    thread.start()
+    app.logger.info(f"Periodic storage GC scheduled every {interval} seconds.")
+    return thread
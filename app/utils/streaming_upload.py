@@ -0,0 +1,146 @@
+# app/utils/streaming_upload.py
+
+import io
+import hashlib
+import logging
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+
+from app.utils.image_processing import allowed_file, is_image_file
+
+logger = logging.getLogger(__name__)
+
+# Number of leading bytes needed to sniff the image type
+HEADER_SIZE = 512
+
+def iter_multipart_images(stream, boundary, grid_fs, field_name='images',
+                          chunk_size=255 * 1024, max_part_size=None):
+    """
+    Parses a multipart/form-data body incrementally and writes each image part
+    straight into GridFS, hashing it chunk by chunk as it arrives.
+
+    Only one chunk of the body is held in memory at a time, so memory use does
+    not depend on the size of the upload.
+
+    Args:
+        stream (io.RawIOBase): Request body stream.
+        boundary (str): Multipart boundary from the Content-Type header.
+        grid_fs (gridfs.GridFS): GridFS instance to write parts into.
+        field_name (str, optional): Form field holding the images. Defaults to 'images'.
+        chunk_size (int, optional): Bytes read from the stream per iteration.
+        max_part_size (int, optional): Maximum size of a single image part.
+
+    Yields:
+        dict: For every stored part, 'gridfs_id', 'original_filename', 'hash' and
+        'size'. For every rejected part, 'original_filename' and 'error'.
+    """
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    part = None
+
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, File):
+                    part = _start_part(event, grid_fs, field_name)
+                elif isinstance(event, Field):
+                    part = None  # Plain form fields are not used by this endpoint
+                elif isinstance(event, Data) and part is not None:
+                    result = _write_part(part, event.data, max_part_size)
+                    if result is None and not event.more_data:
+                        result = _finish_part(part)
+                    if result is not None:
+                        part = None
+                        yield result
+                event = decoder.next_event()
+
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    finally:
+        # Discard a half-written part if the client went away mid-upload
+        if part is not None and part.get('grid_in') is not None:
+            _abort_part(part)
+
+def _start_part(event, grid_fs, field_name):
+    """
+    Opens a GridFS file for a new multipart file part.
+
+    Returns:
+        dict: Part state, or a rejected part when the field or extension is not accepted.
+    """
+    if event.name != field_name:
+        return None
+
+    original_filename = secure_filename(event.filename or '')
+    if not event.filename or not allowed_file(event.filename):
+        return {'original_filename': event.filename, 'grid_in': None,
+                'error': f'File type not allowed for file {event.filename}.'}
+
+    return {
+        'original_filename': original_filename,
+        'grid_in': grid_fs.new_file(filename=original_filename),
+        'sha256': hashlib.sha256(),
+        'header': b'',
+        'size': 0,
+        'error': None,
+    }
+
+def _write_part(part, data, max_part_size):
+    """
+    Appends a slice of part data to GridFS and to the running hash.
+
+    Returns:
+        dict or None: A rejection result once the part has failed, otherwise None.
+    """
+    if part['grid_in'] is None:
+        return {'original_filename': part['original_filename'], 'error': part['error']}
+    if not data:
+        return None
+
+    part['size'] += len(data)
+    if max_part_size is not None and part['size'] > max_part_size:
+        _abort_part(part)
+        return {'original_filename': part['original_filename'],
+                'error': f"File {part['original_filename']} exceeds the maximum allowed size."}
+
+    if len(part['header']) < HEADER_SIZE:
+        part['header'] += data[:HEADER_SIZE - len(part['header'])]
+    part['sha256'].update(data)
+    part['grid_in'].write(data)
+    return None
+
+def _finish_part(part):
+    """
+    Validates a completely received part and closes its GridFS file.
+
+    Returns:
+        dict: The stored image data, or a rejection result.
+    """
+    if not is_image_file(io.BytesIO(part['header'])):
+        _abort_part(part)
+        return {'original_filename': part['original_filename'],
+                'error': f"Uploaded file {part['original_filename']} is not a valid image."}
+
+    grid_in = part['grid_in']
+    grid_in.close()
+    part['grid_in'] = None
+    logger.info("Streamed image %s into GridFS with ID %s.", part['original_filename'], grid_in._id)
+    return {
+        'gridfs_id': str(grid_in._id),
+        'original_filename': part['original_filename'],
+        'hash': part['sha256'].hexdigest(),
+        'size': part['size'],
+    }
+
+def _abort_part(part):
+    """
+    Removes any chunks already written for a part.
+    """
+    try:
+        part['grid_in'].abort()
+    except Exception as e:
+        logger.error(f"Error discarding partial upload {part['original_filename']}: {e}")
+    part['grid_in'] = None
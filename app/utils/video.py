@@ -0,0 +1,211 @@
+# app/utils/video.py
+
+import hashlib
+import logging
+import os
+import cv2
+import numpy as np
+from bson import ObjectId
+
+from app.models.face import Face
+from app.models.project import Project
+from app.utils.admission import model_slot
+from app.utils.blob_store import acquire_blob
+from app.utils.ml_model import detect_face_boxes, embed_faces, face_record, cluster_and_store_faces, quality_gate
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm', 'm4v'}
+
+# Side of the grayscale thumbnail compared between frames
+THUMBNAIL_SIZE = (64, 36)
+
+def allowed_video_file(filename):
+    """
+    Checks if the file has an allowed video extension.
+
+    Args:
+        filename (str): Name of the file.
+
+    Returns:
+        bool: True if allowed, False otherwise.
+    """
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_VIDEO_EXTENSIONS
+
+def _thumbnail(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def iter_keyframes(path, probe_interval=0.2, min_interval=0.5, max_interval=5.0, diff_threshold=10.0):
+    """
+    Samples frames from a video adaptively, keeping one per scene change.
+
+    Frames are probed every probe_interval seconds; only probed frames are
+    decoded. A probed frame becomes a keyframe when its mean absolute
+    difference from the previous keyframe (on a small grayscale thumbnail)
+    exceeds diff_threshold, or when max_interval seconds have passed.
+
+    Args:
+        path (str): Path to the video file.
+        probe_interval (float, optional): Seconds between probed frames.
+        min_interval (float, optional): Minimum seconds between keyframes.
+        max_interval (float, optional): Maximum seconds between keyframes.
+        diff_threshold (float, optional): Mean pixel difference (0-255) that counts as a change.
+
+    Yields:
+        tuple: (timestamp in seconds, BGR frame).
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Unable to open video.")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(fps * probe_interval)))
+        index = 0
+        last_thumbnail = None
+        last_timestamp = None
+
+        while True:
+            # grab() skips frames without converting them; retrieve() only for probes
+            if not capture.grab():
+                break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                timestamp = index / fps
+                thumbnail = _thumbnail(frame)
+
+                if last_thumbnail is None:
+                    changed = True
+                else:
+                    elapsed = timestamp - last_timestamp
+                    difference = float(np.mean(np.abs(thumbnail - last_thumbnail)))
+                    changed = elapsed >= max_interval or \
+                              (elapsed >= min_interval and difference > diff_threshold)
+
+                if changed:
+                    last_thumbnail = thumbnail
+                    last_timestamp = timestamp
+                    yield timestamp, frame
+            index += 1
+    finally:
+        capture.release()
+
+def _iou(box, boxes):
+    """
+    Intersection over union of one [x1, y1, x2, y2] box against an (n, 4) array.
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-6)
+
+def iter_distinct_faces(path, iou_threshold=0.4, **sampling):
+    """
+    Runs detection on sampled keyframes and embeds only faces that are new.
+
+    A face whose box overlaps a face from the previous keyframe by at least
+    iou_threshold is treated as the same tracked face and is not embedded
+    again. Keyframes where every face is tracked, or every new face fails the
+    quality gate, are skipped entirely.
+
+    Args:
+        path (str): Path to the video file.
+        iou_threshold (float, optional): Box overlap that continues a track.
+        **sampling: Passed to iter_keyframes.
+
+    Yields:
+        tuple: (timestamp, JPEG-encoded frame bytes, face records for the new faces).
+    """
+    previous_boxes = np.zeros((0, 4), dtype=np.float32)
+    gate = quality_gate()
+
+    for timestamp, frame in iter_keyframes(path, **sampling):
+        with model_slot():
+            faces = detect_face_boxes(frame)
+        boxes = np.array([face.bbox for face in faces], dtype=np.float32).reshape(-1, 4)
+
+        new_faces = [face for face in faces
+                     if not len(previous_boxes) or _iou(face.bbox, previous_boxes).max() < iou_threshold]
+        previous_boxes = boxes
+        if gate is not None:
+            new_faces = gate.apply(frame, new_faces)
+        if not new_faces:
+            continue
+
+        with model_slot():
+            embed_faces(frame, new_faces)
+        records = [face_record(face) for face in new_faces if getattr(face, 'embedding', None) is not None]
+        if not records:
+            continue
+
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ok:
+            logger.error(f"Failed to encode video frame at {timestamp:.2f}s.")
+            continue
+        yield timestamp, encoded.tobytes(), records
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """
+    Computes the SHA-256 of a file without reading it into memory at once.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def ingest_video(job, path, project_id, original_filename, grid_fs, video_hash=None, **sampling):
+    """
+    Stores the distinct faces of a video and clusters them with the project.
+
+    Every keyframe that contributes new faces is stored in GridFS as a JPEG
+    with a placeholder Face document, like an uploaded image; the face records
+    carry the frame timestamp and the video's hash. The temporary video file
+    is removed when done.
+
+    Intended to run as the body of a background job.
+
+    Returns:
+        dict: Summary of the ingest.
+    """
+    try:
+        video_hash = video_hash or hash_file(path)
+        records = []
+        frames_stored = 0
+        base_name = os.path.splitext(original_filename)[0]
+
+        for timestamp, jpeg_bytes, frame_records in iter_distinct_faces(path, **sampling):
+            frame_hash = hashlib.sha256(jpeg_bytes).hexdigest()
+            if Face.objects(project=project_id, hash=frame_hash).only('id').first():
+                continue  # Identical frame already stored; each image is referenced once per project
+            frame_name = f"{base_name}_{timestamp:09.3f}.jpg"
+            gridfs_id, _ = acquire_blob(frame_hash, grid_fs, data=jpeg_bytes, filename=frame_name,
+                                        content_type='image/jpeg')
+
+            face = Face(gridfs_id=str(gridfs_id), project=ObjectId(project_id), hash=frame_hash,
+                        source_hash=video_hash, frame_ts=timestamp)
+            face.save()
+            Project.bump_version(project_id, 'faces_added', [face.id], push__faces=face.id)
+
+            for record in frame_records:
+                record.update(gridfs_id=str(gridfs_id), frame_ts=timestamp, source_hash=video_hash)
+            records.extend(frame_records)
+            frames_stored += 1
+            job.update(frames_stored=frames_stored, faces_detected=len(records), position=timestamp)
+
+        cluster_and_store_faces(records, project_id)
+        logger.info(f"Ingested video {original_filename}: {frames_stored} frames, {len(records)} faces.")
+        return {'frames_stored': frames_stored, 'faces_detected': len(records)}
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Error removing temporary video file {path}: {e}")
@@ -0,0 +1,91 @@
+# app/utils/warmup.py
+
+import logging
+import threading
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.models.project import Project
+from app.utils import metrics, background
+from app.utils.embedding_index import (recently_active_projects, snapshot_version, remove_snapshot,
+                                       build_and_cache_index)
+
+logger = logging.getLogger(__name__)
+
+_status = {'state': 'pending'}
+
+def warmup_stats():
+    return dict(_status)
+
+def preload_projects(limit):
+    """
+    Loads the indexes of the most recently searched projects into the cache.
+
+    Projects whose snapshot matches their current version are loaded from the
+    snapshot right away; stale snapshots are rebuilt from MongoDB on the
+    'snapshots' pool; snapshots of deleted projects are removed.
+
+    Args:
+        limit (int): Number of projects to preload.
+
+    Returns:
+        dict: Counts of 'loaded', 'stale' and 'removed' projects.
+    """
+    project_ids = []
+    for project_id in recently_active_projects(limit):
+        try:
+            project_ids.append(ObjectId(project_id))
+        except InvalidId:
+            remove_snapshot(project_id)
+
+    versions = {doc['_id']: doc.get('version', 0)
+                for doc in Project.objects(id__in=project_ids).only('version').as_pymongo()}
+
+    summary = {'loaded': 0, 'stale': 0, 'removed': 0}
+    for project_id in project_ids:
+        version = versions.get(project_id)
+        if version is None:
+            remove_snapshot(str(project_id))
+            summary['removed'] += 1
+        elif snapshot_version(str(project_id)) == version:
+            build_and_cache_index(str(project_id), version)
+            summary['loaded'] += 1
+        else:
+            background.submit('snapshots', build_and_cache_index, str(project_id), version)
+            summary['stale'] += 1
+    return summary
+
+def start_warmup(app):
+    """
+    Warms the model and the index cache on a daemon thread when WARMUP_ENABLED is set.
+
+    When workers are forked from a preloaded app (gunicorn --preload), call
+    this from the post_fork hook instead, since threads do not survive fork.
+    """
+    if not app.config.get('WARMUP_ENABLED'):
+        return None
+    metrics.register_provider('warmup', warmup_stats)
+
+    def run():
+        from app.utils.ml_model import warm_up_model
+
+        with app.app_context():
+            _status['state'] = 'running'
+            try:
+                started = time.monotonic()
+                warm_up_model()
+                _status['model_seconds'] = round(time.monotonic() - started, 3)
+
+                started = time.monotonic()
+                _status.update(preload_projects(app.config.get('WARMUP_PROJECTS', 10)))
+                _status['preload_seconds'] = round(time.monotonic() - started, 3)
+                _status['state'] = 'done'
+                logger.info(f"Warm-up finished: {_status}")
+            except Exception as e:
+                _status['state'] = 'failed'
+                logger.error(f"Warm-up failed: {e}")
+
+    thread = threading.Thread(target=run, name='pikieye-warmup', daemon=True)
+    thread.start()
+    return thread
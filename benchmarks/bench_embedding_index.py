@@ -0,0 +1,70 @@
+# benchmarks/bench_embedding_index.py
+"""
+Synthetic benchmark of the compressed embedding index modes.
+
+For each mode, reports the in-memory footprint of the index, mean latency of
+a top-k query (coarse scoring plus exact rerank) and recall@k against exact
+float32 search. Full-precision vectors for the rerank come from memory here;
+in the app they are loaded from MongoDB, which adds a round trip per query.
+
+Usage:
+    python -m benchmarks.bench_embedding_index [--faces 100000] [--k 10]
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from app.utils.embedding_index import EmbeddingIndex, INDEX_MODES
+
+DIMS = 512
+
+def synthetic_embeddings(rng, faces, identities):
+    centers = rng.normal(size=(identities, DIMS)).astype(np.float32)
+    owners = rng.integers(identities, size=faces)
+    vectors = centers[owners] + rng.normal(scale=0.6, size=(faces, DIMS)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = centers[rng.integers(identities, size=100)] + rng.normal(scale=0.6, size=(100, DIMS)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+def run(faces, identities, k, candidates, seed):
+    rng = np.random.default_rng(seed)
+    vectors, queries = synthetic_embeddings(rng, faces, identities)
+    face_ids = np.arange(faces)
+    exact = [set(np.argsort(-(vectors @ query))[:k]) for query in queries]
+
+    report = {}
+    for mode in INDEX_MODES:
+        started = time.perf_counter()
+        index = EmbeddingIndex(face_ids, face_ids, vectors, mode=mode, loader=lambda ids: vectors[ids])
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = [index.top_k(query, k=k, candidates=candidates) for query in queries]
+        latency = (time.perf_counter() - started) / len(queries)
+
+        recall = np.mean([len(expected & set(result)) / k for expected, result in zip(exact, results)])
+        report[mode] = {
+            'index_bytes': index.nbytes,
+            'bytes_per_face': round(index.nbytes / faces, 2),
+            'build_seconds': round(build_seconds, 3),
+            'query_ms': round(latency * 1000, 3),
+            f'recall@{k}': round(float(recall), 4)
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--faces', type=int, default=100000)
+    parser.add_argument('--identities', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--candidates', type=int, default=200, help='Coarse hits reranked exactly.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.faces, args.identities, args.k, args.candidates, args.seed), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_logging.py
+"""
+Measures the cost of logging on the calling thread.
+
+Compares disabled debug calls with eager f-strings and lazy %-arguments,
+synchronous rotating file handlers with the old 10 KB and the new 10 MB
+limits, and the queued pipeline with and without sampling. Times are per
+call as seen by the caller; for the queued cases, the time to drain the
+queue is reported separately.
+
+Usage:
+    python -m benchmarks.bench_logging [--calls 200000]
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+from app.utils.logging_config import DroppingQueueHandler, SamplingFilter, TEXT_FORMAT
+
+class _Payload:
+    """
+    Stands in for an object whose str() is not free, like a numpy array or document.
+    """
+    def __init__(self, i):
+        self.i = i
+
+    def __str__(self):
+        return f"Face(id={self.i:024x}, label={self.i % 97})"
+
+def _timed_calls(logger, calls, lazy):
+    started = time.perf_counter()
+    for i in range(calls):
+        payload = _Payload(i)
+        if lazy:
+            logger.debug("Updated %s with cluster_label=%d.", payload, i % 97)
+        else:
+            logger.debug(f"Updated {payload} with cluster_label={i % 97}.")
+    return time.perf_counter() - started
+
+def _logger(name, handler=None, level=logging.DEBUG):
+    logger = logging.getLogger(f'bench.{name}')
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(level)
+    if handler is not None:
+        logger.addHandler(handler)
+    return logger
+
+def _file_handler(directory, name, max_bytes):
+    handler = RotatingFileHandler(os.path.join(directory, f'{name}.log'), maxBytes=max_bytes, backupCount=3)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+def run(calls):
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, lazy in (('disabled_fstring', False), ('disabled_lazy', True)):
+            logger = _logger(name, level=logging.INFO)
+            report[name] = {'us_per_call': _timed_calls(logger, calls, lazy) / calls * 1e6}
+
+        for name, max_bytes in (('sync_rotating_10kb', 10 * 1024), ('sync_rotating_10mb', 10 * 1024 * 1024)):
+            handler = _file_handler(directory, name, max_bytes)
+            report[name] = {'us_per_call': _timed_calls(_logger(name, handler), calls, True) / calls * 1e6}
+            handler.close()
+
+        for name, rates in (('queued', None), ('queued_sampled_1_in_100', {'bench': 100})):
+            target = _file_handler(directory, name, 10 * 1024 * 1024)
+            queue_handler = DroppingQueueHandler(queue.Queue(calls + 1))
+            queue_handler.addFilter(SamplingFilter(rates))
+            listener = QueueListener(queue_handler.queue, target)
+            listener.start()
+            elapsed = _timed_calls(_logger(name, queue_handler), calls, True)
+            started = time.perf_counter()
+            listener.stop()  # Drains the queue
+            report[name] = {
+                'us_per_call': elapsed / calls * 1e6,
+                'drain_seconds': round(time.perf_counter() - started, 3),
+                'dropped': queue_handler.dropped
+            }
+            target.close()
+
+    for entry in report.values():
+        entry['us_per_call'] = round(entry['us_per_call'], 3)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.calls), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_quality_gating.py
+"""
+Synthetic benchmark of the ingest quality gate.
+
+Builds a project of well-captured identity faces plus a crowd of small,
+blurry or turned background faces, then reports index size and brute-force
+search latency (as in find_matching_faces) with and without gating, along
+with how many true matches survive the gate.
+
+Usage:
+    python -m benchmarks.bench_quality_gating [--identities 200] [--background 5000]
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from app.utils.face_quality import QualityGate
+
+DIMS = 512
+
+def synthetic_faces(rng, identities, faces_per_identity, background):
+    """
+    Returns (embeddings, identity per face (-1 for background), quality measurements).
+    """
+    centers = rng.normal(size=(identities, DIMS)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+
+    owners = np.repeat(np.arange(identities), faces_per_identity)
+    embeddings = centers[owners] + rng.normal(scale=0.025, size=(len(owners), DIMS)).astype(np.float32)
+    measurements = [{
+        'det_score': float(rng.uniform(0.7, 0.99)),
+        'eye_distance': float(rng.uniform(25, 120)),
+        'sharpness': float(rng.uniform(60, 400)),
+        'yaw': float(abs(rng.normal(scale=15)))
+    } for _ in owners]
+
+    crowd = rng.normal(size=(background, DIMS)).astype(np.float32)
+    embeddings = np.vstack([embeddings, crowd])
+    owners = np.concatenate([owners, np.full(background, -1)])
+    measurements += [{
+        'det_score': float(rng.uniform(0.35, 0.8)),
+        'eye_distance': float(rng.uniform(3, 16)),
+        'sharpness': float(rng.uniform(5, 80)),
+        'yaw': float(abs(rng.normal(scale=40)))
+    } for _ in range(background)]
+
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings, owners, measurements, centers
+
+def search_latency(index, queries, tolerance, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            np.where(index @ query > tolerance)[0]
+    return (time.perf_counter() - started) / (repeat * len(queries))
+
+def run(identities, faces_per_identity, background, queries, tolerance, repeat, seed):
+    rng = np.random.default_rng(seed)
+    embeddings, owners, measurements, centers = synthetic_faces(rng, identities, faces_per_identity, background)
+    gate = QualityGate()
+    kept = np.array([gate.passes(m) for m in measurements])
+
+    query_ids = rng.choice(identities, size=queries)
+    query_vectors = centers[query_ids]
+
+    report = {}
+    for name, mask in (('ungated', np.ones(len(owners), dtype=bool)), ('gated', kept)):
+        index = np.ascontiguousarray(embeddings[mask])
+        index_owners = owners[mask]
+        found = expected = 0
+        for identity, query in zip(query_ids, query_vectors):
+            matches = np.where(index @ query > tolerance)[0]
+            found += int(np.sum(index_owners[matches] == identity))
+            expected += faces_per_identity
+        report[name] = {
+            'faces': int(mask.sum()),
+            'index_bytes': int(index.nbytes),
+            'search_ms': round(search_latency(index, query_vectors, tolerance, repeat) * 1000, 4),
+            'identity_recall': round(found / expected, 4)
+        }
+
+    report['dropped_fraction'] = round(1 - kept.mean(), 4)
+    report['speedup'] = round(report['ungated']['search_ms'] / max(report['gated']['search_ms'], 1e-9), 2)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--identities', type=int, default=200)
+    parser.add_argument('--faces-per-identity', type=int, default=10)
+    parser.add_argument('--background', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.identities, args.faces_per_identity, args.background, args.queries,
+                         args.tolerance, args.repeat, args.seed), indent=2))
+
+if __name__ == '__main__':
+    main()
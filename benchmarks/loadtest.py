@@ -0,0 +1,320 @@
+# benchmarks/loadtest.py
+"""
+End-to-end load test of the Flask app under concurrent mixed traffic.
+
+Boots create_app() in-process behind a threaded WSGI server, against an
+in-memory mongomock database (or a real server with --mongodb-uri) and the
+deterministic stub model from benchmarks/stub_model.py (or the real model
+with --model real). Seeds users, projects and images through the public
+routes, then replays a weighted mix of JWT-authenticated requests at a fixed
+arrival rate and reports per-route throughput, p50/p95/p99 latency and error
+rates as JSON.
+
+Latency is measured from each request's scheduled start, so client-side
+queueing under overload is included rather than hidden.
+
+Usage:
+    python -m benchmarks.loadtest --rate 20 --duration 30 --output run.json
+    python -m benchmarks.loadtest --rate 20 --duration 30 --compare run.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+DEFAULT_MIX = 'upload=1,search=2,unique=3,image=10,project=2,projects=1'
+
+ROUTES = {
+    'upload': 'POST /imagesupload/<project_id>',
+    'search': 'POST /find_faces/<project_id>',
+    'unique': 'GET /uniquefaces/<project_id>',
+    'image': 'GET /api/gridfs/<gridfs_id>',
+    'project': 'GET /project/<project_id>',
+    'projects': 'GET /project/user'
+}
+
+def _png(img):
+    import cv2
+    ok, encoded = cv2.imencode('.png', img)
+    return encoded.tobytes()
+
+class Tenant:
+    """
+    A seeded user with one project, its images and the identities in it.
+    """
+    def __init__(self, token, project_id, identities):
+        self.token = token
+        self.project_id = project_id
+        self.identities = identities
+        self.gridfs_ids = []
+        self.lock = threading.Lock()
+
+    @property
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+def _check(response, expected=(200, 201)):
+    if response.status_code not in expected:
+        raise RuntimeError(f"{response.request.method} {response.url} -> {response.status_code}: {response.text[:200]}")
+    return response
+
+def _upload(session, base_url, tenant, images):
+    files = [('images', (f'img_{i}.png', data, 'image/png')) for i, data in enumerate(images)]
+    response = session.post(f'{base_url}/imagesupload/{tenant.project_id}', files=files, headers=tenant.headers)
+    if response.status_code == 201:
+        with tenant.lock:
+            tenant.gridfs_ids.extend(face['gridfs_id'] for face in response.json().get('saved_faces', []))
+    return response
+
+def seed(session, base_url, users, images_per_project, rng):
+    """
+    Creates users, one project each and their initial images through the API.
+    """
+    from benchmarks.stub_model import synthetic_image
+
+    tenants = []
+    for u in range(users):
+        credentials = {'email': f'load{u}@example.com', 'password': 'load-test-password'}
+        session.post(f'{base_url}/auth/signup', json=credentials)
+        token = _check(session.post(f'{base_url}/auth/login', json=credentials)).json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        response = session.post(f'{base_url}/project/create', json={'p_name': f'load-{u}-{rng.random():.6f}'},
+                                headers=headers)
+        tenant = Tenant(token, _check(response).json()['project_id'], identities=rng.sample(range(1, 256), 8))
+
+        for start in range(0, images_per_project, 5):
+            batch = [_png(synthetic_image(rng.choice(tenant.identities), faces=rng.randint(1, 3), seed=seed_id))
+                     for seed_id in range(start, min(start + 5, images_per_project))]
+            _check(_upload(session, base_url, tenant, batch))
+        tenants.append(tenant)
+    return tenants
+
+def make_operations(base_url):
+    from benchmarks.stub_model import synthetic_image
+
+    def upload(session, tenant, rng):
+        image = synthetic_image(rng.choice(tenant.identities), faces=rng.randint(1, 3), seed=rng.getrandbits(32))
+        return _upload(session, base_url, tenant, [_png(image)])
+
+    def search(session, tenant, rng):
+        image = synthetic_image(rng.choice(tenant.identities), faces=1, seed=rng.getrandbits(32))
+        files = {'image': ('query.png', _png(image), 'image/png')}
+        return session.post(f'{base_url}/find_faces/{tenant.project_id}', files=files, headers=tenant.headers)
+
+    def unique(session, tenant, rng):
+        return session.get(f'{base_url}/uniquefaces/{tenant.project_id}', headers=tenant.headers)
+
+    def image(session, tenant, rng):
+        with tenant.lock:
+            gridfs_id = rng.choice(tenant.gridfs_ids)
+        return session.get(f'{base_url}/api/gridfs/{gridfs_id}', headers=tenant.headers)
+
+    def project(session, tenant, rng):
+        return session.get(f'{base_url}/project/{tenant.project_id}', headers=tenant.headers)
+
+    def projects(session, tenant, rng):
+        return session.get(f'{base_url}/project/user', headers=tenant.headers)
+
+    return {'upload': upload, 'search': search, 'unique': unique, 'image': image,
+            'project': project, 'projects': projects}
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ROUTES:
+            raise SystemExit(f"Unknown operation '{name}'; choose from {', '.join(ROUTES)}.")
+        mix[name] = float(weight or 1)
+    return mix
+
+def run_load(base_url, tenants, mix, rate, duration, concurrency, seed_value):
+    """
+    Issues requests at a fixed arrival rate and records each outcome.
+
+    Returns:
+        tuple: (samples, wall_seconds) where samples are (operation, status, latency, service_time).
+    """
+    import requests
+
+    operations = make_operations(base_url)
+    names, weights = zip(*mix.items())
+    schedule_rng = random.Random(seed_value)
+    local = threading.local()
+    samples = []
+    samples_lock = threading.Lock()
+
+    def execute(name, scheduled, op_seed):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        rng = random.Random(op_seed)
+        tenant = rng.choice(tenants)
+        started = time.perf_counter()
+        try:
+            status = operations[name](local.session, tenant, rng).status_code
+        except Exception:
+            status = 0  # Connection error
+        finished = time.perf_counter()
+        with samples_lock:
+            samples.append((name, status, finished - scheduled, finished - started))
+
+    total = int(rate * duration)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            name = schedule_rng.choices(names, weights)[0]
+            executor.submit(execute, name, scheduled, schedule_rng.getrandbits(32))
+    return samples, time.perf_counter() - start
+
+def summarize(samples, wall_seconds):
+    by_route = defaultdict(list)
+    for name, status, latency, service in samples:
+        by_route[ROUTES[name]].append((status, latency, service))
+
+    def stats(entries):
+        latencies = np.array([latency for _, latency, _ in entries]) * 1000
+        statuses = defaultdict(int)
+        for status, _, _ in entries:
+            statuses[str(status)] += 1
+        errors = sum(count for status, count in statuses.items() if not 200 <= int(status) < 400)
+        return {
+            'requests': len(entries),
+            'throughput_rps': round(len(entries) / wall_seconds, 3),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+            'max_ms': round(float(latencies.max()), 2),
+            'mean_service_ms': round(float(np.mean([service for _, _, service in entries])) * 1000, 2),
+            'error_rate': round(errors / len(entries), 4),
+            'rejected_503': statuses.get('503', 0),
+            'status_codes': dict(statuses)
+        }
+
+    return {
+        'routes': {route: stats(entries) for route, entries in sorted(by_route.items())},
+        'total': stats([(status, latency, service) for _, status, latency, service in samples]) if samples else {}
+    }
+
+def compare(report, baseline, max_regression):
+    """
+    Prints per-route changes against a baseline report.
+
+    Returns:
+        List[str]: Routes whose p95 latency grew by more than max_regression
+        percent or whose error rate grew by more than one point.
+    """
+    regressions = []
+    for route, current in report['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous:
+            continue
+        p95_change = (current['p95_ms'] - previous['p95_ms']) / max(previous['p95_ms'], 1e-9) * 100
+        error_change = current['error_rate'] - previous['error_rate']
+        print(f"{route:38s} p95 {previous['p95_ms']:9.1f} -> {current['p95_ms']:9.1f} ms ({p95_change:+6.1f}%)  "
+              f"errors {previous['error_rate']:.2%} -> {current['error_rate']:.2%}", file=sys.stderr)
+        if p95_change > max_regression or error_change > 0.01:
+            regressions.append(route)
+    return regressions
+
+def admin_headers(tenant):
+    """
+    Promotes a seeded user to administrator, for the metrics report, and returns their headers.
+    """
+    from app.models.user import User
+    User.objects(email='load0@example.com').update(set__is_admin='true')
+    return tenant.headers
+
+def boot_app(args):
+    """
+    Configures the environment, installs the stub model if requested and serves create_app().
+    """
+    os.environ.setdefault('SECRET_KEY', 'load-test')
+    os.environ.setdefault('JWT_SECRET_KEY', 'load-test')
+    os.environ['FLASK_ENV'] = 'production'  # No debug console logging
+    os.environ.setdefault('LOG_FILE', os.path.join(tempfile.mkdtemp(prefix='pikieye-load-'), 'app.log'))
+    os.environ.setdefault('WARMUP_ENABLED', 'false')
+    os.environ.setdefault('INDEX_SNAPSHOTS_ENABLED', 'false')
+    if args.mongodb_uri:
+        os.environ['MONGODB_URI'] = args.mongodb_uri
+    else:
+        os.environ['MONGODB_URI'] = 'mongodb://localhost:27017/pikieye_loadtest'
+        os.environ['MONGODB_MOCK'] = 'true'
+
+    if args.model == 'stub':
+        from benchmarks import stub_model
+        stub_model.install(args.stub_detection_ms / 1000, args.stub_recognition_ms / 1000)
+
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=20, help='Requests per second.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of traffic.')
+    parser.add_argument('--concurrency', type=int, default=32, help='Client threads.')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Weighted operations (default: {DEFAULT_MIX}).')
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--images-per-project', type=int, default=50)
+    parser.add_argument('--model', choices=('stub', 'real'), default='stub')
+    parser.add_argument('--stub-detection-ms', type=float, default=20)
+    parser.add_argument('--stub-recognition-ms', type=float, default=5)
+    parser.add_argument('--mongodb-uri', help='Use this MongoDB server instead of mongomock.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--compare', help='Baseline report to compare against.')
+    parser.add_argument('--max-regression', type=float, default=20, help='Allowed p95 growth in percent.')
+    args = parser.parse_args()
+
+    import requests
+
+    server, base_url = boot_app(args)
+    try:
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        tenants = seed(requests.Session(), base_url, args.users, args.images_per_project, rng)
+        seed_seconds = time.perf_counter() - started
+
+        samples, wall_seconds = run_load(base_url, tenants, parse_mix(args.mix), args.rate, args.duration,
+                                         args.concurrency, args.seed)
+        metrics = requests.get(f'{base_url}/api/metrics', headers=admin_headers(tenants[0])).json()
+    finally:
+        server.shutdown()
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'seed_seconds': round(seed_seconds, 3),
+        'wall_seconds': round(wall_seconds, 3),
+        **summarize(samples, wall_seconds),
+        'server_metrics': metrics
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
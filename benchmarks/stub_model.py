@@ -0,0 +1,86 @@
+# benchmarks/stub_model.py
+"""
+Deterministic stand-in for InsightFace's FaceAnalysis, for load tests.
+
+Images made by synthetic_image carry their identity and face count in the
+first pixels; the stub "detects" that many faces and returns embeddings
+derived from the identity, so uploads cluster and searches match as they
+would with the real model. Optional sleeps approximate model latency.
+"""
+
+import time
+import numpy as np
+
+DIMS = 512
+FACE_SIZE = 120
+
+def synthetic_image(identity, faces=1, seed=0, size=(480, 640)):
+    """
+    Returns a noisy BGR image encoding the identity (0-255) and face count (1-3).
+    """
+    rng = np.random.default_rng((identity, faces, seed))
+    img = rng.integers(0, 256, size=(*size, 3), dtype=np.uint8)
+    img[0, 0] = identity
+    img[0, 1] = faces
+    return img
+
+def _identity_vector(identity, face_index):
+    rng = np.random.default_rng((identity, face_index))
+    return rng.normal(size=DIMS).astype(np.float32)
+
+class _StubDetector:
+    taskname = 'detection'
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def detect(self, img, max_num=0, metric='default'):
+        if self.latency:
+            time.sleep(self.latency)
+        faces = int(img[0, 1, 0]) if img.shape[0] > FACE_SIZE and 1 <= img[0, 1, 0] <= 3 else 0
+        bboxes = np.zeros((faces, 5), dtype=np.float32)
+        kpss = np.zeros((faces, 5, 2), dtype=np.float32)
+        for i in range(faces):
+            x1, y1 = 20 + i * (FACE_SIZE + 20), 40
+            bboxes[i] = [x1, y1, x1 + FACE_SIZE, y1 + FACE_SIZE, 0.9]
+            kpss[i] = np.array([[0.3, 0.4], [0.7, 0.4], [0.5, 0.6], [0.35, 0.8], [0.65, 0.8]]) * FACE_SIZE + [x1, y1]
+        return bboxes, kpss
+
+class _StubRecognizer:
+    taskname = 'recognition'
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get(self, img, face):
+        if self.latency:
+            time.sleep(self.latency)
+        identity = int(img[0, 0, 0])
+        face_index = int(round((face.bbox[0] - 20) / (FACE_SIZE + 20)))
+        noise = np.random.default_rng(int(img[1:9, 1:9].sum())).normal(scale=0.05, size=DIMS)
+        face.embedding = _identity_vector(identity, face_index) + noise.astype(np.float32)
+        return face.embedding
+
+class StubFaceAnalysis:
+    """
+    Matches the parts of insightface.app.FaceAnalysis the application uses.
+    """
+    def __init__(self, *args, detection_latency=0.0, recognition_latency=0.0, **kwargs):
+        self.det_model = _StubDetector(detection_latency)
+        self.models = {'detection': self.det_model, 'recognition': _StubRecognizer(recognition_latency)}
+
+    def prepare(self, ctx_id=0, det_size=(640, 640)):
+        pass
+
+def install(detection_latency=0.0, recognition_latency=0.0):
+    """
+    Makes `from insightface.app import FaceAnalysis` return the stub. Must run
+    before the application's routes are imported.
+    """
+    import insightface.app
+
+    class ConfiguredStub(StubFaceAnalysis):
+        def __init__(self, *args, **kwargs):
+            super().__init__(detection_latency=detection_latency, recognition_latency=recognition_latency)
+
+    insightface.app.FaceAnalysis = ConfiguredStub
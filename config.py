@@ -60,9 +60,146 @@ class Config:
     # Maximum allowed payload to prevent DOS attacks (e.g., 64 MB)
     MAX_CONTENT_LENGTH = 64 * 1024 * 1024
 
+    # Use an in-memory mongomock database instead of MONGODB_URI's server (requires mongomock)
+    MONGODB_MOCK = os.getenv('MONGODB_MOCK', 'false').lower() == 'true'
+
+    # MongoDB connection pool, shared by request threads and the ingest/jobs pools
+    MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', 100))
+    MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', 0))
+    MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 0)) or None
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 0)) or None
+
+    # Query plan audit: explain known query shapes at startup and write a report
+    DB_AUDIT_ON_STARTUP = os.getenv('DB_AUDIT_ON_STARTUP', 'false').lower() == 'true'
+    DB_AUDIT_REPORT_PATH = os.getenv('DB_AUDIT_REPORT_PATH', 'logs/db_audit.json')
+
     # CORS settings
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:5173').split(',')
 
+    # Logging: records are queued and written by a background thread ('text' or 'json' format)
+    LOG_FILE = os.getenv('LOG_FILE', 'logs/app.log')
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 10))
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # Records beyond this are dropped
+    # Keep one in N DEBUG records of each event for these loggers
+    LOG_SAMPLE_RATES = {'app.utils.ml_model': 100}
+
+    # Streaming uploads bypass MAX_CONTENT_LENGTH; memory stays bounded by the chunk size
+    STREAM_UPLOAD_MAX_CONTENT_LENGTH = int(os.getenv('STREAM_UPLOAD_MAX_CONTENT_LENGTH', 2 * 1024 * 1024 * 1024))
+    STREAM_UPLOAD_MAX_FILE_SIZE = int(os.getenv('STREAM_UPLOAD_MAX_FILE_SIZE', 64 * 1024 * 1024))
+    STREAM_UPLOAD_CHUNK_SIZE = 255 * 1024  # Matches the default GridFS chunk size
+
+    # Worker threads for background face extraction and long-running jobs. Extraction for
+    # interactive uploads runs on its own INTERACTIVE pool, so it never queues behind archive imports
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 2))
+    INTERACTIVE_WORKERS = int(os.getenv('INTERACTIVE_WORKERS', 2))
+    JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', 2))
+    # Jobs are shared by all worker processes through MongoDB; an active job silent for this
+    # many seconds is treated as abandoned by a worker that died
+    JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 900))
+
+    # Images from an archive are deduplicated and stored in batches of this size
+    ARCHIVE_IMPORT_BATCH_SIZE = int(os.getenv('ARCHIVE_IMPORT_BATCH_SIZE', 32))
+
+    # Re-clustering: memory per block of similarities and cap on k-NN edges per face, which
+    # bounds the graph to faces * RECLUSTER_MAX_NEIGHBORS edges (0 keeps every edge, exact DBSCAN)
+    RECLUSTER_BLOCK_BYTES = int(os.getenv('RECLUSTER_BLOCK_BYTES', 256 * 1024 * 1024))
+    RECLUSTER_MAX_NEIGHBORS = int(os.getenv('RECLUSTER_MAX_NEIGHBORS', 50)) or None
+
+    # Resumable uploads expire after this many seconds without activity
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 3600))
+
+    # Reuse face records extracted from identical images uploaded to other projects
+    EXTRACTION_REUSE_ENABLED = os.getenv('EXTRACTION_REUSE_ENABLED', 'true').lower() == 'true'
+
+    # Storage garbage collection (GC_INTERVAL_SECONDS=0 disables the periodic sweep)
+    GC_INTERVAL_SECONDS = int(os.getenv('GC_INTERVAL_SECONDS', 0))
+    GC_DRY_RUN = os.getenv('GC_DRY_RUN', 'false').lower() == 'true'
+    GC_BATCH_SIZE = int(os.getenv('GC_BATCH_SIZE', 500))
+    GC_PAUSE_SECONDS = float(os.getenv('GC_PAUSE_SECONDS', 0.1))
+
+    # Video ingest: keyframe sampling (seconds) and scene-change sensitivity (mean pixel difference)
+    VIDEO_PROBE_INTERVAL = 0.2
+    VIDEO_MIN_KEYFRAME_INTERVAL = 0.5
+    VIDEO_MAX_KEYFRAME_INTERVAL = 5.0
+    VIDEO_SCENE_CHANGE_THRESHOLD = 10.0
+
+    # Admission control for CPU-heavy inference routes (per process)
+    INFERENCE_SLOTS = int(os.getenv('INFERENCE_SLOTS', 2))
+    INFERENCE_SLOTS_PER_USER = int(os.getenv('INFERENCE_SLOTS_PER_USER', 1))
+    INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', 16))
+    INFERENCE_QUEUE_TIMEOUT = float(os.getenv('INFERENCE_QUEUE_TIMEOUT', 10))
+    # Concurrent model calls per process across every ingest path, including background jobs
+    MODEL_CONCURRENCY = int(os.getenv('MODEL_CONCURRENCY', 4))
+
+    # Page sizes for paginated listings
+    PAGE_SIZE_DEFAULT = 100
+    PAGE_SIZE_MAX = 1000
+    FACE_PAGE_SIZE_DEFAULT = 1000
+    FACE_PAGE_SIZE_MAX = 10000
+
+    # Ingest quality gate: 'annotate' only scores faces, 'flag' keeps failing faces as non-searchable
+    # and 'drop' (opt-in) discards them
+    FACE_QUALITY_ENABLED = os.getenv('FACE_QUALITY_ENABLED', 'true').lower() == 'true'
+    FACE_QUALITY_MODE = os.getenv('FACE_QUALITY_MODE', 'annotate')
+    FACE_QUALITY_MIN_DET_SCORE = float(os.getenv('FACE_QUALITY_MIN_DET_SCORE', 0.5))
+    FACE_QUALITY_MIN_EYE_DISTANCE = float(os.getenv('FACE_QUALITY_MIN_EYE_DISTANCE', 10))  # pixels
+    FACE_QUALITY_MIN_SHARPNESS = float(os.getenv('FACE_QUALITY_MIN_SHARPNESS', 30))  # Laplacian variance
+    FACE_QUALITY_MAX_YAW = float(os.getenv('FACE_QUALITY_MAX_YAW', 60))  # degrees
+
+    # Opt-in tiled detection: large images whose downscaled pass finds no faces, or faces
+    # smaller than TILED_DETECTION_SMALL_FACE pixels at detector scale, are also scanned in
+    # overlapping native-resolution tiles on DETECTION_WORKERS threads
+    TILED_DETECTION_ENABLED = os.getenv('TILED_DETECTION_ENABLED', 'false').lower() == 'true'
+    TILED_DETECTION_MIN_SIDE = int(os.getenv('TILED_DETECTION_MIN_SIDE', 2000))
+    TILED_DETECTION_SMALL_FACE = int(os.getenv('TILED_DETECTION_SMALL_FACE', 24))
+    TILED_DETECTION_TILE_SIZE = int(os.getenv('TILED_DETECTION_TILE_SIZE', 1280))
+    TILED_DETECTION_OVERLAP = int(os.getenv('TILED_DETECTION_OVERLAP', 192))
+    TILED_DETECTION_NMS_THRESHOLD = float(os.getenv('TILED_DETECTION_NMS_THRESHOLD', 0.4))
+    DETECTION_WORKERS = int(os.getenv('DETECTION_WORKERS', 4))
+
+    # In-memory search index: 'float32' (exact), 'float16', 'int8', 'pca' or 'pq'; compressed modes
+    # score coarsely and rerank candidates within EMBEDDING_RERANK_MARGIN of the tolerance exactly
+    EMBEDDING_INDEX_MODE = os.getenv('EMBEDDING_INDEX_MODE', 'float32')
+    EMBEDDING_RERANK_MARGIN = float(os.getenv('EMBEDDING_RERANK_MARGIN', 0.1))
+    EMBEDDING_PCA_DIMS = int(os.getenv('EMBEDDING_PCA_DIMS', 128))
+    EMBEDDING_PQ_SUBSPACES = int(os.getenv('EMBEDDING_PQ_SUBSPACES', 64))  # bytes per face
+    EMBEDDING_INDEX_CACHE_SIZE = int(os.getenv('EMBEDDING_INDEX_CACHE_SIZE', 32))  # projects per worker
+    EMBEDDING_INDEX_TTL = int(os.getenv('EMBEDDING_INDEX_TTL', 3600))
+
+    # Similarity kernels: 'auto' benchmarks numpy and simsimd at startup and picks the fastest
+    # accurate one per storage dtype; 'numpy' or 'simsimd' forces one library
+    SIMILARITY_BACKEND = os.getenv('SIMILARITY_BACKEND', 'auto')
+    SIMILARITY_BENCH_ROWS = int(os.getenv('SIMILARITY_BENCH_ROWS', 20000))
+    # Kernels whose benchmark scores deviate more than this from float64 are never auto-selected
+    SIMILARITY_MAX_ERROR = float(os.getenv('SIMILARITY_MAX_ERROR', 0.02))
+
+    # Search result cache per worker, keyed by project version, query image hash and tolerance
+    SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+    SEARCH_CACHE_ENTRIES = int(os.getenv('SEARCH_CACHE_ENTRIES', 1000))
+    SEARCH_CACHE_BYTES = int(os.getenv('SEARCH_CACHE_BYTES', 64 * 1024 * 1024))
+
+    # Unique faces sprite sheets: SPRITE_COLUMNS x SPRITE_ROWS crops of SPRITE_CROP_SIZE pixels per sheet
+    SPRITE_CROP_SIZE = int(os.getenv('SPRITE_CROP_SIZE', 96))
+    SPRITE_COLUMNS = int(os.getenv('SPRITE_COLUMNS', 20))
+    SPRITE_ROWS = int(os.getenv('SPRITE_ROWS', 20))
+    SPRITE_JPEG_QUALITY = int(os.getenv('SPRITE_JPEG_QUALITY', 85))
+    SPRITE_CROP_CACHE_SIZE = int(os.getenv('SPRITE_CROP_CACHE_SIZE', 2000))  # ~27 KB each at 96 px
+    SPRITE_SHEET_CACHE_SIZE = int(os.getenv('SPRITE_SHEET_CACHE_SIZE', 16))  # projects
+    SPRITE_CACHE_TTL = int(os.getenv('SPRITE_CACHE_TTL', 3600))
+    SPRITE_URL_TTL = int(os.getenv('SPRITE_URL_TTL', 3600))  # Lifetime window of signed sheet URLs
+
+    # On-disk index snapshots (default: <instance path>/index_snapshots), written by SNAPSHOTS_WORKERS threads
+    INDEX_SNAPSHOTS_ENABLED = os.getenv('INDEX_SNAPSHOTS_ENABLED', 'true').lower() == 'true'
+    INDEX_SNAPSHOT_DIR = os.getenv('INDEX_SNAPSHOT_DIR')
+    SNAPSHOTS_WORKERS = int(os.getenv('SNAPSHOTS_WORKERS', 1))
+
+    # Warm-up at startup: dummy inference, then preload the most recently searched projects
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_PROJECTS = int(os.getenv('WARMUP_PROJECTS', 10))
+
 class DevelopmentConfig(Config):
     """
     Development configuration with debug mode enabled.